@@ -0,0 +1,109 @@
+"""
+Multi-threaded booking stress test against a live database.
+
+Run from the project root (uses DB_CONFIG from main_app):
+    python -m benchmarks.booking_stress
+
+Every simulated clerk gets its own SeatInventory, just like separate
+counter terminals, so all of them race for the same low seat numbers and
+only the seat_claims partition key keeps them apart. A temporary train is
+created for each concurrency level and removed afterwards.
+
+Failed bookings are counted by exception type. The class has a seat for
+every attempt, so the run exits with status 1 if any booking failed or
+came back full while seats were left, or if a seat was sold twice.
+"""
+import datetime
+import sys
+import threading
+import time
+from collections import Counter
+
+import main_app
+from main_app import SeatInventory, book_seat, db_execute, db_transaction
+
+CONCURRENCY_LEVELS = (1, 2, 5, 10, 20)
+BOOKINGS_PER_CLERK = 25
+
+def create_stress_train(total_seats):
+    with db_transaction() as cursor:
+        cursor.execute("INSERT INTO trains (train_name, train_type, total_seats) VALUES (%s, %s, %s)",
+                       ("Stress Test Train", "Test", total_seats))
+        return cursor.lastrowid
+
+def drop_stress_train(train_id):
+    with db_transaction() as cursor:
+        cursor.execute("DELETE FROM seat_claims WHERE train_id=%s", (train_id,))
+        cursor.execute("DELETE FROM waitlist WHERE train_id=%s", (train_id,))
+        cursor.execute("DELETE FROM waitlist_queues WHERE train_id=%s", (train_id,))
+        main_app.add_to_rollups(cursor, "tk.train_id=%s", (train_id,), sign=-1)
+        for table in ("daily_train_stats", "monthly_train_stats"):
+            cursor.execute(f"DELETE FROM {table} WHERE train_id=%s", (train_id,))
+        cursor.execute("DELETE FROM tickets WHERE train_id=%s", (train_id,))
+        cursor.execute("DELETE FROM trains WHERE train_id=%s", (train_id,))
+
+def run_level(clerks, passenger_id, station_ids):
+    total = clerks * BOOKINGS_PER_CLERK
+    train_id = create_stress_train(2 * total)  # The Sleeper class gets half the seats (main_app.CLASS_SEATS)
+    main_app.reference_cache.invalidate(stations=False)
+    booked, errors, full = [], Counter(), []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(clerks)
+
+    def clerk(n):
+        inventory = SeatInventory()
+        start_gate.wait()
+        for i in range(BOOKINGS_PER_CLERK):
+            try:
+                result = book_seat(train_id, passenger_id, station_ids[0], station_ids[1], "Sleeper",
+                                   f"Clerk {n} Passenger {i}", 30, "Other", inventory=inventory)
+            except Exception as err:  # record and keep going, the summary reports it
+                with lock:
+                    errors[f"{type(err).__name__}: {err}"] += 1
+                continue
+            with lock:
+                if result:
+                    booked.append(result[1])
+                else:
+                    full.append(i)
+
+    threads = [threading.Thread(target=clerk, args=(n,)) for n in range(clerks)]
+    started = time.perf_counter()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.perf_counter() - started
+
+    duplicates = db_execute(
+        """SELECT seat_number, COUNT(*) FROM tickets WHERE train_id=%s AND status='Confirmed'
+           GROUP BY seat_number HAVING COUNT(*) > 1""", (train_id,), fetch='all')
+    free = SeatInventory().available(train_id, datetime.date.today(), "Sleeper")
+    drop_stress_train(train_id)
+    return len(booked), errors, len(full), free, len(duplicates or []), elapsed
+
+def main():
+    main_app.DB_POOL_SIZE = max(CONCURRENCY_LEVELS)
+    passenger = db_execute("SELECT user_id FROM users ORDER BY user_id LIMIT 1", fetch='one')
+    stations = db_execute("SELECT station_id FROM stations ORDER BY station_id LIMIT 2", fetch='all')
+    if not passenger or not stations or len(stations) < 2:
+        print("Database must contain at least one user and two stations.")
+        return 1
+
+    print(f"{'clerks':>6} {'booked':>7} {'errors':>7} {'full':>5} {'free left':>10} {'dup seats':>10} {'bookings/s':>11}")
+    failed = False
+    for clerks in CONCURRENCY_LEVELS:
+        booked, errors, full, free, duplicates, elapsed = run_level(clerks, passenger[0], [s[0] for s in stations])
+        print(f"{clerks:>6} {booked:>7} {sum(errors.values()):>7} {full:>5} {free:>10} {duplicates:>10} "
+              f"{booked / elapsed:>11.1f}")
+        for error, count in errors.most_common():
+            print(f"  {count:>5} x {error}")
+        if duplicates:
+            print("  !! duplicate seat allocations detected")
+        if (errors or full) and free:
+            print(f"  !! {sum(errors.values()) + full} bookings failed with {free} seats still free")
+        failed = failed or bool(duplicates) or bool((errors or full) and free)
+
+    main_app.get_db_pool().close_all()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
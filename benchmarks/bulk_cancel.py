@@ -0,0 +1,110 @@
+"""
+Cancellation throughput: one PNR at a time against bulk_cancel().
+
+Run from the project root (uses DB_CONFIG from main_app, or the embedded
+database with RAILWAY_DB_BACKEND=sqlite):
+    python -m benchmarks.bulk_cancel [--tickets 100000] [--sample 2000] [--batch-size 500]
+
+Books --tickets confirmed tickets, one per PNR, on a temporary train for
+tomorrow, plus a few waitlisted ones, all with bulk inserts. The first
+--sample PNRs are cancelled one by one with cancel_booking() (one
+conditional UPDATE each); then the whole service is withdrawn with
+bulk_cancel(), writing its manifest to a temporary CSV file. Prints the
+tickets/s of both and checks that no ticket, seat claim or queue entry
+is left live and that the rollups still match a rebuild (--skip-check
+leaves that out). The train is removed afterwards.
+"""
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import main_app
+from main_app import db_execute, db_transaction
+from benchmarks.booking_stress import create_stress_train, drop_stress_train
+from benchmarks.rollups import check_consistency
+
+WAITLISTED = 200  # Waitlisted tickets booked on top of the confirmed ones
+
+def book_tickets(train_id, journey_date, count, passenger_id, stations):
+    """Bulk-inserts 'count' confirmed Sleeper tickets with their seat claims and rollups. Returns their PNRs."""
+    today = datetime.date.today()
+    pnrs = [f"BC{train_id % 100:02d}{i:07d}" for i in range(count)]
+    main_app.bulk_insert(
+        """INSERT INTO tickets (pnr, train_id, passenger_id, from_station, to_station, seat_number, class_type,
+                                booking_date, journey_date, status, passenger_name, passenger_age, passenger_gender)
+           VALUES (%s, %s, %s, %s, %s, %s, 'Sleeper', %s, %s, 'Confirmed', %s, 30, 'Other')""",
+        ((pnr, train_id, passenger_id, stations[0], stations[1], main_app.format_seat_number(i + 1, "S"),
+          today, journey_date, f"Passenger {i}") for i, pnr in enumerate(pnrs)))
+    with db_transaction() as cursor:
+        cursor.execute("""INSERT INTO seat_claims (journey_date, train_id, class_type, seat_number, ticket_id)
+                          SELECT journey_date, train_id, class_type, seat_number, ticket_id FROM tickets WHERE train_id=%s""",
+                       (train_id,))
+        cursor.execute(main_app.BACKFILL_TICKET_FARES + " AND train_id=%s", (train_id,))
+        main_app.add_to_rollups(cursor, "tk.train_id=%s", (train_id,))
+    return pnrs
+
+def live_rows(train_id):
+    return tuple(db_execute(query, (train_id,), fetch='one')[0] for query in (
+        "SELECT COUNT(*) FROM tickets WHERE train_id=%s AND status<>'Cancelled'",
+        "SELECT COUNT(*) FROM seat_claims WHERE train_id=%s",
+        "SELECT COALESCE(SUM(queued), 0) FROM waitlist_queues WHERE train_id=%s"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk cancellation throughput benchmark")
+    parser.add_argument("--tickets", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=2000, help="PNRs cancelled one at a time first")
+    parser.add_argument("--batch-size", type=int, default=main_app.CANCEL_BATCH_ROWS)
+    parser.add_argument("--skip-check", action="store_true", help="do not compare the rollups with a rebuild")
+    args = parser.parse_args()
+
+    passenger = db_execute("SELECT user_id FROM users ORDER BY user_id LIMIT 1", fetch='one')
+    stations = db_execute("SELECT station_id FROM stations ORDER BY station_id LIMIT 2", fetch='all')
+    if not passenger or not stations or len(stations) < 2:
+        raise SystemExit("Database must contain at least one user and two stations.")
+    stations = [s[0] for s in stations]
+    journey_date = datetime.date.today() + datetime.timedelta(days=1)
+
+    train_id = create_stress_train(2 * args.tickets)  # The Sleeper class gets half the seats (main_app.CLASS_SEATS)
+    main_app.reference_cache.invalidate(stations=False)
+    try:
+        started = time.perf_counter()
+        pnrs = book_tickets(train_id, journey_date, args.tickets, passenger[0], stations)
+        for i in range(WAITLISTED):
+            main_app.book_seat(train_id, passenger[0], stations[0], stations[1], "Sleeper", f"Waitlisted {i}", 30,
+                               "Other", journey_date, waitlist=True)
+        print(f"Booked {args.tickets} tickets and {WAITLISTED} waitlisted in {time.perf_counter() - started:.1f}s")
+
+        started = time.perf_counter()
+        single = sum(len(main_app.cancel_booking(pnr, journey_date) or ()) for pnr in pnrs[:args.sample])
+        single_rate = single / (time.perf_counter() - started)
+        promoted = db_execute("SELECT COUNT(*) FROM waitlist WHERE train_id=%s AND promoted_at IS NOT NULL",
+                              (train_id,), fetch='one')[0]
+        print(f"One PNR at a time: {single} tickets, {single_rate:>9.0f} tickets/s "
+              f"({promoted} freed seats went to waitlisted passengers)")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            manifest = os.path.join(tmp, "manifest.csv")
+            summary = main_app.bulk_cancel(train_id, journey_date, manifest_path=manifest, batch_size=args.batch_size)
+            with open(manifest, encoding="utf-8") as f:
+                manifest_rows = sum(1 for _ in f) - 1
+        print(f"bulk_cancel():     {summary['cancelled']} tickets, {summary['tickets_per_sec']:>9.0f} tickets/s "
+              f"in {summary['elapsed']:.2f}s; {summary['seats_released']} seats released, "
+              f"refunds {summary['refund_total']:.2f}, manifest {manifest_rows} rows")
+        print(f"Speedup: {summary['tickets_per_sec'] / single_rate:.1f}x")
+
+        live = live_rows(train_id)
+        print("Nothing left live." if live == (0, 0, 0) else
+              f"WARNING: live tickets, seat claims, queued places left: {live}")
+        free = main_app.seat_inventory.available(train_id, journey_date, "Sleeper")
+        print(f"Inventory: {free} of {main_app.class_capacity(train_id, 'Sleeper')} Sleeper seats free")
+        if not args.skip_check:
+            print("Incremental rollups match the rebuild." if check_consistency()
+                  else "WARNING: incremental rollups differed from the rebuild (now rebuilt).")
+    finally:
+        drop_stress_train(train_id)
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
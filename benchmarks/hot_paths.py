@@ -0,0 +1,157 @@
+"""
+Latency benchmark for the core hot paths against a live database.
+
+Run from the project root (uses DB_CONFIG from main_app), ideally after
+loading data with benchmarks.synthetic_data:
+    python -m benchmarks.hot_paths [--iterations 200] [--output results.json]
+    python -m benchmarks.hot_paths --compare benchmarks/results/<earlier>.json
+Set RAILWAY_DB_BACKEND=sqlite (and optionally RAILWAY_SQLITE_PATH) to run
+against the embedded database instead of a MySQL server.
+
+Times route search and seat lookup (cold and warm) on journey dates up to
+JOURNEY_DAYS ahead, report and bookings pages, journey planning, and
+booking plus cancellation. Prints p50/p95/p99 per operation and saves them
+as JSON (by default under benchmarks/results/) so runs can be compared.
+--skip-writes leaves out the booking operations.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import time
+
+import main_app
+from main_app import db_execute
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+JOURNEY_DAYS = 30  # Searches and seat lookups pick a journey date this many days ahead at most
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": percentile(samples, 50),
+        "p95_ms": percentile(samples, 95),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": max(samples),
+    }
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (time.perf_counter() - started) * 1000, result
+
+def table_counts():
+    return {table: db_execute(f"SELECT COUNT(*) FROM {table}", fetch='one')[0]
+            for table in ("stations", "trains", "train_schedule", "tickets", "users")}
+
+def run(iterations, rng, skip_writes):
+    pairs = db_execute("SELECT from_station, to_station FROM train_od_index LIMIT 20000", fetch='all') or []
+    trains = [r[0] for r in db_execute("SELECT train_id FROM trains WHERE total_seats > 0", fetch='all') or []]
+    passengers = [r[0] for r in db_execute("SELECT user_id FROM users LIMIT 20000", fetch='all') or []]
+    anchors = db_execute(f"""SELECT booking_date, ticket_id FROM tickets
+                             ORDER BY ticket_id DESC LIMIT {max(iterations, 1)}""", fetch='all') or []
+    if not pairs or not trains or not passengers:
+        raise SystemExit("Database needs schedules, trains and users; load benchmarks.synthetic_data first.")
+    main_app.reference_cache.reload()
+    page = main_app.GRID_PAGE_SIZE
+    today = datetime.date.today()
+    since = today - datetime.timedelta(days=30)
+    samples = {}
+
+    def record(name, ms):
+        samples.setdefault(name, []).append(ms)
+
+    for i in range(iterations):
+        a, b = rng.choice(pairs)
+        journey_date = today + datetime.timedelta(days=rng.randrange(JOURNEY_DAYS))
+        record("search_trains_between_stations", timed(main_app.search_trains_between_stations, a, b)[0])
+        record("search_with_availability", timed(main_app.search_with_availability, a, b, journey_date)[0])
+
+        train_id = rng.choice(trains)
+        main_app.seat_inventory.invalidate(train_id)
+        record("next_seat_cold", timed(main_app.get_next_available_seat, train_id, journey_date)[0])
+        record("next_seat_warm", timed(main_app.get_next_available_seat, train_id, journey_date)[0])
+
+        record("report_first_page", timed(main_app.fetch_ticket_view, limit=page)[0])
+        record("report_filtered_page", timed(main_app.fetch_ticket_view, status="Confirmed",
+                                             date_from=since, limit=page)[0])
+        if anchors:
+            cursor = tuple(rng.choice(anchors))
+            record("report_deep_page", timed(main_app.fetch_ticket_view, cursor=cursor, limit=page)[0])
+        record("my_bookings_page", timed(main_app.fetch_ticket_view, passenger_id=rng.choice(passengers), limit=page)[0])
+
+    # Journey planning, after a one-off timetable load
+    main_app.journey_planner.invalidate()
+    ms, _ = timed(main_app.journey_planner.plan, *pairs[0])
+    samples["journey_planner_load"] = [ms]
+    for _ in range(iterations):
+        a, b = rng.choice(pairs)
+        record("plan_journeys", timed(main_app.plan_journeys, a, b, rng.randint(0, 24 * 60 - 1))[0])
+
+    if not skip_writes:
+        passenger = passengers[0]
+        for _ in range(iterations):
+            train_id = rng.choice(trains)
+            a, b = rng.choice(pairs)
+            ms, booking = timed(main_app.book_seat, train_id, passenger, a, b, "Sleeper", "Benchmark", 30, "Other")
+            record("book_seat", ms)
+            if booking:
+                record("cancel_booking", timed(main_app.cancel_booking, booking[0])[0])
+    return samples
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print(f"\nChange against {baseline_path}:")
+    print(f"{'operation':<32} {'p50 before':>11} {'p50 now':>9} {'p95 before':>11} {'p95 now':>9}")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if before:
+            print(f"{name:<32} {before['p50_ms']:>11.2f} {now['p50_ms']:>9.2f} {before['p95_ms']:>11.2f} {now['p95_ms']:>9.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot path latency benchmark")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--skip-writes", action="store_true", help="do not book and cancel tickets")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/hot_paths-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    started = datetime.datetime.now()
+    samples = run(args.iterations, random.Random(args.seed), args.skip_writes)
+    results = {name: summarize(values) for name, values in samples.items()}
+
+    print(f"{'operation':<32} {'count':>6} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, r in results.items():
+        print(f"{name:<32} {r['count']:>6} {r['mean_ms']:>8.2f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"hot_paths-{started:%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({
+            "started": started.isoformat(timespec="seconds"),
+            "iterations": args.iterations,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "tables": table_counts(),
+            "results": results,
+        }, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
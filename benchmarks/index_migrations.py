@@ -0,0 +1,85 @@
+"""
+Before/after benchmark for the index migrations in main_app's SCHEMA MIGRATIONS.
+
+Run from the project root (uses DB_CONFIG from main_app, or the embedded
+database with RAILWAY_DB_BACKEND=sqlite), after loading data with
+benchmarks.synthetic_data:
+    python -m benchmarks.index_migrations [--iterations 200] [--baseline 0]
+
+Migrates the schema down to --baseline, times every QUERY_PLAN_CHECKS
+query with random existing ids and records its plan, migrates up to the
+latest version and repeats. Prints the index each query used and the
+p50/p95 latency before and after; queries the baseline schema cannot run
+show 'n/a' (everything reading journey dates needs version 4, so use
+--baseline 3 or later for those). The schema is left at the latest version.
+"""
+import argparse
+import random
+import time
+
+import main_app
+from benchmarks.hot_paths import percentile
+
+def measure(iterations, rng):
+    """
+    Times each check query over 'iterations' random samples. Returns
+    {name: (samples_ms, indexes)}; samples_ms is empty for a query the schema cannot run.
+    """
+    samples = [main_app.query_plan_sample(rng) for _ in range(iterations)]
+    results = {name: ([], None) for name, _, _ in main_app.QUERY_PLAN_CHECKS}
+    for plan in main_app.check_query_plans(samples[0]):
+        results[plan["name"]] = ([], plan["indexes"])
+    with main_app.get_db_pool().connection() as conn:
+        with conn.cursor(buffered=True) as cursor:
+            for name, _, build in main_app.QUERY_PLAN_CHECKS:
+                for sample in samples:
+                    query, params = build(sample)
+                    started = time.perf_counter()
+                    try:
+                        cursor.execute(query, params)
+                    except main_app.DB_ERRORS:
+                        break
+                    cursor.fetchall()
+                    results[name][0].append((time.perf_counter() - started) * 1000)
+    return results
+
+def p50_p95(samples):
+    return (f"{percentile(samples, 50):.3f}", f"{percentile(samples, 95):.3f}") if samples else ("n/a", "n/a")
+
+def migrate(version):
+    with main_app.get_db_pool().connection() as conn:
+        main_app.migrate_schema(conn, version, progress=lambda message: print(f"  {message}"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Index migration before/after benchmark")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", type=int, default=0, help="schema version to measure 'before' at")
+    args = parser.parse_args()
+
+    if main_app.query_plan_sample() is None:
+        raise SystemExit("Database needs tickets and fares; load benchmarks.synthetic_data first.")
+    counts = {t: main_app.db_execute(f"SELECT COUNT(*) FROM {t}", fetch='one')[0]
+              for t in ("tickets", "train_schedule", "fare_master")}
+    print("Rows: " + ", ".join(f"{t}={n}" for t, n in counts.items()))
+
+    print(f"Schema version {args.baseline}:")
+    migrate(args.baseline)
+    before = measure(args.iterations, random.Random(args.seed))
+    print(f"Schema version {main_app.SCHEMA_VERSION}:")
+    migrate(main_app.SCHEMA_VERSION)
+    after = measure(args.iterations, random.Random(args.seed))
+
+    print(f"\n{'query':<17} {'index before':<32} {'index after':<32} {'p50 before':>10} {'p50 after':>9} "
+          f"{'p95 before':>10} {'p95 after':>9} {'speedup':>8}")
+    for name, expected, _ in main_app.QUERY_PLAN_CHECKS:
+        (old, old_indexes), (new, new_indexes) = before[name], after[name]
+        (old_p50, old_p95), (new_p50, new_p95) = p50_p95(old), p50_p95(new)
+        speedup = f"{percentile(old, 50) / percentile(new, 50):.1f}x" if old and new and percentile(new, 50) else "n/a"
+        print(f"{name:<17} {', '.join(old_indexes) or 'scan':<32.32} {', '.join(new_indexes) or 'scan':<32.32} "
+              f"{old_p50:>10} {new_p50:>9} {old_p95:>10} {new_p95:>9} {speedup:>8}"
+              + ("" if expected in new_indexes else "  (expected index unused)"))
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark for the RAPTOR journey planner on a synthetic national network.
+
+Run from the project root:
+    python -m benchmarks.journey_planner [--stations 5000] [--trains 4000] [--queries 300]
+
+Trains run along random paths over geographically clustered stations, so
+most station pairs need one or two changes.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from main_app import JourneyPlanner
+
+def synthetic_timetable(stations, trains, rng):
+    """Returns (train_id, station_id, arrival, departure) rows ordered by train and sequence."""
+    rows = []
+    for train_id in range(1, trains + 1):
+        stop_count = rng.randint(8, 30)
+        station = rng.randint(1, stations)
+        clock = rng.randint(0, 24 * 60 - 1)
+        visited = set()
+        for seq in range(stop_count):
+            if station in visited:
+                break
+            visited.add(station)
+            arrival = None if seq == 0 else clock
+            dwell = 0 if seq == 0 else rng.randint(2, 10)
+            departure = None if seq == stop_count - 1 else clock + dwell
+            rows.append((train_id, station, _hhmm(arrival), _hhmm(departure)))
+            clock += dwell + rng.randint(20, 120)
+            # Next stop is a nearby station most of the time, a long hop otherwise
+            step = rng.randint(-40, 40) if rng.random() < 0.8 else rng.randint(-stations // 4, stations // 4)
+            station = (station + step - 1) % stations + 1
+    return rows
+
+def _hhmm(minutes):
+    if minutes is None:
+        return None
+    minutes %= 24 * 60
+    return f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--stations", type=int, default=5000)
+    parser.add_argument("--trains", type=int, default=4000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = synthetic_timetable(args.stations, args.trains, rng)
+    planner = JourneyPlanner()
+
+    started = time.perf_counter()
+    planner.load(rows)
+    load_ms = (time.perf_counter() - started) * 1000
+    print(f"{args.stations} stations, {args.trains} trains, {len(rows)} stops; timetable load {load_ms:.0f} ms")
+
+    served = list(planner.station_routes)
+    timings, found = [], {0: 0, 1: 0, 2: 0}
+    for _ in range(args.queries):
+        origin, destination = rng.sample(served, 2)
+        depart = rng.randint(0, 24 * 60 - 1)
+        started = time.perf_counter()
+        journeys = planner.plan(origin, destination, depart)
+        timings.append((time.perf_counter() - started) * 1000)
+        for journey in journeys:
+            found[journey["changes"]] += 1
+
+    print(f"{args.queries} queries: p50 {percentile(timings, 50):.2f} ms, p95 {percentile(timings, 95):.2f} ms, "
+          f"max {max(timings):.2f} ms, mean {statistics.mean(timings):.2f} ms")
+    print(f"itineraries found: direct {found[0]}, 1 change {found[1]}, 2 changes {found[2]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Read/write splitting check for main_app's READ REPLICAS, on two local SQLite files.
+
+Run from the project root after loading data with benchmarks.synthetic_data
+and applying the migrations (python migrate.py):
+    RAILWAY_DB_BACKEND=sqlite python -m benchmarks.replicas [--replica replica.db] [--reads 500]
+
+A background thread copies the primary (SQLITE_PATH) into --replica with
+SQLite's backup API every --interval seconds, standing in for replication.
+With reads routed across the two files it then:
+  1. times --reads PNR lookups and shows where they ran;
+  2. books a ticket and looks it up at once: the lookup runs on the primary
+     (read-your-writes) until a copy has carried the booking over;
+  3. pauses the copying for longer than --max-lag: reads fall back to the
+     primary as lagging, and return to the replica once copying resumes;
+  4. takes the replica away (file removed, connections dropped): it is
+     marked down and reads fail over to the primary.
+Prints the router counters after each step. With a MySQL primary and
+replicas, set RAILWAY_DB_REPLICAS instead and watch the same counters in
+the diagnostics window.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import main_app
+from benchmarks.hot_paths import percentile
+
+class Replicator(threading.Thread):
+    """Copies the primary database file into the replica file every 'interval' seconds while not paused."""
+
+    def __init__(self, primary_path, replica_path, interval):
+        super().__init__(daemon=True)
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.interval = interval
+        self.running = threading.Event()
+        self.stopped = threading.Event()
+        self.copies = 0
+
+    def copy(self):
+        with sqlite3.connect(self.primary_path) as source, sqlite3.connect(self.replica_path) as target:
+            source.backup(target)
+        self.copies += 1
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            if self.running.is_set():
+                try:
+                    self.copy()
+                except sqlite3.Error as err:
+                    print(f"Replication copy failed: {err}")
+
+def routed(router, func, *args):
+    """Runs func and returns (ms, 'replica' or 'primary', fallback reason or None)."""
+    before = router.get_stats()
+    started = time.perf_counter()
+    func(*args)
+    ms = (time.perf_counter() - started) * 1000
+    after = router.get_stats()
+    if after["failovers"] > before["failovers"]:
+        return ms, "primary", "down"
+    if after["replica"] > before["replica"]:
+        return ms, "replica", None
+    return ms, "primary", next((r for r in main_app.FALLBACK_REASONS if after[r] > before[r]), None)
+
+def print_stats(router, title):
+    stats = router.get_stats()
+    replicas = ", ".join(f"{r['name']} {'up' if r['up'] else 'down'} reads={r['reads']}"
+                         + (f" lag={r['lag']:.2f}s" if r["lag"] is not None else "") for r in stats["replicas"])
+    reasons = ", ".join(f"{reason}={stats[reason]}" for reason in main_app.FALLBACK_REASONS)
+    print(f"  [{title}] replica reads={stats['replica']} primary reads={stats['primary']} ({reasons}); "
+          f"failovers={stats['failovers']}; {replicas}")
+
+def wait_for(router, lookup, pnr, target, timeout, reason=None):
+    """
+    Looks up 'pnr' until a lookup runs on 'target' (for fallback 'reason', if given).
+    Returns (seconds waited or None, {reason: lookups} seen on the way).
+    """
+    started, reasons, wanted = time.monotonic(), {}, reason
+    while time.monotonic() - started < timeout:
+        _, where, reason = routed(router, lookup, pnr)
+        if where == target and wanted in (None, reason):
+            return time.monotonic() - started, reasons
+        reasons[reason] = reasons.get(reason, 0) + 1
+        time.sleep(0.05)
+    return None, reasons
+
+def main():
+    parser = argparse.ArgumentParser(description="Read replica routing check on SQLite")
+    parser.add_argument("--replica", default="replica.db", help="replica database file (overwritten)")
+    parser.add_argument("--reads", type=int, default=500)
+    parser.add_argument("--interval", type=float, default=0.5, help="seconds between copies to the replica")
+    parser.add_argument("--max-lag", type=float, default=3.0, help="REPLICA_MAX_LAG for this run")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if main_app.DB_BACKEND != "sqlite" or main_app.SQLITE_PATH == ":memory:":
+        raise SystemExit("Run with RAILWAY_DB_BACKEND=sqlite and a file database in RAILWAY_SQLITE_PATH.")
+    if main_app.pending_migrations():
+        raise SystemExit("Apply the schema migrations first: python migrate.py")
+    rng = random.Random(args.seed)
+
+    main_app.DB_REPLICAS = [args.replica]
+    main_app.REPLICA_MAX_LAG = args.max_lag
+    main_app.REPLICA_HEARTBEAT_WRITER = True  # This process is the only client, so it keeps the heartbeat going
+    replicator = Replicator(main_app.SQLITE_PATH, args.replica, args.interval)
+    replicator.copy()  # The router's heartbeat thread checks the replica as soon as it starts
+    router = main_app.get_replica_router()
+    router.write_heartbeat()
+    replicator.copy()
+    router.check_replicas()  # Reads start on the replica instead of waiting for the heartbeat thread
+    replicator.running.set()
+    replicator.start()
+    print(f"Primary {main_app.SQLITE_PATH}, replica {args.replica} copied every {args.interval}s, "
+          f"max lag {args.max_lag}s")
+
+    pnrs = [r[0] for r in main_app.db_execute("SELECT pnr FROM tickets ORDER BY ticket_id DESC LIMIT 5000",
+                                              fetch='all', primary=True) or []]
+    trip = main_app.db_execute("""SELECT t.train_id, t.from_station, t.to_station, u.user_id
+                                  FROM train_od_index AS t, trains AS tr, users AS u
+                                  WHERE tr.train_id=t.train_id AND tr.total_seats > 0 LIMIT 1""",
+                               fetch='one', primary=True)
+    if not pnrs or not trip:
+        raise SystemExit("Database needs tickets, schedules and users; load benchmarks.synthetic_data first.")
+    lookup = main_app.lookup_ticket
+
+    print(f"\n1. {args.reads} PNR lookups")
+    samples = {}
+    for _ in range(args.reads):
+        ms, where, _ = routed(router, lookup, rng.choice(pnrs))
+        samples.setdefault(where, []).append(ms)
+    for where, values in samples.items():
+        print(f"  on {where:<8} {len(values):>6} lookups, p50 {percentile(values, 50):.3f} ms, "
+              f"p95 {percentile(values, 95):.3f} ms")
+    print_stats(router, "lookups")
+
+    print("\n2. Book, then look the ticket up straight away")
+    train_id, from_id, to_id, passenger = trip
+    booking = main_app.book_seat(train_id, passenger, from_id, to_id, "Sleeper", "Replica Check", 30, "Other")
+    if not booking:
+        raise SystemExit("Could not book a test ticket.")
+    pnr = booking[0]
+    _, where, reason = routed(router, lookup, pnr)
+    print(f"  first lookup of {pnr} ran on the {where}" + (f" ({reason})" if reason else ""))
+    waited, reasons = wait_for(router, lookup, pnr, "replica", args.max_lag + 5 * args.interval)
+    print(f"  on the replica after {waited:.2f}s; before that on the primary: {reasons}" if waited is not None
+          else f"  never reached the replica: {reasons}")
+    main_app.cancel_booking(pnr)
+    print_stats(router, "read-your-writes")
+
+    print(f"\n3. Copying paused for {args.max_lag + 1:.1f}s")
+    replicator.running.clear()
+    waited, _ = wait_for(router, lookup, rng.choice(pnrs), "primary", args.max_lag + 3, "lagging")
+    print(f"  reads moved to the primary after {waited:.2f}s" if waited is not None else "  reads stayed on the replica")
+    time.sleep(max(0.0, args.max_lag + 1 - (waited or 0)))
+    _, where, reason = routed(router, lookup, rng.choice(pnrs))
+    print(f"  lookup while paused ran on the {where}" + (f" ({reason})" if reason else ""))
+    replicator.running.set()
+    waited, _ = wait_for(router, lookup, rng.choice(pnrs), "replica", args.max_lag + 5 * args.interval)
+    print(f"  back on the replica {waited:.2f}s after copying resumed" if waited is not None
+          else "  did not return to the replica")
+    print_stats(router, "lag")
+
+    print("\n4. Replica taken away")
+    replicator.running.clear()
+    replicator.stopped.set()
+    replicator.join()
+    os.remove(args.replica)
+    router.replicas[0].pool.close_all()  # Open connections would keep reading the removed file
+    results = [routed(router, lookup, rng.choice(pnrs)) for _ in range(20)]
+    print(f"  20 lookups: {sum(where == 'primary' for _, where, _ in results)} on the primary, "
+          f"{sum(where == 'replica' for _, where, _ in results)} on the replica")
+    print_stats(router, "failover")
+
+    router.close_all()
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Dashboard benchmark: booking rollups against scanning tickets.
+
+Run from the project root (uses DB_CONFIG from main_app, or the embedded
+database with RAILWAY_DB_BACKEND=sqlite), after loading data with
+benchmarks.synthetic_data:
+    python -m benchmarks.rollups [--iterations 20] [--skip-check]
+
+First checks that the incrementally maintained rollups match a rebuild
+from ticket history (the rollups are left rebuilt). Then, for booking date
+ranges of a week, a month, a year and everything, times
+main_app.booking_dashboard() against the equivalent GROUP BY over tickets
+and prints the p50/p95 of both.
+"""
+import argparse
+import datetime
+import time
+
+import main_app
+from main_app import db_execute
+from benchmarks.hot_paths import percentile
+
+RANGES = (("week", 7), ("month", 30), ("year", 365), ("all", None))
+
+SCAN_QUERIES = (
+    # The figures booking_dashboard() reads from the rollups
+    """SELECT tk.train_id, tk.class_type, COUNT(*), SUM(CASE WHEN tk.status='Cancelled' THEN 1 ELSE 0 END),
+              SUM(CASE WHEN tk.status='Confirmed' THEN COALESCE(tk.fare, 0) ELSE 0 END)
+       FROM tickets AS tk
+       WHERE tk.booking_date >= %s AND tk.booking_date <= %s
+       GROUP BY tk.train_id, tk.class_type""",
+    f"""SELECT tk.booking_date, tk.from_station, tk.to_station, COUNT(*),
+               SUM(CASE WHEN tk.status='Cancelled' THEN 1 ELSE 0 END),
+               SUM(CASE WHEN tk.status='Confirmed' THEN COALESCE(tk.fare, 0) ELSE 0 END) AS revenue
+        FROM tickets AS tk
+        WHERE tk.booking_date >= %s AND tk.booking_date <= %s
+        GROUP BY tk.booking_date, tk.from_station, tk.to_station
+        ORDER BY tk.booking_date DESC, revenue DESC LIMIT {main_app.DASHBOARD_ROUTE_ROWS}""",
+)
+
+def rollup_rows():
+    # Rows emptied by deleting tickets (see add_to_rollups(sign=-1)) are not recreated by a rebuild
+    return [db_execute(f"SELECT * FROM {table} WHERE {' OR '.join(f'{c} <> 0' for c in counters)} ORDER BY 1, 2, 3",
+                       fetch='all') for table, _, _, counters in main_app.ROLLUP_TABLES]
+
+def check_consistency():
+    """Compares the rollups with a rebuild. Returns True if they matched."""
+    before = rollup_rows()
+    started = time.perf_counter()
+    if not main_app.rebuild_rollups():
+        raise SystemExit("Could not rebuild the rollups.")
+    print(f"Rebuilt rollups in {time.perf_counter() - started:.2f}s: "
+          + ", ".join(f"{table}={len(rows)}" for (table, _, _, _), rows in zip(main_app.ROLLUP_TABLES, rollup_rows())))
+    return before == rollup_rows()
+
+def timed_ms(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return (time.perf_counter() - started) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking rollup dashboard benchmark")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--skip-check", action="store_true", help="do not compare the rollups with a rebuild")
+    args = parser.parse_args()
+
+    tickets = db_execute("SELECT COUNT(*), MIN(booking_date) FROM tickets", fetch='one')
+    if not tickets or not tickets[0]:
+        raise SystemExit("Database has no tickets; load benchmarks.synthetic_data first.")
+    print(f"Tickets: {tickets[0]}")
+    if not args.skip_check:
+        print("Incremental rollups match the rebuild." if check_consistency()
+              else "WARNING: incremental rollups differed from the rebuild (now rebuilt).")
+    main_app.reference_cache.reload()
+
+    today = datetime.date.today()
+    print(f"\n{'range':<6} {'rollup p50':>10} {'rollup p95':>10} {'scan p50':>9} {'scan p95':>9} {'speedup':>8}")
+    for name, days in RANGES:
+        start = today - datetime.timedelta(days=days) if days else tickets[1]
+        rollup = [timed_ms(main_app.booking_dashboard, start if days else None, today) for _ in range(args.iterations)]
+        scan = [sum(timed_ms(db_execute, query, (start, today), 'all') for query in SCAN_QUERIES)
+                for _ in range(args.iterations)]
+        print(f"{name:<6} {percentile(rollup, 50):>10.2f} {percentile(rollup, 95):>10.2f} "
+              f"{percentile(scan, 50):>9.2f} {percentile(scan, 95):>9.2f} "
+              f"{percentile(scan, 50) / percentile(rollup, 50):>7.1f}x")
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
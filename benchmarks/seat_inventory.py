@@ -0,0 +1,72 @@
+"""
+Microbenchmark: bitmap seat inventory vs. the old linear seat scan.
+
+Run from the project root:
+    python -m benchmarks.seat_inventory
+
+Both sides work on the same in-memory data so only the allocation
+algorithm is measured (the old path additionally paid for transferring
+every confirmed ticket from MySQL on each booking).
+"""
+import random
+import re
+import timeit
+
+from main_app import SEATS_PER_COACH, SeatBitmap, format_seat_number, parse_seat_number
+
+TRAIN_SIZES = (200, 500, 1000, 2000, 5000)
+OCCUPANCY = 0.9
+REPEAT = 5
+
+def legacy_next_available_seat(total_seats, tickets):
+    """The pre-inventory get_next_available_seat, minus the DB round trips."""
+    used_seats = set()
+    seat_pattern = re.compile(r"^S(\d+)-(\d+)$", re.IGNORECASE)
+
+    for (seat_num,) in tickets:
+        if not seat_num:
+            continue
+        match = seat_pattern.match(str(seat_num).strip())
+        if match:
+            coach = int(match.group(1))
+            seat_in_coach = int(match.group(2))
+            linear_seat = (coach - 1) * SEATS_PER_COACH + seat_in_coach
+            used_seats.add(linear_seat)
+
+    for n in range(1, total_seats + 1):
+        if n not in used_seats:
+            coach_no = (n - 1) // SEATS_PER_COACH + 1
+            seat_in_coach = (n - 1) % SEATS_PER_COACH + 1
+            return f"S{coach_no}-{seat_in_coach}"
+
+    return None
+
+def bench(total_seats, rng):
+    booked = rng.sample(range(1, total_seats + 1), int(total_seats * OCCUPANCY))
+    tickets = [(format_seat_number(n),) for n in booked]
+    bitmap = SeatBitmap(total_seats, booked)
+
+    assert legacy_next_available_seat(total_seats, tickets) == format_seat_number(bitmap.next_free())
+
+    number = max(1, 20000 // total_seats)
+    legacy = min(timeit.repeat(lambda: legacy_next_available_seat(total_seats, tickets), number=number, repeat=REPEAT)) / number
+
+    def allocate_and_release():
+        n = bitmap.next_free()
+        bitmap.mark_used(n)
+        bitmap.mark_free(n)
+    bitmap_time = min(timeit.repeat(allocate_and_release, number=10000, repeat=REPEAT)) / 10000
+
+    rebuild = min(timeit.repeat(lambda: SeatBitmap(total_seats, (parse_seat_number(s) for (s,) in tickets)), number=number, repeat=REPEAT)) / number
+    return legacy, bitmap_time, rebuild
+
+def main():
+    rng = random.Random(42)
+    print(f"Occupancy {OCCUPANCY:.0%}, {SEATS_PER_COACH} seats per coach\n")
+    print(f"{'seats':>6} {'legacy scan (us)':>18} {'bitmap alloc (us)':>18} {'speedup':>9} {'rebuild (us)':>13}")
+    for total_seats in TRAIN_SIZES:
+        legacy, bitmap_time, rebuild = bench(total_seats, rng)
+        print(f"{total_seats:>6} {legacy * 1e6:>18.2f} {bitmap_time * 1e6:>18.3f} {legacy / bitmap_time:>8.0f}x {rebuild * 1e6:>13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Local load test for the HTTP booking service against a live database.
+
+Run from the project root (uses DB_CONFIG from main_app):
+    python -m benchmarks.service_load [--clients 50] [--requests 200] [--workers 16]
+
+Starts booking_server in-process on a free port and runs simulated
+clients on keep-alive connections. Each client logs in once and then sends
+a mix of searches, availability checks, PNR lookups and bookings. Bookings
+go to a temporary train, which is removed afterwards. Reports requests/s
+and per-endpoint latency percentiles.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+import main_app
+from main_app import db_execute
+from booking_server import BookingServer, prepare_service
+from benchmarks.booking_stress import create_stress_train, drop_stress_train
+
+# Relative weight of each request type in the mix
+REQUEST_MIX = (("search", 50), ("availability", 25), ("pnr", 15), ("book", 10))
+
+class Client:
+    """Minimal HTTP/1.1 keep-alive client."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+        self.token = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+
+    async def call(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self.writer.write(head.encode("latin-1") + b"\r\n" + data)
+        await self.writer.drain()
+
+        status_head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = status_head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split(" ")[1])
+        length = next(int(l.split(":", 1)[1]) for l in lines[1:] if l.lower().startswith("content-length"))
+        payload = json.loads(await self.reader.readexactly(length))
+        return status, payload
+
+    def close(self):
+        self.writer.close()
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+async def run_client(port, args, stations, pnrs, train_id, latencies, statuses, rng):
+    client = Client(port)
+    await client.connect()
+    status, payload = await client.call("POST", "/login", {"username": args.username, "password": args.password})
+    if status != 200:
+        raise SystemExit(f"Login failed: {payload}")
+    client.token = payload["token"]
+
+    kinds, weights = zip(*REQUEST_MIX)
+    for _ in range(args.requests):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "search":
+            a, b = rng.sample(stations, 2)
+            method, path, body = "GET", f"/search?from={a}&to={b}", None
+        elif kind == "availability":
+            method, path, body = "GET", f"/trains/{train_id}/availability", None
+        elif kind == "pnr" and pnrs:
+            method, path, body = "GET", f"/tickets/{rng.choice(pnrs)}", None
+        else:
+            kind = "book"
+            method, path, body = "POST", "/bookings", {
+                "train_id": train_id, "from": stations[0], "to": stations[1], "class_type": "Sleeper",
+                "passenger_name": "Load Test", "passenger_age": 30, "passenger_gender": "Other"}
+        started = time.perf_counter()
+        status, _ = await client.call(method, path, body)
+        latencies.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+        statuses[status] = statuses.get(status, 0) + 1
+    client.close()
+
+async def run(args, stations, pnrs, train_id):
+    server = BookingServer(args.workers)
+    port = await server.start("127.0.0.1", 0)
+    latencies, statuses = {}, {}
+    rng = random.Random(args.seed)
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        run_client(port, args, stations, pnrs, train_id, latencies, statuses, random.Random(rng.random()))
+        for _ in range(args.clients)
+    ])
+    elapsed = time.perf_counter() - started
+    await server.stop()
+    return latencies, statuses, elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for booking_server")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=200, help="requests per client")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="adminpass")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    if not prepare_service(args.workers):
+        print("Load test needs a database connection.")
+        return
+    stations = [r[0] for r in db_execute("SELECT station_id FROM stations", fetch='all') or []]
+    pnrs = [r[0] for r in db_execute("SELECT pnr FROM tickets LIMIT 1000", fetch='all') or []]
+    if len(stations) < 2:
+        print("Database must contain at least two stations.")
+        return
+
+    train_id = create_stress_train(args.clients * args.requests)
+    main_app.reference_cache.invalidate(stations=False)
+    try:
+        latencies, statuses, elapsed = asyncio.run(run(args, stations, pnrs, train_id))
+    finally:
+        drop_stress_train(train_id)
+        main_app.seat_inventory.invalidate(train_id)
+
+    total = sum(len(v) for v in latencies.values())
+    print(f"{args.clients} clients, {args.workers} workers: {total} requests in {elapsed:.2f}s "
+          f"({total / elapsed:.1f} req/s)")
+    print("status codes: " + ", ".join(f"{k}={v}" for k, v in sorted(statuses.items())))
+    print(f"{'endpoint':>12} {'count':>7} {'mean ms':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+    for kind, samples in sorted(latencies.items()):
+        print(f"{kind:>12} {len(samples):>7} {statistics.mean(samples):>8.2f} {percentile(samples, 50):>7.2f} "
+              f"{percentile(samples, 95):>7.2f} {percentile(samples, 99):>7.2f}")
+
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
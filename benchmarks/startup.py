@@ -0,0 +1,117 @@
+"""
+Startup benchmark for the Tk app.
+
+Run from the project root:
+    python -m benchmarks.startup [--runs 5]
+
+Times, each in a fresh interpreter, 'import main_app' and the heavy
+modules it used to import eagerly (mysql.connector, PIL, fpdf), and lists
+which of them an import of main_app still loads. Then times the window
+backgrounds: decoding and scaling bg.jpeg per window as the windows used
+to, against ImageAssets with an empty disk cache (first start), a filled
+one (later starts) and its in-memory PhotoImages (re-login). When a
+display is available the login window and main menu themselves are
+timed as well. Image caches go to a temporary directory.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import main_app
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LEGACY_IMPORTS = "import mysql.connector, PIL.Image, PIL.ImageTk, fpdf"
+HEAVY_MODULES = ("mysql.connector", "PIL", "fpdf")
+
+def time_import(statement, runs):
+    """Median seconds for 'statement' in a fresh interpreter, and the HEAVY_MODULES it loaded."""
+    code = (f"import sys, time\nstarted = time.perf_counter()\n{statement}\n"
+            f"print(time.perf_counter() - started)\n"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    samples, loaded = [], ""
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+        seconds, loaded = out.stdout.splitlines()
+        samples.append(float(seconds))
+    return statistics.median(samples), loaded or "none"
+
+def timed_ms(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return (time.perf_counter() - started) * 1000, result
+
+def legacy_background(size):
+    from PIL import Image
+    return Image.open(main_app.BACKGROUND_IMAGE).resize(size)
+
+def bench_images(cache_dir):
+    sizes = main_app.IMAGE_VARIANTS[main_app.BACKGROUND_IMAGE]
+    print("\nBackground image preparation (ms, no Tk):")
+    for size in sizes:
+        print(f"  per window decode+resize {size[0]}x{size[1]:<5} {timed_ms(legacy_background, size)[0]:>8.2f}")
+    cold = main_app.ImageAssets(cache_dir)
+    print(f"  ImageAssets, empty disk cache   {timed_ms(cold.prepare, main_app.BACKGROUND_IMAGE, sizes)[0]:>8.2f}")
+    warm = main_app.ImageAssets(cache_dir)
+    print(f"  ImageAssets, filled disk cache  {timed_ms(warm.prepare, main_app.BACKGROUND_IMAGE, sizes)[0]:>8.2f}")
+    size = sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir))
+    print(f"  disk cache size: {size / 1024:.0f} KiB in {len(os.listdir(cache_dir))} files")
+
+class _App:
+    """The parts of RailwayApp the windows use."""
+    def __init__(self, root):
+        self.root = root
+    def show_login_window(self):
+        pass
+
+def bench_windows(cache_dir):
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError as err:
+        print(f"\nWindow timings skipped: {err}")
+        return
+    root.withdraw()
+    main_app.setup_styles()
+    app = _App(root)
+
+    def open_windows():
+        login_ms, login = timed_ms(main_app.LoginWindow, app)
+        root.update()
+        login.destroy()
+        menu_ms, menu = timed_ms(main_app.MainMenu, app, "admin", 0, "benchmark")
+        root.update()
+        menu.destroy()
+        return login_ms, menu_ms
+
+    window_cache = os.path.join(cache_dir, "windows")
+    stages = (("empty disk cache", lambda: main_app.ImageAssets(window_cache)),
+              ("filled disk cache", lambda: main_app.ImageAssets(window_cache)),
+              ("in memory (re-login)", lambda: main_app.image_assets))
+    print("\nWindows (ms):             login   main menu")
+    for label, assets in stages:
+        main_app.image_assets = assets()
+        login_ms, menu_ms = open_windows()
+        print(f"  {label:<22} {login_ms:>7.2f} {menu_ms:>11.2f}")
+    root.destroy()
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup benchmark")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per import measurement")
+    args = parser.parse_args()
+
+    print(f"Import times (median of {args.runs}, ms):")
+    for label, statement in (("import main_app", "import main_app"), ("heavy imports (old)", LEGACY_IMPORTS)):
+        seconds, loaded = time_import(statement, args.runs)
+        print(f"  {label:<22} {seconds * 1000:>8.1f}   loads: {loaded}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        bench_images(cache_dir)
+        bench_windows(cache_dir)
+    main_app.task_executor.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Keystroke benchmark for the station search index (main_app's STATION SEARCH INDEX).
+
+Run from the project root:
+    python -m benchmarks.station_search [--stations 8000] [--queries 500]
+    python -m benchmarks.station_search --stations 0   # the stations in the database
+
+Indexes --stations generated stations (names built from syllables, with
+codes and cities) or, with --stations 0, the stations table through the
+reference cache. Then types --queries random names, codes, cities and
+misspellings one character at a time and prints the p50/p95/p99/max of
+StationIndex.search() per keystroke, by query kind. For comparison it
+times what the readonly comboboxes did: building the sorted 'ID - Name'
+list, and filtering that list by substring on each keystroke.
+"""
+import argparse
+import random
+import time
+
+import main_app
+from benchmarks.hot_paths import percentile
+
+SYLLABLES = "ka ra ma na pa la ta sa va ha ja ga da ba ya ri ni pu ko go ro mu bhi che dwa lu".split()
+SUFFIXES = ("", "", "", " Junction", " Road", " Cantt", " City", " Nagar", " Halt", " Town")
+
+def generate_stations(count, rng):
+    """{station_id: (station_name, station_code, city, state)} with realistic clustering of names."""
+    word = lambda: "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title()
+    cities = [word() for _ in range(max(1, count // 5))]
+    stations = {}
+    for sid in range(1, count + 1):
+        city = rng.choice(cities)
+        name = (city if rng.random() < 0.3 else word()) + rng.choice(SUFFIXES)
+        stations[sid] = (name, "".join(c for c in name.upper() if c.isalpha())[:3] + str(sid), city, "State")
+    return stations
+
+def misspell(text, rng):
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]  # Swap two letters
+
+def typed_queries(stations, count, rng):
+    """(kind, query) pairs picked from random stations."""
+    rows = list(stations.values())
+    kinds = (("name", lambda r: r[0]), ("code", lambda r: r[1]), ("city", lambda r: r[2]),
+             ("misspelt", lambda r: misspell(r[0], rng)))
+    queries = []
+    for _ in range(count):
+        kind, pick = rng.choice(kinds)
+        queries.append((kind, pick(rng.choice(rows))))
+    return queries
+
+def main():
+    parser = argparse.ArgumentParser(description="Station search keystroke benchmark")
+    parser.add_argument("--stations", type=int, default=8000, help="generated stations; 0 uses the database")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    if args.stations:
+        stations = generate_stations(args.stations, rng)
+        index = main_app.StationIndex(None)
+        started = time.perf_counter()
+        index.build(stations)
+        index.sync = lambda: None  # Nothing to sync with
+    else:
+        index = main_app.station_index
+        started = time.perf_counter()
+        index.sync()
+        stations = index.rows
+        if not stations:
+            raise SystemExit("Database has no stations; load benchmarks.synthetic_data first.")
+    print(f"Indexed {len(stations)} stations in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    labels = [main_app.station_label(sid, row[0])
+              for sid, row in sorted(stations.items(), key=lambda item: ((item[1][0] or "").casefold(), item[0]))]
+    print(f"Combobox list of {len(labels)} stations built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    samples, scans, found = {}, [], {}
+    for kind, query in typed_queries(stations, args.queries, rng):
+        for end in range(1, len(query) + 1):
+            started = time.perf_counter()
+            matches = index.search(query[:end])
+            samples.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+        found[kind] = found.get(kind, 0) + bool(matches)
+        typed = query.casefold()
+        started = time.perf_counter()
+        [label for label in labels if typed in label.casefold()]
+        scans.append((time.perf_counter() - started) * 1000)
+
+    print(f"\n{'query kind':<10} {'keystrokes':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'found':>6}")
+    for kind, values in [*samples.items(), ("all", [v for values in samples.values() for v in values])]:
+        queries = sum(found.values()) if kind == "all" else found[kind]
+        print(f"{kind:<10} {len(values):>10} {percentile(values, 50):>8.3f} {percentile(values, 95):>8.3f} "
+              f"{percentile(values, 99):>8.3f} {max(values):>8.3f} {queries:>6}")
+    print(f"{'list scan':<10} {len(scans):>10} {percentile(scans, 50):>8.3f} {percentile(scans, 95):>8.3f} "
+          f"{percentile(scans, 99):>8.3f} {max(scans):>8.3f}")
+    if not args.stations:
+        main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Reproducible synthetic data set for benchmarking at production scale.
+
+Run from the project root (uses DB_CONFIG from main_app):
+    python -m benchmarks.synthetic_data [--scale 1] [--seed 42]
+    python -m benchmarks.synthetic_data --purge
+or against the embedded database, with no MySQL server:
+    RAILWAY_DB_BACKEND=sqlite python -m benchmarks.synthetic_data
+
+Scale 1 adds 1,000 stations, 1,000 trains with 8-30 stops each, 1,000
+users and 100,000 tickets; every size grows linearly with --scale, so
+--scale 10 gives a million tickets. The same seed and scale always give the
+same data. Generated rows are marked (station codes 'SY...', trains named
+'Synthetic ...', users 'syn_...') so --purge can remove exactly them.
+Rows are written with main_app.bulk_insert(): chunked executemany(), one
+transaction per chunk.
+"""
+import argparse
+import datetime
+import random
+import time
+
+import main_app
+from main_app import bulk_insert, db_execute, db_transaction, SEATS_PER_COACH, TRAVEL_CLASSES
+from benchmarks.journey_planner import synthetic_timetable
+
+STATIONS_PER_SCALE = 1000
+TRAINS_PER_SCALE = 1000
+USERS_PER_SCALE = 1000
+TICKETS_PER_SCALE = 100_000
+CHUNK_ROWS = 5000
+CANCELLED_SHARE = 0.1   # Share of tickets generated as cancelled
+BOOKING_DAYS = 365      # Tickets are spread over this many past days
+JOURNEY_DAYS = 60       # and travel up to this many days after booking
+FIRST_NAMES = ("Arjun", "Priya", "Rahul", "Anita", "Vikram", "Lakshmi", "Suresh", "Kavya", "Imran", "Meera")
+LAST_NAMES = ("Sharma", "Iyer", "Reddy", "Patel", "Nair", "Khan", "Singh", "Das", "Menon", "Rao")
+TRAIN_TYPES = ("Express", "Superfast", "Passenger", "Mail")
+
+def next_id(table, column):
+    row = db_execute(f"SELECT COALESCE(MAX({column}), 0) FROM {table}", fetch='one')
+    return row[0] + 1
+
+def write_chunks(query, rows, label):
+    """Writes an iterable of rows CHUNK_ROWS at a time, so generated rows never pile up in memory."""
+    started = time.perf_counter()
+    written = bulk_insert(query, rows, CHUNK_ROWS)
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<10} {written:>10} rows  {written / elapsed if elapsed else 0:>10.0f} rows/s")
+
+def generate(scale, seed):
+    rng = random.Random(seed)
+    n_stations = int(STATIONS_PER_SCALE * scale)
+    n_trains = int(TRAINS_PER_SCALE * scale)
+    n_users = int(USERS_PER_SCALE * scale)
+    n_tickets = int(TICKETS_PER_SCALE * scale)
+
+    station_base = next_id("stations", "station_id") - 1
+    train_base = next_id("trains", "train_id") - 1
+    user_base = next_id("users", "user_id") - 1
+    schedule_base = next_id("train_schedule", "schedule_id") - 1
+    print(f"Generating scale {scale} (seed {seed}): {n_stations} stations, {n_trains} trains, "
+          f"{n_users} users, {n_tickets} tickets")
+
+    stations = [(station_base + i, f"Synthetic Station {i}", f"SY{i}", f"City {i // 5}", f"State {i % 28}")
+                for i in range(1, n_stations + 1)]
+    trains = [(train_base + i, f"Synthetic {rng.choice(FIRST_NAMES)} Express {i}", rng.choice(TRAIN_TYPES),
+               SEATS_PER_COACH * rng.randint(8, 20)) for i in range(1, n_trains + 1)]
+    users = [(user_base + i, f"syn_user_{i}", "synthetic", "user", f"syn{i}@example.com", f"9{i:09d}")
+             for i in range(1, n_users + 1)]
+
+    # Timetable: clustered random walks over the station network
+    stops_by_train = {}
+    schedule = []
+    for train, station, arrival, departure in synthetic_timetable(n_stations, n_trains, rng):
+        stops = stops_by_train.setdefault(train_base + train, [])
+        stops.append(station_base + station)
+        schedule.append((schedule_base + len(schedule) + 1, train_base + train, station_base + station,
+                         arrival, departure, len(stops)))
+
+    # Fares for each train's end-to-end route, all classes
+    fares, seen = [], set()
+    class_factor = {"General": 0.5, "Sleeper": 1.0, "AC": 2.8}
+    for stops in stops_by_train.values():
+        if len(stops) < 2 or (stops[0], stops[-1]) in seen:
+            continue
+        seen.add((stops[0], stops[-1]))
+        base = rng.randint(150, 1500)
+        for class_type in TRAVEL_CLASSES:
+            fares.append((stops[0], stops[-1], class_type, f"{base * class_factor.get(class_type, 1.0):.2f}"))
+
+    # Tickets: confirmed ones hold the next seat of their train, date and class until it is full
+    seats_of = {t[0]: main_app.class_seat_counts(t[3]) for t in trains}
+    served = [t for t, stops in stops_by_train.items() if len(stops) >= 2]
+    today = datetime.date.today()
+
+    def tickets():
+        next_seat = {}
+        for i in range(1, n_tickets + 1):
+            train_id = rng.choice(served)
+            stops = stops_by_train[train_id]
+            a = rng.randrange(len(stops) - 1)
+            b = rng.randrange(a + 1, len(stops))
+            status = "Cancelled" if rng.random() < CANCELLED_SHARE else "Confirmed"
+            class_type = rng.choice(TRAVEL_CLASSES)
+            booking_date = today - datetime.timedelta(days=rng.randrange(BOOKING_DAYS))
+            journey_date = booking_date + datetime.timedelta(days=rng.randrange(JOURNEY_DAYS))
+            partition = (train_id, journey_date, class_type)
+            seat = next_seat.get(partition, 0) + 1
+            if status == "Confirmed" and seat <= seats_of[train_id][class_type]:
+                next_seat[partition] = seat
+            else:
+                status, seat = "Cancelled", rng.randint(1, seats_of[train_id][class_type])
+            yield (
+                f"SY{seed % 100:02d}{i:09d}", train_id, user_base + rng.randint(1, n_users), stops[a], stops[b],
+                main_app.format_seat_number(seat, main_app.seat_prefix(class_type)), class_type,
+                booking_date, journey_date, status,
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.randint(5, 85), rng.choice(main_app.GENDERS)
+            )
+
+    started = time.perf_counter()
+    write_chunks("INSERT INTO stations (station_id, station_name, station_code, city, state) VALUES (%s, %s, %s, %s, %s)",
+                 stations, "stations")
+    write_chunks("INSERT INTO trains (train_id, train_name, train_type, total_seats) VALUES (%s, %s, %s, %s)",
+                 trains, "trains")
+    write_chunks("INSERT INTO users (user_id, username, password, role, email, phone) VALUES (%s, %s, %s, %s, %s, %s)",
+                 users, "users")
+    write_chunks("""INSERT INTO train_schedule (schedule_id, train_id, station_id, arrival_time, departure_time, sequence)
+                    VALUES (%s, %s, %s, %s, %s, %s)""", schedule, "schedules")
+    write_chunks("INSERT INTO fare_master (from_station, to_station, class_type, fare_amount) VALUES (%s, %s, %s, %s)",
+                 fares, "fares")
+    write_chunks("""INSERT INTO tickets (pnr, train_id, passenger_id, from_station, to_station, seat_number, class_type,
+                                         booking_date, journey_date, status, passenger_name, passenger_age, passenger_gender)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""", tickets(), "tickets")
+
+    with db_transaction() as cursor:
+        # Past journeys hold no seats (see main_app.prune_seat_claims)
+        cursor.execute("""INSERT INTO seat_claims (journey_date, train_id, class_type, seat_number, ticket_id)
+                          SELECT journey_date, train_id, class_type, seat_number, ticket_id FROM tickets
+                          WHERE status='Confirmed' AND journey_date >= %s AND train_id BETWEEN %s AND %s""",
+                       (today, train_base + 1, train_base + n_trains))
+        main_app.refresh_od_index(cursor)
+        cursor.execute(main_app.BACKFILL_TICKET_FARES + " AND train_id BETWEEN %s AND %s",
+                       (train_base + 1, train_base + n_trains))
+        main_app.add_to_rollups(cursor, "tk.train_id BETWEEN %s AND %s", (train_base + 1, train_base + n_trains))
+    print(f"Done in {time.perf_counter() - started:.1f}s (seat claims, OD index and booking rollups updated)")
+
+def purge():
+    """Deletes every row created by generate()."""
+    with db_transaction() as cursor:
+        # Tickets on synthetic trains, or booked between synthetic stations or for synthetic users on any train
+        synthetic = """{t}train_id IN (SELECT train_id FROM trains WHERE train_name LIKE 'Synthetic %')
+            OR {t}from_station IN (SELECT station_id FROM stations WHERE station_code LIKE 'SY%')
+            OR {t}to_station IN (SELECT station_id FROM stations WHERE station_code LIKE 'SY%')
+            OR {t}passenger_id IN (SELECT user_id FROM users WHERE username LIKE 'syn!_%' ESCAPE '!')"""
+        tickets = synthetic.format(t="")
+        cursor.execute(f"DELETE FROM seat_claims WHERE ticket_id IN (SELECT ticket_id FROM tickets WHERE {tickets})")
+        cursor.execute(f"DELETE FROM waitlist WHERE ticket_id IN (SELECT ticket_id FROM tickets WHERE {tickets})")
+        main_app.add_to_rollups(cursor, synthetic.format(t="tk."), sign=-1)  # Rollup aliases tickets as tk
+        cursor.execute(f"DELETE FROM tickets WHERE {tickets}")
+        cursor.execute("DELETE FROM waitlist_queues WHERE train_id IN (SELECT train_id FROM trains WHERE train_name LIKE 'Synthetic %')")
+        cursor.execute("DELETE FROM train_od_index WHERE train_id IN (SELECT train_id FROM trains WHERE train_name LIKE 'Synthetic %')")
+        cursor.execute("DELETE FROM train_schedule WHERE train_id IN (SELECT train_id FROM trains WHERE train_name LIKE 'Synthetic %')")
+        cursor.execute("""DELETE FROM fare_master WHERE from_station IN (SELECT station_id FROM stations WHERE station_code LIKE 'SY%')
+                          OR to_station IN (SELECT station_id FROM stations WHERE station_code LIKE 'SY%')""")
+        cursor.execute("DELETE FROM trains WHERE train_name LIKE 'Synthetic %'")
+        cursor.execute("DELETE FROM stations WHERE station_code LIKE 'SY%'")
+        cursor.execute("DELETE FROM users WHERE username LIKE 'syn!_%' ESCAPE '!'")
+    print("Synthetic data removed.")
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic railway data generator")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--purge", action="store_true", help="remove previously generated data and exit")
+    args = parser.parse_args()
+
+    if args.purge:
+        purge()
+    else:
+        generate(args.scale, args.seed)
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
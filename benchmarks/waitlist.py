@@ -0,0 +1,75 @@
+"""
+Waitlist benchmark: joining and promoting from queues of growing length.
+
+Run from the project root (uses DB_CONFIG from main_app, or the embedded
+database with RAILWAY_DB_BACKEND=sqlite):
+    python -m benchmarks.waitlist [--sizes 100,1000,10000] [--samples 50]
+
+For each queue size a temporary train is created and its Sleeper class
+filled, then 'size' passengers are waitlisted (WAITLIST_LIMIT is raised to
+fit them) and the last --samples of those bookings are timed. Cancelling
+--samples confirmed tickets then times cancellation with promotion of the
+queue head, and checks that the promoted tickets are the earliest queued
+ones and that nobody was left with a freed seat. Latencies should stay
+flat as the queue grows. The train is removed afterwards.
+"""
+import argparse
+import datetime
+import time
+
+import main_app
+from main_app import book_seat, cancel_booking, db_execute
+from benchmarks.booking_stress import create_stress_train, drop_stress_train
+from benchmarks.hot_paths import percentile
+
+def run_size(size, samples, passenger_id, station_ids):
+    train_id = create_stress_train(2 * samples)  # The Sleeper class gets half the seats (main_app.CLASS_SEATS)
+    main_app.reference_cache.invalidate(stations=False)
+    main_app.WAITLIST_LIMIT = size
+    book = lambda i: book_seat(train_id, passenger_id, station_ids[0], station_ids[1], "Sleeper",
+                               f"Waitlist Passenger {i}", 30, "Other", waitlist=True)
+    try:
+        confirmed = [book(i)[0] for i in range(samples)]
+        enqueue = []
+        for i in range(size):
+            started = time.perf_counter()
+            booking = book(i)
+            if size - i <= samples:
+                enqueue.append((time.perf_counter() - started) * 1000)
+            if not booking or booking[1] is not None:
+                raise SystemExit(f"Booking {i} was not waitlisted: {booking}")
+        promote = []
+        for pnr in confirmed:
+            started = time.perf_counter()
+            if not cancel_booking(pnr):
+                raise SystemExit(f"Could not cancel {pnr}")
+            promote.append((time.perf_counter() - started) * 1000)
+        promoted = [r[0] for r in db_execute("""SELECT ticket_id FROM waitlist WHERE train_id=%s AND promoted_at IS NOT NULL
+                                                ORDER BY ticket_id""", (train_id,), fetch='all')]
+        first = [r[0] for r in db_execute(f"SELECT ticket_id FROM waitlist WHERE train_id=%s ORDER BY ticket_id LIMIT {samples}",
+                                          (train_id,), fetch='all')]
+        free = main_app.seat_inventory.available(train_id, datetime.date.today(), "Sleeper")
+        return enqueue, promote, promoted == first and free == 0
+    finally:
+        drop_stress_train(train_id)
+
+def main():
+    parser = argparse.ArgumentParser(description="Waitlist enqueue/promote benchmark")
+    parser.add_argument("--sizes", default="100,1000,10000", help="comma-separated queue lengths")
+    parser.add_argument("--samples", type=int, default=50, help="timed bookings and cancellations per size")
+    args = parser.parse_args()
+
+    passenger = db_execute("SELECT user_id FROM users ORDER BY user_id LIMIT 1", fetch='one')
+    stations = db_execute("SELECT station_id FROM stations ORDER BY station_id LIMIT 2", fetch='all')
+    if not passenger or not stations or len(stations) < 2:
+        raise SystemExit("Database must contain at least one user and two stations.")
+
+    print(f"{'queue':>7} {'enqueue p50':>12} {'enqueue p95':>12} {'promote p50':>12} {'promote p95':>12}  order")
+    for size in (int(n) for n in args.sizes.split(",")):
+        enqueue, promote, ok = run_size(size, args.samples, passenger[0], [s[0] for s in stations])
+        print(f"{size:>7} {percentile(enqueue, 50):>12.2f} {percentile(enqueue, 95):>12.2f} "
+              f"{percentile(promote, 50):>12.2f} {percentile(promote, 95):>12.2f}  {'ok' if ok else 'WRONG'}")
+    main_app.get_db_pool().close_all()
+
+if __name__ == "__main__":
+    main()
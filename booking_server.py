@@ -0,0 +1,375 @@
+"""
+HTTP/JSON front end for the booking service in main_app.
+
+Run from the project root:
+    python booking_server.py [--host 127.0.0.1] [--port 8080] [--workers 16] [--session-ttl 28800] [--replica-heartbeat]
+    RAILWAY_DB_BACKEND=sqlite python booking_server.py   # single station, no MySQL server
+
+The event loop only parses requests and writes responses; every service
+call runs on a worker thread, each with its own pooled DB connection, so
+slow queries never stall other clients. Kiosks, agents and web front ends
+share the same database, seat claims and seat inventory as the Tk app.
+
+Endpoints (send "Authorization: Bearer <token>" from POST /login where noted):
+    POST /login                      {"username", "password"} -> {"token", "user"}
+    POST /logout                     (auth) ends the session; tokens also expire SESSION_TTL after login
+    GET  /search?from=&to=&date=     direct trains with availability on a journey date, or connections
+    GET  /trains/<id>/availability?date=  free seats of one train per class
+    GET  /fares?from=&to=&class=     fare for a route and class
+    GET  /stations?q=&limit=         type-ahead station matches by name, code or city
+    POST /bookings                   (auth) {"train_id", "from", "to", "class_type", "journey_date",
+                                      "passenger_name", "passenger_age", "passenger_gender"}
+    POST /bookings/group             (auth) {"train_id", "from", "to", "class_type", "journey_date",
+                                      "passengers": [{"name", "age", "gender"}, ...]}
+                                     agents and admins may book up to BULK_MAX_PASSENGERS
+    GET  /bookings?cursor=&limit=    (auth) the caller's tickets, newest first
+    GET  /tickets/<pnr>              (auth) PNR lookup, own tickets unless agent/admin
+    POST /tickets/<pnr>/cancel       (auth) cancel an own ticket (any as agent/admin) -> the cancelled tickets and refund
+    GET  /reports/tickets?train_id=&status=&date_from=&date_to=&cursor=&limit=  (admin)
+    GET  /reports/dashboard?date_from=&date_to=  (admin) occupancy, revenue and cancellations
+    POST /cancellations              (admin) {"train_id", "journey_date"} or {"pnrs": [...]}: bulk
+                                     cancellation -> summary and per-PNR refund manifest
+
+Journey dates are YYYY-MM-DD and default to today. A booking for a full
+class is waitlisted: "status" is "Waitlisted" and "waitlist" its place
+("RAC 2", "WL 5"); cancellations promote the queue head into the freed
+seat, and PNR lookups and booking lists show "waitlist" and "promoted_at".
+Paged endpoints return "next_cursor"; pass it back as "cursor=<date>,<ticket_id>".
+With RAILWAY_DB_REPLICAS set, reads go to read replicas (see main_app's
+READ REPLICAS section); a user's own bookings and cancellations are read
+back from the primary until the replicas have caught up with them.
+With --metrics-file, query and operation metrics (see main_app's QUERY
+INSTRUMENTATION section) are rewritten to that Prometheus text file.
+"""
+import argparse
+import asyncio
+import datetime
+import decimal
+import json
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import main_app
+from main_app import ServiceError
+
+MAX_BODY_BYTES = 64 * 1024
+HEADER_TIMEOUT = 30  # Seconds an idle keep-alive connection may wait for its next request
+METRICS_INTERVAL = 15  # Seconds between rewrites of the --metrics-file
+SESSION_TTL = 8 * 3600  # Seconds a login token stays valid
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+           405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error",
+           503: "Service Unavailable"}
+
+def to_json(value):
+    """json.dumps default= hook for the DB types the service returns."""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (datetime.timedelta, datetime.time)):
+        return str(value)  # TIME columns come back as timedelta
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def parse_cursor(value):
+    """Parses '<booking_date>,<ticket_id>' back into a keyset cursor."""
+    if not value:
+        return None
+    date, _, ticket_id = value.partition(",")
+    try:
+        date = datetime.date.fromisoformat(date)
+    except ValueError:
+        date = None
+    if date is None or not main_app.is_int(ticket_id):
+        raise ServiceError("cursor must look like '<booking_date>,<ticket_id>'.", 400)
+    return (date, int(ticket_id))
+
+class Request:
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.user = None
+        self.token = None
+
+    def arg(self, name, default=None):
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b"{}")
+        except ValueError:
+            raise ServiceError("Request body must be JSON.")
+        if not isinstance(data, dict):
+            raise ServiceError("Request body must be a JSON object.")
+        return data
+
+class BookingServer:
+    """asyncio HTTP/1.1 server that dispatches to the main_app service functions."""
+
+    def __init__(self, workers=16, session_ttl=SESSION_TTL):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="booking-api")
+        self.session_ttl = session_ttl
+        self.sessions = {}  # token -> (user dict from authenticate_user(), monotonic expiry)
+        self.sessions_lock = threading.Lock()
+        self.routes = [
+            ("POST", r"/login", self.login, None),
+            ("POST", r"/logout", self.logout, "user"),
+            ("GET", r"/search", self.search, None),
+            ("GET", r"/trains/(\d+)/availability", self.availability, None),
+            ("GET", r"/fares", self.fare, None),
+            ("GET", r"/stations", self.stations, None),
+            ("POST", r"/bookings", self.book, "user"),
+            ("GET", r"/bookings", self.bookings, "user"),
+            ("POST", r"/bookings/group", self.book_group, "user"),
+            ("GET", r"/tickets/([^/]+)", self.ticket, "user"),
+            ("POST", r"/tickets/([^/]+)/cancel", self.cancel, "user"),
+            ("GET", r"/reports/tickets", self.report, "admin"),
+            ("GET", r"/reports/dashboard", self.dashboard, "admin"),
+            ("POST", r"/cancellations", self.withdraw, "admin"),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler, auth) for method, pattern, handler, auth in self.routes]
+        self.server = None
+
+    # ---- Handlers: run on worker threads, return a JSON-able value ----
+    def login(self, request):
+        body = request.json()
+        user = main_app.authenticate_user(body.get("username"), body.get("password"))
+        token = secrets.token_urlsafe(24)
+        now = time.monotonic()
+        with self.sessions_lock:
+            # Tokens nobody presents again are only dropped here, so the table cannot grow without bound
+            for stale in [t for t, (_, expires) in self.sessions.items() if expires <= now]:
+                del self.sessions[stale]
+            self.sessions[token] = (user, now + self.session_ttl)
+        return {"token": token, "user": user}
+
+    def logout(self, request):
+        with self.sessions_lock:
+            self.sessions.pop(request.token, None)
+        return {"logged_out": True}
+
+    def search(self, request):
+        return main_app.find_trains(request.arg("from"), request.arg("to"), request.arg("date"))
+
+    def availability(self, request, train_id):
+        return main_app.get_train_availability(train_id, request.arg("date"))
+
+    def fare(self, request):
+        fare = main_app.get_fare(request.arg("from"), request.arg("to"), request.arg("class"))
+        return {"fare": fare}
+
+    def stations(self, request):
+        return main_app.suggest_stations(request.arg("q"), request.arg("limit"))
+
+    def book(self, request):
+        body = request.json()
+        return main_app.reserve_ticket(
+            request.user["user_id"], body.get("train_id"), body.get("from"), body.get("to"), body.get("class_type"),
+            body.get("passenger_name"), body.get("passenger_age"), body.get("passenger_gender"), body.get("journey_date"))
+
+    def book_group(self, request):
+        body = request.json()
+        bulk = request.user["role"].lower() in main_app.STAFF_ROLES
+        return main_app.reserve_group(
+            request.user["user_id"], body.get("train_id"), body.get("from"), body.get("to"), body.get("class_type"),
+            body.get("passengers"), bulk, body.get("journey_date"))
+
+    def bookings(self, request):
+        return main_app.list_bookings(request.user["user_id"], parse_cursor(request.arg("cursor")), request.arg("limit"))
+
+    def ticket(self, request, pnr):
+        return main_app.lookup_ticket(unquote(pnr), request.user)
+
+    def cancel(self, request, pnr):
+        return main_app.cancel_reservation(unquote(pnr), request.user)
+
+    def report(self, request):
+        return main_app.ticket_report(request.arg("train_id"), request.arg("status"), request.arg("date_from"),
+                                      request.arg("date_to"), parse_cursor(request.arg("cursor")), request.arg("limit"))
+
+    def dashboard(self, request):
+        return main_app.booking_dashboard(request.arg("date_from"), request.arg("date_to"))
+
+    def withdraw(self, request):
+        body = request.json()
+        return main_app.withdraw_service(body.get("train_id"), body.get("journey_date"), body.get("pnrs"))
+
+    # ---- HTTP plumbing ----
+    def authorize(self, request, level):
+        token = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        with self.sessions_lock:
+            user, expires = self.sessions.get(token, (None, None))
+            if user and expires <= time.monotonic():
+                del self.sessions[token]
+                user = None
+        if not user:
+            raise ServiceError("Login required.", 401)
+        if level == "admin" and user["role"].lower() != "admin":
+            raise ServiceError("Admin role required.", 403)
+        request.user = user
+        request.token = token
+
+    def route(self, request):
+        allowed = False
+        for method, pattern, handler, auth in self.routes:
+            match = pattern.match(request.path)
+            if not match:
+                continue
+            if method != request.method:
+                allowed = True
+                continue
+            if auth:
+                self.authorize(request, auth)
+            return handler, match.groups()
+        raise ServiceError("Method not allowed." if allowed else "Not found.", 405 if allowed else 404)
+
+    def dispatch(self, request):
+        """Runs one request on a worker thread. Returns (status, payload)."""
+        try:
+            handler, args = self.route(request)
+            session = request.user["user_id"] if request.user else None
+            with main_app.query_scope(f"api.{handler.__name__}"), main_app.read_session(session):
+                return 200, handler(request, *args)
+        except ServiceError as err:
+            return err.status, {"error": str(err)}
+        except Exception as err:  # A bad request must not take the server down
+            print(f"Request Error: {request.method} {request.path}: {err!r}")
+            return 500, {"error": "Internal server error."}
+
+    async def read_request(self, reader):
+        """Reads one request; returns None when the client closed the connection."""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HEADER_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        except asyncio.LimitOverrunError:
+            raise ServiceError("Request headers too large.", 413)
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise ServiceError("Malformed request line.")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        length = headers.get("content-length", "0")
+        if not main_app.is_int(length) or int(length) < 0:
+            raise ServiceError("Invalid Content-Length.")
+        if int(length) > MAX_BODY_BYTES:
+            raise ServiceError("Request body too large.", 413)
+        body = await reader.readexactly(int(length)) if int(length) else b""
+
+        url = urlsplit(target)
+        return Request(method.upper(), url.path.rstrip("/") or "/", parse_qs(url.query), headers, body)
+
+    async def write_response(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=to_json).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except ServiceError as err:
+                    await self.write_response(writer, err.status, {"error": str(err)}, False)
+                    break
+                if request is None:
+                    break
+                keep_alive = request.headers.get("connection", "").lower() != "close"
+                status, payload = await loop.run_in_executor(self.executor, self.dispatch, request)
+                await self.write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8080):
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        self.executor.shutdown(wait=True)
+
+def prepare_service(workers):
+    """Sizes the DB pool for the worker threads and warms the shared caches. Returns True on success."""
+    main_app.DB_POOL_SIZE = workers
+    pending = main_app.pending_migrations()
+    if pending:
+        print(f"Warning: schema migrations {pending} are not applied; run 'python migrate.py'.")
+    else:
+        main_app.prune_seat_claims()
+    return main_app.seat_inventory.rebuild()  # Reloads the reference cache too
+
+async def write_metrics(path, interval):
+    """Rewrites the Prometheus text file every 'interval' seconds (for the node_exporter textfile collector)."""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, main_app.query_metrics.export_prometheus, path)
+        except OSError as err:
+            print(f"Metrics Error: {err}")
+        await asyncio.sleep(interval)
+
+async def serve(host, port, workers, metrics_file=None, metrics_interval=METRICS_INTERVAL, session_ttl=SESSION_TTL):
+    server = BookingServer(workers, session_ttl)
+    bound = await server.start(host, port)
+    print(f"Booking service listening on http://{host}:{bound}")
+    metrics = asyncio.create_task(write_metrics(metrics_file, metrics_interval)) if metrics_file else None
+    try:
+        await server.server.serve_forever()
+    finally:
+        if metrics:
+            metrics.cancel()
+        await server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Railway booking HTTP/JSON service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16, help="worker threads (and DB connections)")
+    parser.add_argument("--metrics-file", help="keep query and operation metrics in this Prometheus text file")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL, help="seconds between metrics writes")
+    parser.add_argument("--session-ttl", type=float, default=SESSION_TTL, help="seconds a login token stays valid")
+    parser.add_argument("--replica-heartbeat", action="store_true",
+                        help="write the replication heartbeat (run exactly one writer per primary)")
+    args = parser.parse_args()
+    if args.replica_heartbeat:
+        main_app.REPLICA_HEARTBEAT_WRITER = True
+
+    if not prepare_service(args.workers):
+        print("Service cannot start without a database connection.")
+        return
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.metrics_file, args.metrics_interval,
+                          args.session_ttl))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        main_app.get_db_pool().close_all()
+        main_app.get_replica_router().close_all()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Command-line bulk cancellation, e.g. when a service is withdrawn.
+
+Run from the project root (uses DB_CONFIG from main_app):
+    python cancel_tickets.py --train 12 --date 2026-11-02 --manifest refunds.csv
+    python cancel_tickets.py --pnrs pnrs.txt --manifest refunds.jsonl.gz
+
+Cancels every ticket with a journey today or later on the train and/or
+date, or under the PNRs listed one per line in a file, in batches (see
+main_app's BULK CANCELLATION section). The manifest lists each cancelled
+ticket with its previous status and refund, for refunds and passenger
+notifications.
+"""
+import argparse
+import datetime
+import sys
+
+import main_app
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk ticket cancellation")
+    parser.add_argument("--train", type=int, help="train ID")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="journey date (YYYY-MM-DD)")
+    parser.add_argument("--pnrs", help="file with one PNR per line (instead of --train/--date)")
+    parser.add_argument("--manifest", help="refund/notification manifest: .csv or .jsonl, optionally .gz")
+    parser.add_argument("--batch-size", type=int, default=main_app.CANCEL_BATCH_ROWS)
+    args = parser.parse_args()
+    if bool(args.pnrs) == (args.train is not None or args.date is not None):
+        parser.error("give --train and/or --date, or --pnrs")
+
+    pnrs = None
+    if args.pnrs:
+        try:
+            with open(args.pnrs, encoding="utf-8") as f:
+                pnrs = [line.strip() for line in f if line.strip()]
+        except OSError as err:
+            print(f"Cannot read PNR list: {err}")
+            return 1
+
+    def progress(tickets):
+        nonlocal cancelled
+        cancelled += len(tickets)
+        print(f"\r  {cancelled} tickets cancelled", end="", flush=True)
+    cancelled = 0
+    try:
+        summary = main_app.bulk_cancel(args.train, args.date, pnrs, args.manifest, args.batch_size, on_batch=progress)
+    except main_app.DB_ERRORS as err:
+        print(f"\nDatabase Error: {err} ({cancelled} tickets were cancelled before it)")
+        return 1
+    finally:
+        main_app.get_db_pool().close_all()
+    print(f"\nCancelled {summary['cancelled']} tickets under {summary['pnrs']} PNRs in {summary['elapsed']:.2f}s "
+          f"({summary['tickets_per_sec']:.0f} tickets/s): {summary['seats_released']} seats released, "
+          f"{summary['promoted']} of them to waitlisted passengers; refunds total {summary['refund_total']:.2f}"
+          + (f"\nManifest written to {summary['manifest']}" if summary['manifest'] else ""))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,26 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import mysql.connector
+import sqlite3
 import random
 import string
+import bisect
 import datetime
+import decimal
 import csv
+import functools
+import gzip
+import heapq
+import itertools
+import json
+import os
 import re
-from PIL import Image, ImageTk
-from fpdf import FPDF
+import queue
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager, nullcontext
 
 # ---------------- DB CONNECTION ----------------
 # --- IMPORTANT ---
@@ -21,45 +34,1161 @@ DB_CONFIG = {
 
 SEATS_PER_COACH = 72  # Change this if your coach size differs
 
+# Storage backend: "mysql" (DB_CONFIG) or "sqlite", an embedded database for
+# benchmarks, CI and single-station installs that needs no server.
+DB_BACKEND = os.environ.get("RAILWAY_DB_BACKEND", "mysql")
+SQLITE_PATH = os.environ.get("RAILWAY_SQLITE_PATH", "railway_system.db")  # ":memory:" for a throwaway database
+SQLITE_WAL = True  # Write-ahead logging: readers never wait for the writer
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "railway_system.sql")
+
+# Read replicas (see READ REPLICAS): comma-separated "host[:port]" of MySQL
+# replicas, which use the DB_CONFIG credentials, or paths of SQLite files
+# kept in sync with SQLITE_PATH. Empty sends every query to the primary.
+DB_REPLICAS = [r.strip() for r in os.environ.get("RAILWAY_DB_REPLICAS", "").split(",") if r.strip()]
+REPLICA_MAX_LAG = float(os.environ.get("RAILWAY_REPLICA_MAX_LAG", 5))  # Seconds a replica may trail the primary
+# Whether this process writes the replication heartbeat; run exactly one writer per primary (e.g. the booking service)
+REPLICA_HEARTBEAT_WRITER = os.environ.get("RAILWAY_REPLICA_HEARTBEAT", "") == "1"
+
+# Connection pool settings
+DB_POOL_SIZE = 5            # Maximum number of open connections
+DB_POOL_TIMEOUT = 10        # Seconds to wait for a free connection before giving up
+DB_POOL_PING_INTERVAL = 30  # Idle seconds after which a connection is health-checked
+
+class DatabaseError(Exception):
+    """A database failure detected by this module rather than by a driver."""
+
+class PoolExhaustedError(DatabaseError):
+    """Raised when no pooled connection becomes free within the timeout."""
+
+# Errors raised by either backend; catch these instead of mysql.connector.Error.
+# mysql.connector is only imported once a MySQL backend connects (see
+# mysql_connector()), which adds its errors to both tuples.
+DB_ERRORS = (DatabaseError, sqlite3.Error)
+DB_INTEGRITY_ERRORS = (sqlite3.IntegrityError,)
+
+def mysql_connector():
+    """Imports mysql.connector on first use and registers its errors in DB_ERRORS."""
+    global DB_ERRORS, DB_INTEGRITY_ERRORS
+    import mysql.connector
+    if mysql.connector.Error not in DB_ERRORS:
+        DB_ERRORS += (mysql.connector.Error,)
+        DB_INTEGRITY_ERRORS += (mysql.connector.IntegrityError,)
+    return mysql.connector
+
 def get_db_connection():
     """Establishes and returns a database connection."""
     try:
-        return mysql.connector.connect(**DB_CONFIG)
-    except mysql.connector.Error as err:
+        return get_db_backend().connect()
+    except DB_ERRORS as err:
         messagebox.showerror("Database Error", f"Failed to connect to database: {err}")
         return None
 
-# ---------------- DATABASE UTILITIES ----------------
-def db_execute(query, params=(), fetch=None):
+# ---------------- STORAGE BACKENDS ----------------
+# A backend opens connections that behave like mysql.connector ones:
+# autocommit, start_transaction()/commit()/rollback(), in_transaction,
+# ping() and cursor() usable as a context manager. The SQL in this module is
+# written for MySQL; SQLiteBackend translates the few constructs SQLite
+# spells differently.
+class MySQLBackend:
+    """MySQL/MariaDB server reached with mysql.connector, configured by DB_CONFIG."""
+    name = "mysql"
+    max_connections = None  # No limit beyond DB_POOL_SIZE
+
+    def __init__(self, config, read_only=False):
+        self.config = dict(config)
+        self.read_only = read_only
+
+    def connect(self):
+        conn = mysql_connector().connect(**self.config)
+        conn.autocommit = True
+        if self.read_only:
+            with conn.cursor() as cursor:
+                cursor.execute("SET SESSION TRANSACTION READ ONLY")
+        return conn
+
+    @contextmanager
+    def bulk_session(self, conn):
+        """Session tuning for bulk_insert(); the server defaults are fine for MySQL."""
+        yield conn
+
+    def explain(self, cursor, query, params=()):
+        """Runs EXPLAIN on a query. Returns (index names used, plan lines)."""
+        cursor.execute("EXPLAIN " + query, params)
+        columns = [d[0].lower() for d in cursor.description]
+        rows = cursor.fetchall()
+        key = columns.index("key")
+        plan = [" ".join(f"{c}={v}" for c, v in zip(columns, r) if v is not None) for r in rows]
+        return [r[key] for r in rows if r[key]], plan
+
+    def close(self):
+        pass
+
+_ON_DUPLICATE = "ON DUPLICATE KEY UPDATE"
+_UPSERT_VALUE = re.compile(r"VALUES\((\w+)\)")
+_CAST_CHAR = re.compile(r"\bAS\s+CHAR\)", re.IGNORECASE)
+_DROP_INDEX = re.compile(r"^DROP INDEX (\w+) ON \w+$")
+_DATE_FORMAT = re.compile(r"DATE_FORMAT\(([\w.]+), ('[^']*')\)")
+_UNIX_NOW = "UNIX_TIMESTAMP(NOW(6))"
+_FOR_UPDATE = re.compile(r"\s+FOR UPDATE$")
+
+@functools.lru_cache(maxsize=512)
+def sqlite_dialect(query):
     """
-    Executes a database query and returns the result.
-    'fetch' can be 'one', 'all', or None for commit.
+    Rewrites one of this module's MySQL queries for SQLite: %s placeholders
+    become ?, ON DUPLICATE KEY UPDATE col=VALUES(col) becomes ON CONFLICT DO
+    UPDATE SET col=excluded.col, CAST(... AS CHAR) casts to TEXT,
+    DATE_FORMAT(col, fmt) becomes strftime(fmt, col), UNIX_TIMESTAMP(NOW(6))
+    the epoch seconds of julianday('now'), DROP INDEX name ON table loses
+    its table (index names are global) and a trailing FOR UPDATE is dropped
+    (transactions begin IMMEDIATE, holding the write lock).
     """
-    conn = get_db_connection()
-    if not conn:
-        return None if fetch else False
+    head, upsert, updates = query.partition(_ON_DUPLICATE)
+    if upsert:
+        query = head + "ON CONFLICT DO UPDATE SET" + _UPSERT_VALUE.sub(r"excluded.\1", updates)
+    query = _DROP_INDEX.sub(r"DROP INDEX \1", query.strip())
+    query = _DATE_FORMAT.sub(r"strftime(\2, \1)", _FOR_UPDATE.sub("", query))
+    query = query.replace(_UNIX_NOW, "((julianday('now') - 2440587.5) * 86400.0)")
+    return _CAST_CHAR.sub("AS TEXT)", query.replace("%s", "?"))
+
+class SQLiteCursor:
+    """sqlite3 cursor that accepts MySQL-style queries (see sqlite_dialect)."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, query, params=()):
+        self._cursor.execute(sqlite_dialect(query), params or ())
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(sqlite_dialect(query), rows)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SQLiteConnection:
+    """sqlite3 connection with the mysql.connector methods the pool and queries use."""
 
-    result = None
+    def __init__(self, conn, shared=False):
+        self._conn = conn
+        self._shared = shared  # The in-memory database lives as long as its one connection
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def start_transaction(self):
+        # Take the write lock up front so a transaction never fails halfway on upgrade
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def cursor(self, buffered=None):
+        return SQLiteCursor(self._conn.cursor())
+
+    def ping(self, reconnect=False):
+        self._conn.execute("SELECT 1")
+
+    def close(self):
+        if not self._shared:
+            self._conn.close()
+
+def _sqlite_time(value):
+    """TIME columns come back as timedelta, as they do from mysql.connector."""
+    h, m, s = (value.decode().split(":") + ["0", "0"])[:3]
+    return datetime.timedelta(hours=int(h), minutes=int(m), seconds=float(s))
+
+def _sqlite_time_text(value):
+    seconds = int(value.total_seconds())
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+def _register_sqlite_types():
+    """Maps DATE, TIME and DECIMAL columns to the Python types mysql.connector returns."""
+    sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+    sqlite3.register_adapter(datetime.datetime, lambda v: v.isoformat(" "))
+    sqlite3.register_adapter(datetime.timedelta, _sqlite_time_text)
+    sqlite3.register_adapter(decimal.Decimal, str)
+    sqlite3.register_converter("date", lambda v: datetime.date.fromisoformat(v.decode()))
+    sqlite3.register_converter("time", _sqlite_time)
+    sqlite3.register_converter("datetime", lambda v: datetime.datetime.fromisoformat(v.decode()))
+    # Every DECIMAL column in the schema is a decimal(10,2) amount
+    sqlite3.register_converter("decimal", lambda v: decimal.Decimal(v.decode()).quantize(decimal.Decimal("0.01")))
+
+_PLAN_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+
+_DUMP_SKIPPED = ("SET ", "START TRANSACTION", "COMMIT", "LOCK TABLES", "UNLOCK TABLES", "DROP TABLE")
+_DUMP_KEY = re.compile(r"ADD (PRIMARY KEY|UNIQUE KEY (\w+)|KEY (\w+)) \(([^)]*)\)")
+_DUMP_FOREIGN_KEY = re.compile(r"ADD CONSTRAINT \w+ FOREIGN KEY \(([^)]*)\) REFERENCES (\w+) \(([^)]*)\)(.*)")
+_DUMP_AUTO_INCREMENT = re.compile(r"MODIFY (\w+) .*AUTO_INCREMENT")
+
+def _sqlite_column(definition):
+    """Converts one MySQL column definition to SQLite."""
+    definition = re.sub(r"\b(tiny|small|medium|big)?int\(\d+\)( unsigned)?", "INTEGER", definition, flags=re.IGNORECASE)
+    definition = re.sub(r" (CHARACTER SET|COLLATE) \w+", "", definition)
+    definition = re.sub(r" ON UPDATE current_timestamp\(\)", "", definition, flags=re.IGNORECASE)
+    return re.sub(r"current_timestamp\(\)", "CURRENT_TIMESTAMP", definition, flags=re.IGNORECASE)
+
+def mysql_dump_to_sqlite(text):
+    """
+    Translates a phpMyAdmin/mysqldump file such as railway_system.sql into
+    SQLite statements: CREATE TABLE with the keys and foreign keys that the
+    dump adds by ALTER TABLE folded in, the INSERTs, then CREATE INDEX for
+    every secondary key, named as in MySQL so migrations can drop it on
+    either backend. AUTO_INCREMENT ids become INTEGER PRIMARY KEY.
+    """
+    tables = {}  # name -> {"columns", "primary", "auto", "foreign"}
+    inserts, indexes = [], []
+    lines = [l for l in text.splitlines() if not l.startswith("--") and not l.startswith("/*!")]
+    for statement in re.split(r";\s*$", "\n".join(lines), flags=re.MULTILINE):
+        statement = statement.strip()
+        if not statement or statement.upper().startswith(_DUMP_SKIPPED):
+            continue
+        if statement.startswith("INSERT"):
+            head, values, rows = statement.partition(" VALUES")
+            inserts.append(head.replace("`", '"') + values + rows.replace("\\'", "''"))
+            continue
+        statement = statement.replace("`", "")
+        if statement.startswith("CREATE TABLE"):
+            name = statement.split()[2]
+            body = statement[statement.index("(") + 1:statement.rindex(")")]
+            columns = [_sqlite_column(c.strip()) for c in body.split(",\n")]
+            tables[name] = {"columns": columns, "primary": None, "auto": None, "foreign": []}
+        elif statement.startswith("ALTER TABLE"):
+            name = statement.split()[2]
+            table = tables[name]
+            for clause in re.split(r",\n", statement.split(None, 3)[3]):
+                clause = clause.strip()
+                key = _DUMP_KEY.match(clause)
+                fk = _DUMP_FOREIGN_KEY.match(clause)
+                auto = _DUMP_AUTO_INCREMENT.match(clause)
+                if key and key.group(1) == "PRIMARY KEY":
+                    table["primary"] = key.group(4)
+                elif key:
+                    unique = "UNIQUE " if key.group(2) else ""
+                    indexes.append(f"CREATE {unique}INDEX {key.group(2) or key.group(3)} ON {name} ({key.group(4)})")
+                elif fk:
+                    table["foreign"].append(f"FOREIGN KEY ({fk.group(1)}) REFERENCES {fk.group(2)} ({fk.group(3)}){fk.group(4)}")
+                elif auto:
+                    table["auto"] = auto.group(1)
+
+    statements = []
+    for name, table in tables.items():
+        columns = list(table["columns"])
+        constraints = []
+        if table["auto"] and table["primary"] == table["auto"]:
+            # The rowid alias: ids are assigned automatically, like AUTO_INCREMENT
+            columns = [f"{table['auto']} INTEGER PRIMARY KEY" if c.split()[0] == table["auto"] else c for c in columns]
+        elif table["primary"]:
+            constraints.append(f"PRIMARY KEY ({table['primary']})")
+        statements.append(f"CREATE TABLE {name} (\n  " + ",\n  ".join(columns + constraints + table["foreign"]) + "\n)")
+    return statements + inserts + indexes
+
+class SQLiteBackend:
+    """
+    Embedded SQLite database in one file, or in memory when path is ':memory:'.
+    A new database is created from railway_system.sql and brought up to
+    SCHEMA_VERSION (see SCHEMA MIGRATIONS). File databases run in
+    WAL mode so readers proceed while one connection writes; an in-memory
+    database exists only inside a single connection, so the pool shares that
+    one connection between borrowers, one at a time. A read_only backend
+    (a replica) opens an existing file for reading and never sets it up.
+    """
+    name = "sqlite"
+
+    def __init__(self, path=SQLITE_PATH, wal=SQLITE_WAL, schema_path=SCHEMA_PATH, read_only=False):
+        _register_sqlite_types()
+        self.path = path
+        self.wal = wal
+        self.schema_path = schema_path
+        self.read_only = read_only
+        self.in_memory = path == ":memory:"
+        self.max_connections = 1 if self.in_memory else None
+        self._shared = self._open() if self.in_memory else None
+        if read_only:
+            return
+        setup = self._shared or self._open()
+        try:
+            if self.wal and not self.in_memory:
+                setup.execute("PRAGMA journal_mode=WAL")
+            if not setup.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='tickets'").fetchone():
+                self.load_schema(setup)
+                migrate_schema(SQLiteConnection(setup, shared=True))
+        finally:
+            if setup is not self._shared:
+                setup.close()
+
+    def _open(self):
+        if self.read_only and not self.in_memory:
+            from urllib.parse import quote
+            # mode=ro fails on a missing file instead of creating an empty database
+            return sqlite3.connect(f"file:{quote(os.path.abspath(self.path))}?mode=ro", uri=True,
+                                   timeout=DB_POOL_TIMEOUT, isolation_level=None,
+                                   detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        conn = sqlite3.connect(self.path, timeout=DB_POOL_TIMEOUT, isolation_level=None,
+                               detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys=ON")
+        if self.wal and not self.in_memory:
+            conn.execute("PRAGMA synchronous=NORMAL")  # Durable at checkpoints, which is safe in WAL mode
+        return conn
+
+    def load_schema(self, conn):
+        """Creates the tables, seed rows and indexes of the MySQL dump in an empty database."""
+        with open(self.schema_path, encoding="utf-8") as f:
+            statements = mysql_dump_to_sqlite(f.read())
+        conn.execute("PRAGMA foreign_keys=OFF")  # The dump inserts child rows before their parents
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.execute("PRAGMA foreign_keys=ON")
+
+    def connect(self):
+        if self.in_memory:
+            return SQLiteConnection(self._shared, shared=True)
+        return SQLiteConnection(self._open())
+
+    @contextmanager
+    def bulk_session(self, conn):
+        """Skips fsync and enlarges the page cache while bulk_insert() runs on 'conn'."""
+        raw = conn._conn
+        synchronous = raw.execute("PRAGMA synchronous").fetchone()[0]
+        raw.execute("PRAGMA synchronous=OFF")
+        raw.execute("PRAGMA cache_size=-65536")  # 64 MB
+        try:
+            yield conn
+        finally:
+            raw.execute(f"PRAGMA synchronous={int(synchronous)}")
+            raw.execute("PRAGMA cache_size=-2000")  # SQLite's default
+
+    def explain(self, cursor, query, params=()):
+        """Runs EXPLAIN QUERY PLAN on a query. Returns (index names used, plan lines)."""
+        cursor.execute("EXPLAIN QUERY PLAN " + query, params)
+        plan = [row[3] for row in cursor.fetchall()]
+        return [m.group(1) for m in map(_PLAN_INDEX.search, plan) if m], plan
+
+    def close(self):
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+def create_db_backend(name=None):
+    """Builds the backend called 'name' (default DB_BACKEND)."""
+    name = (name or DB_BACKEND).lower()
+    if name == "mysql":
+        return MySQLBackend(DB_CONFIG)
+    if name == "sqlite":
+        return SQLiteBackend(SQLITE_PATH)
+    raise ValueError(f"Unknown database backend '{name}' (expected 'mysql' or 'sqlite')")
+
+def create_replica_backends(name=None, replicas=None):
+    """Builds read-only backends for 'replicas' (default DB_REPLICAS) of backend 'name'. Returns (address, backend) pairs."""
+    name = (name or DB_BACKEND).lower()
+    backends = []
+    for address in DB_REPLICAS if replicas is None else replicas:
+        if name == "mysql":
+            host, _, port = address.partition(":")
+            config = dict(DB_CONFIG, host=host, **({"port": int(port)} if port else {}))
+            backends.append((address, MySQLBackend(config, read_only=True)))
+        elif name == "sqlite":
+            backends.append((address, SQLiteBackend(address, read_only=True)))
+        else:
+            raise ValueError(f"Unknown database backend '{name}' (expected 'mysql' or 'sqlite')")
+    return backends
+
+# ---------------- QUERY INSTRUMENTATION ----------------
+# Every query run through db_execute(), a transaction cursor or the report
+# stream is timed together with its row count, the time spent waiting for a
+# pooled connection and the window/function that issued it. Service
+# operations (login, search, book, cancel, report) get latency histograms.
+# Queries slower than SLOW_QUERY_MS are kept for the diagnostics window and,
+# if SLOW_QUERY_LOG is set, appended to that file (SQL only, never values).
+SLOW_QUERY_MS = float(os.environ.get("RAILWAY_SLOW_QUERY_MS", 200))
+SLOW_QUERY_LOG = os.environ.get("RAILWAY_SLOW_QUERY_LOG")  # File path, or None to keep them in memory only
+SLOW_QUERY_KEEP = 200         # Slow queries kept in memory
+METRIC_RECENT_SAMPLES = 1000  # Latest samples per histogram used for percentiles
+METRIC_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Seconds
+OPERATIONS = ("login", "search", "book", "cancel", "report")
+
+# Functions that only pass queries along; the caller is the first frame above them
+_QUERY_PLUMBING = {"db_execute", "_run_query", "fetch_keyset_page", "bulk_insert", "stream_ticket_view", "execute",
+                   "executemany", "add_to_rollups", "cancel_in_rollups", "confirm_in_rollups", "join_queue", "leave_queue",
+                   "_timed", "begin", "transaction", "connection", "record_query", "_query_caller", "__enter__", "__exit__"}
+_query_scope = threading.local()
+
+@contextmanager
+def query_scope(name):
+    """Attributes the queries run by this thread inside the block to 'name' (a window or API handler)."""
+    previous = getattr(_query_scope, "name", None)
+    _query_scope.name = name
     try:
-        with conn.cursor() as cursor:
-            cursor.execute(query, params)
-            if fetch == 'one':
-                result = cursor.fetchone()
-            elif fetch == 'all':
-                result = cursor.fetchall()
-            else:
-                conn.commit()
-                result = True
-    except mysql.connector.Error as err:
+        yield
+    finally:
+        _query_scope.name = previous
+
+def _query_caller():
+    """'<scope>:<function>' for the code that issued the current query."""
+    frame = sys._getframe(1)
+    while frame and (frame.f_code.co_name in _QUERY_PLUMBING or frame.f_code.co_filename.endswith("contextlib.py")):
+        frame = frame.f_back
+    function = frame.f_code.co_name if frame else "?"
+    scope = getattr(_query_scope, "name", None)
+    return f"{scope}:{function}" if scope else function
+
+class LatencyHistogram:
+    """Prometheus-style bucket counts plus the latest samples, for percentiles on screen."""
+
+    def __init__(self):
+        self.buckets = [0] * (len(METRIC_BUCKETS) + 1)  # The last bucket is +Inf
+        self.count = 0
+        self.total = 0.0
+        self.errors = 0
+        self.recent = deque(maxlen=METRIC_RECENT_SAMPLES)
+
+    def observe(self, seconds, error=False):
+        self.buckets[bisect.bisect_left(METRIC_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.errors += error
+        self.recent.append(seconds)
+
+    def summary(self):
+        """Count, errors and mean/p50/p95/p99/max of the recent samples, in milliseconds."""
+        ordered = sorted(self.recent)
+        pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000 if ordered else 0.0
+        return {"count": self.count, "errors": self.errors,
+                "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+                "p50_ms": pick(50), "p95_ms": pick(95), "p99_ms": pick(99),
+                "max_ms": ordered[-1] * 1000 if ordered else 0.0}
+
+def _prometheus_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class QueryMetrics:
+    """Thread-safe store of query timings, operation histograms and the slow-query log."""
+
+    def __init__(self, slow_ms=SLOW_QUERY_MS, slow_log=SLOW_QUERY_LOG):
+        self.slow_ms = slow_ms
+        self.slow_log = slow_log
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.queries = LatencyHistogram()
+            self.acquire = LatencyHistogram()
+            self.operations = {name: LatencyHistogram() for name in OPERATIONS}
+            self.callers = {}  # caller -> [queries, seconds, max seconds, rows]
+            self.slow_queries = deque(maxlen=SLOW_QUERY_KEEP)
+            self.slow_count = 0
+            self.started = time.time()
+
+    def record_acquire(self, seconds):
+        with self._lock:
+            self.acquire.observe(seconds)
+
+    def record_query(self, query, seconds, rows, acquire_seconds=0.0, error=False):
+        """Records one statement; 'acquire_seconds' is the pool wait that preceded it."""
+        caller = _query_caller()
+        rows = max(rows or 0, 0)
+        slow = seconds * 1000 >= self.slow_ms
+        entry = None
+        with self._lock:
+            self.queries.observe(seconds, error)
+            stats = self.callers.setdefault(caller, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+            stats[3] += rows
+            if slow:
+                entry = {"time": datetime.datetime.now(), "ms": seconds * 1000, "acquire_ms": acquire_seconds * 1000,
+                         "rows": rows, "caller": caller, "sql": " ".join(query.split())}
+                self.slow_queries.append(entry)
+                self.slow_count += 1
+        if entry and self.slow_log:
+            self._write_slow_log(entry)
+
+    def _write_slow_log(self, entry):
+        line = (f"{entry['time']:%Y-%m-%d %H:%M:%S} {entry['ms']:.1f}ms acquire={entry['acquire_ms']:.1f}ms "
+                f"rows={entry['rows']} caller={entry['caller']} {entry['sql']}\n")
+        try:
+            with self._lock, open(self.slow_log, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as err:
+            print(f"Slow query log error: {err}")
+
+    @contextmanager
+    def operation(self, name):
+        """Times the block into the histogram of service operation 'name'; exceptions count as errors."""
+        started = time.perf_counter()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            with self._lock:
+                self.operations.setdefault(name, LatencyHistogram()).observe(time.perf_counter() - started, failed)
+
+    def snapshot(self):
+        """Plain-data copy of every metric for the diagnostics window."""
+        with self._lock:
+            callers = [{"caller": c, "queries": s[0], "total_ms": s[1] * 1000, "mean_ms": s[1] / s[0] * 1000,
+                        "max_ms": s[2] * 1000, "rows": s[3]} for c, s in self.callers.items()]
+            return {
+                "since": self.started,
+                "queries": self.queries.summary(),
+                "acquire": self.acquire.summary(),
+                "operations": {name: h.summary() for name, h in self.operations.items()},
+                "callers": sorted(callers, key=lambda c: c["total_ms"], reverse=True),
+                "slow_queries": list(reversed(self.slow_queries)),
+                "slow_count": self.slow_count,
+            }
+
+    def prometheus_text(self):
+        """All metrics, plus the connection pool and replica counters, in the Prometheus text exposition format."""
+        lines = []
+
+        def histogram(name, help_text, series):
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} histogram"])
+            for labels, h in series:
+                sep = "," if labels else ""
+                cumulative = 0
+                for bound, count in zip(METRIC_BUCKETS + ("+Inf",), h.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels}{sep}le="{bound}"}} {cumulative}')
+                braces = f"{{{labels}}}" if labels else ""
+                lines.append(f"{name}_sum{braces} {h.total:.6f}")
+                lines.append(f"{name}_count{braces} {h.count}")
+
+        def counter(name, help_text, series, kind="counter"):
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"])
+            lines.extend(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}" for labels, value in series)
+
+        with self._lock:
+            operations = [(f'operation="{_prometheus_label(n)}"', h) for n, h in self.operations.items()]
+            histogram("railway_operation_duration_seconds", "Service operation latency.", operations)
+            counter("railway_operation_errors_total", "Service operations that raised an error.",
+                    [(labels, h.errors) for labels, h in operations])
+            histogram("railway_query_duration_seconds", "Database statement latency.", [("", self.queries)])
+            histogram("railway_db_acquire_duration_seconds", "Time spent waiting for a pooled connection.",
+                      [("", self.acquire)])
+            callers = [(f'caller="{_prometheus_label(c)}"', s) for c, s in sorted(self.callers.items())]
+            counter("railway_queries_total", "Statements run, by calling window/function.",
+                    [(labels, s[0]) for labels, s in callers])
+            counter("railway_query_seconds_total", "Statement time, by calling window/function.",
+                    [(labels, f"{s[1]:.6f}") for labels, s in callers])
+            counter("railway_query_rows_total", "Rows returned or affected, by calling window/function.",
+                    [(labels, s[3]) for labels, s in callers])
+            counter("railway_slow_queries_total", "Statements slower than the slow-query threshold.",
+                    [("", self.slow_count)])
+        pool = _db_pool
+        if pool is not None:
+            stats = pool.get_stats()
+            for key in ("open", "idle"):
+                counter(f"railway_db_pool_{key}_connections", f"Pool connections {key}.", [("", stats[key])], "gauge")
+            for key in ("checkouts", "waits", "exhausted", "created", "reconnects"):
+                counter(f"railway_db_pool_{key}_total", f"Pool {key}.", [("", stats[key])])
+        router = _replica_router
+        if router is not None and router.replicas:
+            stats = router.get_stats()
+            counter("railway_db_reads_total", "Read-only queries routed, by target.",
+                    [('target="primary"', stats["primary"])]
+                    + [(f'target="{_prometheus_label(r["name"])}"', r["reads"]) for r in stats["replicas"]])
+            counter("railway_db_replica_fallbacks_total", "Reads sent to the primary, by reason.",
+                    [(f'reason="{reason}"', stats[reason]) for reason in FALLBACK_REASONS])
+            counter("railway_db_replica_failovers_total", "Replica queries that failed and were retried on the primary.",
+                    [("", stats["failovers"])])
+            counter("railway_db_replica_up", "Whether the replica is in rotation.",
+                    [(f'replica="{_prometheus_label(r["name"])}"', int(r["up"])) for r in stats["replicas"]], "gauge")
+            counter("railway_db_replica_lag_seconds", "How far the replica's heartbeat trails the primary's latest.",
+                    [(f'replica="{_prometheus_label(r["name"])}"', f"{r['lag']:.3f}")
+                     for r in stats["replicas"] if r["lag"] is not None], "gauge")
+        return "\n".join(lines) + "\n"
+
+    def export_prometheus(self, path):
+        """Writes prometheus_text() to 'path' atomically (for the node_exporter textfile collector)."""
+        part_path = path + ".part"
+        with open(part_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(part_path, path)
+        return path
+
+query_metrics = QueryMetrics()
+
+def timed_operation(name):
+    """Decorator that records every call of a service function under operation 'name'."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with query_metrics.operation(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+class TimedCursor:
+    """Wraps a transaction cursor so each execute()/executemany() is recorded in query_metrics."""
+
+    def __init__(self, cursor, acquire_seconds=0.0):
+        self._cursor = cursor
+        self._acquire = acquire_seconds  # Charged to the first statement only
+
+    def _timed(self, method, query, args):
+        started = time.perf_counter()
+        try:
+            method(query, args)
+        except DB_ERRORS:
+            query_metrics.record_query(query, time.perf_counter() - started, 0, self._acquire, error=True)
+            raise
+        query_metrics.record_query(query, time.perf_counter() - started, self._cursor.rowcount, self._acquire)
+        self._acquire = 0.0
+
+    def execute(self, query, params=()):
+        self._timed(self._cursor.execute, query, params)
+
+    def executemany(self, query, rows):
+        self._timed(self._cursor.executemany, query, rows)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+# ---------------- CONNECTION POOL ----------------
+class ConnectionPool:
+    """
+    A thread-safe pool of reusable database connections from a storage backend.
+    Connections are opened lazily up to 'size', health-checked on checkout
+    and handed out in autocommit mode; use transaction() for multi-statement work.
+    """
+    def __init__(self, backend, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, ping_interval=DB_POOL_PING_INTERVAL):
+        self.backend = backend
+        self.size = min(size, backend.max_connections or size)
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self._idle = queue.LifoQueue()  # (connection, last_used) pairs, most recent first
+        self._lock = threading.Lock()
+        self._open = 0
+        self.stats = {"checkouts": 0, "waits": 0, "exhausted": 0, "created": 0, "reconnects": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _connect(self):
+        conn = self.backend.connect()
+        self._count("created")
+        return conn
+
+    def _reserve_slot(self):
+        with self._lock:
+            if self._open < self.size:
+                self._open += 1
+                return True
+            return False
+
+    def _release_slot(self):
+        with self._lock:
+            self._open -= 1
+
+    def _checkout_fresh(self):
+        try:
+            return self._connect()
+        except DB_ERRORS:
+            self._release_slot()
+            raise
+
+    def _health_check(self, conn, last_used):
+        """Pings connections that sat idle too long; reconnects if the ping fails."""
+        if time.monotonic() - last_used < self.ping_interval:
+            return conn
+        try:
+            conn.ping(reconnect=False)
+            return conn
+        except DB_ERRORS:
+            self._count("reconnects")
+            try:
+                conn.close()
+            except DB_ERRORS:
+                pass
+            return self._checkout_fresh()
+
+    def acquire(self):
+        """Borrows a connection, waiting up to 'timeout' seconds if the pool is busy."""
+        started = time.perf_counter()
+        conn = self._acquire()
+        query_metrics.record_acquire(time.perf_counter() - started)
+        return conn
+
+    def _acquire(self):
+        self._count("checkouts")
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            if self._reserve_slot():
+                return self._checkout_fresh()
+            self._count("waits")
+            try:
+                conn, last_used = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                self._count("exhausted")
+                raise PoolExhaustedError(f"No free connection after {self.timeout}s (pool size {self.size})")
+        return self._health_check(conn, last_used)
+
+    def release(self, conn):
+        """Returns a connection to the pool, discarding it if it is broken."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except DB_ERRORS:
+            self.discard(conn)
+            return
+        self._idle.put((conn, time.monotonic()))
+
+    def discard(self, conn):
+        """Closes a borrowed connection instead of returning it (e.g. one with an unread result)."""
+        try:
+            conn.close()
+        except DB_ERRORS:
+            pass
+        self._release_slot()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that borrows a connection and always gives it back."""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    @staticmethod
+    @contextmanager
+    def begin(conn, acquire_seconds=0.0):
+        """
+        Runs a transaction on a connection the caller holds. Yields a cursor
+        whose statements are recorded in query_metrics.
+        """
+        conn.start_transaction()
+        try:
+            with conn.cursor(buffered=True) as cursor:
+                yield TimedCursor(cursor, acquire_seconds)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    @contextmanager
+    def transaction(self):
+        """
+        Runs several statements on one borrowed connection as a single transaction.
+        Yields a cursor; commits on success and rolls back if the block raises.
+        """
+        started = time.perf_counter()
+        with self.connection() as conn, self.begin(conn, time.perf_counter() - started) as cursor:
+            yield cursor
+
+    def close_all(self):
+        """Closes every idle connection (e.g. on application exit)."""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.close()
+            except DB_ERRORS:
+                pass
+            self._release_slot()
+
+    def get_stats(self):
+        """Returns a snapshot of the pool counters."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open"] = self._open
+        stats["idle"] = self._idle.qsize()
+        return stats
+
+_db_backend = None
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def get_db_backend():
+    """Returns the process-wide storage backend chosen by DB_BACKEND, creating it on first use."""
+    global _db_backend
+    with _db_pool_lock:
+        if _db_backend is None:
+            _db_backend = create_db_backend()
+        return _db_backend
+
+def get_db_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _db_pool
+    backend = get_db_backend()
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ConnectionPool(backend, size=DB_POOL_SIZE)
+        return _db_pool
+
+@contextmanager
+def db_transaction():
+    """get_db_pool().transaction() that also counts as a write of the current read session."""
+    with get_db_pool().transaction() as cursor:
+        yield cursor
+    get_replica_router().wrote()
+
+# ---------------- READ REPLICAS ----------------
+# With DB_REPLICAS set, db_execute() runs read-only queries on a replica and
+# everything else on the primary. Replication lag is measured with a
+# heartbeat: one process (REPLICA_HEARTBEAT_WRITER) sets the primary's
+# replication_heartbeat row to the primary's own clock every
+# REPLICA_HEARTBEAT_INTERVAL. In every process a background thread reads
+# that row and each replica's copy of it every REPLICA_CHECK_INTERVAL; how
+# far the copy trails the primary's row is the replica's lag. All of these
+# times come from the primary's clock, so clerk machines' clocks never
+# enter into it. A replica serves a read only if it lags at most
+# REPLICA_MAX_LAG and its heartbeat is no older than the primary's time
+# just after the reading session's last write (read-your-writes: a ticket
+# shows up right after booking it). Otherwise, when the replica fails, or
+# when the heartbeat has not moved for REPLICA_MAX_LAG (no writer), the
+# primary serves the read. Routing itself only looks at that cached state,
+# so reads never wait on heartbeat queries. Reads that feed writes or
+# long-lived caches pass primary=True.
+REPLICA_HEARTBEAT_INTERVAL = 1.0  # Seconds between heartbeat writes on the primary
+REPLICA_CHECK_INTERVAL = 1.0      # Seconds between heartbeat reads on the primary and each replica
+# A healthy replica can seem to trail the primary by up to both intervals, so keep REPLICA_MAX_LAG well above their sum.
+REPLICA_RETRY_SECONDS = 30        # A failed replica is left alone this long
+READ_SESSIONS_KEEP = 10000        # Sessions whose last write time is remembered
+FALLBACK_REASONS = ("unseen_writes", "lagging", "down")  # Why a read went to the primary, most specific first
+
+HEARTBEAT_WRITE = f"UPDATE replication_heartbeat SET beat={_UNIX_NOW} WHERE id=1"
+HEARTBEAT_QUERY = "SELECT beat FROM replication_heartbeat WHERE id=1"
+PRIMARY_CLOCK_QUERY = f"SELECT {_UNIX_NOW}"
+_READ_ONLY = re.compile(r"^\s*(SELECT|WITH)\b(?!.*\bFOR\s+UPDATE\s*$)", re.IGNORECASE | re.DOTALL)
+_read_session = threading.local()
+
+@contextmanager
+def read_session(key):
+    """
+    Runs this thread's queries inside the block as session 'key' (e.g. a
+    user ID) for read-your-writes. Outside any block the session is None,
+    which stands for the whole process (the Tk app).
+    """
+    previous = getattr(_read_session, "key", None)
+    _read_session.key = key
+    try:
+        yield
+    finally:
+        _read_session.key = previous
+
+class Replica:
+    """One read replica: its connection pool, the newest primary heartbeat seen on it and its health."""
+
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.beat = None        # Heartbeat (primary epoch seconds) last read from the replica
+        self.checked = 0.0      # time.monotonic() of that read
+        self.down_until = 0.0   # time.monotonic() before which the replica is not used
+        self.reads = 0
+        self.failures = 0
+        self.error = None
+
+class ReplicaRouter:
+    """
+    Picks the replica for each read-only query, round robin, or None for the
+    primary, and keeps the last write time of every recently writing read
+    session. With replicas, start() runs a thread that keeps the primary's
+    and the replicas' heartbeats fresh, and with 'writer' also writes the
+    heartbeat.
+    """
+    def __init__(self, primary, replicas=(), max_lag=REPLICA_MAX_LAG, writer=False):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.max_lag = max_lag
+        self.writer = writer
+        self.beat = None  # Latest heartbeat (primary epoch seconds) on the primary
+        self.beat_seen = 0.0  # time.monotonic() when that heartbeat last moved
+        self._lock = threading.Lock()
+        self._next = 0
+        self._writes = OrderedDict()  # session -> primary time just after its last write, oldest first
+        self._forgotten = 0.0  # Newest write time dropped from _writes; applies to every session
+        self._stopped = threading.Event()
+        self._monitor = None
+        self.stats = {"primary": 0, "replica": 0, "failovers": 0, **{reason: 0 for reason in FALLBACK_REASONS}}
+
+    def start(self):
+        """Starts the heartbeat thread, if there are replicas and it is not running yet."""
+        with self._lock:
+            if not self.replicas or self._monitor is not None:
+                return
+            self._stopped.clear()
+            self._monitor = threading.Thread(target=self._run_monitor, name="replica-heartbeat", daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        with self._lock:
+            monitor, self._monitor = self._monitor, None
+        if monitor is not None:
+            self._stopped.set()
+            monitor.join()
+
+    def _run_monitor(self):
+        next_beat = next_check = time.monotonic()
+        if not self.writer:
+            next_beat = float("inf")
+        while not self._stopped.is_set():
+            clock = time.monotonic()
+            if clock >= next_beat:
+                next_beat = clock + REPLICA_HEARTBEAT_INTERVAL
+                self.write_heartbeat()
+            if clock >= next_check:
+                next_check = clock + REPLICA_CHECK_INTERVAL
+                if not self.writer:
+                    self.check_primary()
+                self.check_replicas()
+            self._stopped.wait(max(0.0, min(next_beat, next_check) - time.monotonic()))
+
+    def pick(self):
+        """Returns the Replica to run a read of the current session on, or None for the primary."""
+        if not self.replicas:
+            return None
+        clock = time.monotonic()
+        with self._lock:
+            written = max(self._writes.get(getattr(_read_session, "key", None), 0.0), self._forgotten)
+            reasons = set()
+            for i in range(len(self.replicas)):
+                replica = self.replicas[(self._next + i) % len(self.replicas)]
+                if replica.down_until > clock:
+                    reasons.add("down")
+                elif (replica.beat is None or self.beat is None or clock - self.beat_seen > self.max_lag
+                      or replica.beat < self.beat - self.max_lag):
+                    reasons.add("lagging")
+                elif replica.beat < written:
+                    reasons.add("unseen_writes")
+                else:
+                    self._next = (self._next + i + 1) % len(self.replicas)
+                    replica.reads += 1
+                    self.stats["replica"] += 1
+                    return replica
+            self.stats["primary"] += 1
+            self.stats[next(r for r in FALLBACK_REASONS if r in reasons)] += 1
+        return None
+
+    def write_heartbeat(self):
+        """Stamps the heartbeat with the primary's clock and records the value it wrote."""
+        try:
+            with self.primary.transaction() as cursor:
+                cursor.execute(HEARTBEAT_WRITE)
+                cursor.execute(HEARTBEAT_QUERY)
+                row = cursor.fetchone()
+        except DB_ERRORS as err:
+            print(f"Replication heartbeat error: {err}")
+            return
+        self._saw_beat(row[0] if row else None)
+
+    def check_primary(self):
+        """Reads the primary's heartbeat, as written by the heartbeat writer."""
+        try:
+            row = _run_query(self.primary, HEARTBEAT_QUERY, fetch='one')
+        except DB_ERRORS as err:
+            print(f"Replication heartbeat error: {err}")
+            return
+        self._saw_beat(row[0] if row else None)
+
+    def _saw_beat(self, beat):
+        with self._lock:
+            if beat is not None and (self.beat is None or float(beat) > self.beat):
+                self.beat = float(beat)
+                self.beat_seen = time.monotonic()
+
+    def check_replicas(self):
+        """Checks every replica that is not resting after a failure."""
+        clock = time.monotonic()
+        for replica in self.replicas:
+            if replica.down_until <= clock:
+                self.check_replica(replica)
+
+    def check_replica(self, replica):
+        """Reads the replica's copy of the heartbeat; a replica that cannot answer is marked down."""
+        try:
+            row = _run_query(replica.pool, HEARTBEAT_QUERY, fetch='one')
+        except DB_ERRORS as err:
+            self.failed(replica, err)
+            return
+        with self._lock:
+            replica.beat = float(row[0]) if row else None
+            replica.checked = time.monotonic()
+
+    def failed(self, replica, err):
+        """Takes a replica out of rotation for REPLICA_RETRY_SECONDS after a query on it failed."""
+        with self._lock:
+            replica.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+            replica.failures += 1
+            replica.error = str(err)
+            self.stats["failovers"] += 1
+        replica.pool.close_all()
+        print(f"Replica {replica.name} unavailable, reading from the primary: {err}")
+
+    def wrote(self):
+        """
+        Records that the current session has just written, so its reads wait
+        for replicas that show the write: ones holding a heartbeat stamped no
+        earlier than the primary's time, read just after the write.
+        """
+        if not self.replicas:
+            return
+        try:
+            row = _run_query(self.primary, PRIMARY_CLOCK_QUERY, fetch='one')
+        except DB_ERRORS as err:
+            print(f"Replication heartbeat error: {err}")
+            row = None
+        session = getattr(_read_session, "key", None)
+        with self._lock:
+            # Without the primary's time, wait out the longest lag a serving replica may have
+            written = float(row[0]) if row else (self.beat or 0.0) + self.max_lag
+            self._writes[session] = max(written, self._writes.get(session, 0.0))
+            self._writes.move_to_end(session)
+            # A session is forgotten once its write is older than any replica that may serve reads
+            oldest_served = self.beat - self.max_lag if self.beat is not None else 0.0
+            while self._writes and next(iter(self._writes.values())) < oldest_served:
+                self._writes.popitem(last=False)
+            while len(self._writes) > READ_SESSIONS_KEEP:
+                self._forgotten = max(self._forgotten, self._writes.popitem(last=False)[1])
+
+    def close_all(self):
+        self.stop()
+        for replica in self.replicas:
+            replica.pool.close_all()
+
+    def get_stats(self):
+        """Returns the routing counters and, per replica, its state and seconds behind the primary's heartbeat."""
+        clock = time.monotonic()
+        with self._lock:
+            stats = dict(self.stats)
+            stats["sessions"] = len(self._writes)
+            stats["replicas"] = [{"name": r.name, "up": r.down_until <= clock, "reads": r.reads,
+                                  "failures": r.failures, "error": r.error,
+                                  "lag": self.beat - r.beat if None not in (self.beat, r.beat) else None}
+                                 for r in self.replicas]
+        return stats
+
+_replica_router = None
+
+def get_replica_router():
+    """Returns the process-wide ReplicaRouter for DB_REPLICAS (with none, every query goes to the primary)."""
+    global _replica_router
+    primary = get_db_pool()
+    with _db_pool_lock:
+        if _replica_router is None:
+            replicas = [Replica(address, ConnectionPool(backend, size=DB_POOL_SIZE))
+                        for address, backend in create_replica_backends(primary.backend.name)]
+            _replica_router = ReplicaRouter(primary, replicas, REPLICA_MAX_LAG, REPLICA_HEARTBEAT_WRITER)
+            _replica_router.start()
+        return _replica_router
+
+# ---------------- DATABASE UTILITIES ----------------
+BULK_CHUNK_ROWS = 5000  # Rows per executemany() call and transaction in bulk_insert()
+
+def _run_query(pool, query, params=(), fetch=None):
+    """Runs one statement on a connection from 'pool' and records it. Raises one of DB_ERRORS on failure."""
+    requested = time.perf_counter()
+    with pool.connection() as conn:
+        started = time.perf_counter()
+        try:
+            with conn.cursor(buffered=True) as cursor:
+                cursor.execute(query, params)
+                if fetch == 'one':
+                    result = cursor.fetchone()
+                    rows = 1 if result else 0
+                elif fetch == 'all':
+                    result = cursor.fetchall()
+                    rows = len(result)
+                else:
+                    result = True
+                    rows = cursor.rowcount
+        except DB_ERRORS:
+            query_metrics.record_query(query, time.perf_counter() - started, 0, started - requested, error=True)
+            raise
+        query_metrics.record_query(query, time.perf_counter() - started, rows, started - requested)
+    return result
+
+def db_execute(query, params=(), fetch=None, primary=False):
+    """
+    Executes a database query on a pooled connection and returns the result.
+    'fetch' can be 'one', 'all', or None for commit. Read-only queries run
+    on an up-to-date replica if there is one, unless 'primary' is set.
+    """
+    read_only = _READ_ONLY.match(query)
+    try:
+        router = get_replica_router()
+        replica = router.pick() if read_only and not primary else None
+        if replica is not None:
+            try:
+                return _run_query(replica.pool, query, params, fetch)
+            except DB_ERRORS as err:
+                router.failed(replica, err)
+        result = _run_query(get_db_pool(), query, params, fetch)
+    except DB_ERRORS as err:
         print(f"Database Error: {err}")
         if fetch:
             return None
         return False
-    finally:
-        if conn.is_connected():
-            conn.close()
+    if not read_only:
+        router.wrote()
     return result
 
+def bulk_insert(query, rows, chunk_size=BULK_CHUNK_ROWS):
+    """
+    Writes an iterable of rows with chunked executemany(), one transaction per
+    chunk, on a single connection the backend tunes for bulk writes. Rows are
+    consumed lazily, so generators of any size are fine. Returns the row count.
+    Raises one of DB_ERRORS on failure; chunks already committed stay written.
+    """
+    pool = get_db_pool()
+    rows, written = iter(rows), 0
+    with pool.connection() as conn, pool.backend.bulk_session(conn):
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            with pool.begin(conn) as cursor:
+                cursor.executemany(query, chunk)
+            written += len(chunk)
+    get_replica_router().wrote()
+    return written
+
 # ---------------- GENERAL UTILITIES ----------------
 def generate_pnr():
     """Generates a random 8-character PNR."""
@@ -80,96 +1209,3153 @@ def parse_id_from_combo(text):
     except (ValueError, IndexError):
         return None
 
+# ---------------- REFERENCE DATA CACHE ----------------
+class ReferenceCache:
+    """
+    Process-wide in-memory copy of the 'stations' and 'trains' tables.
+    Both tables are loaded once on first use and answered from dictionaries;
+    the master-data windows patch or invalidate it whenever they write.
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.stations = {}  # station_id -> (station_name, station_code, city, state)
+        self.trains = {}    # train_id -> (train_name, train_type, total_seats)
+        self._stations_loaded = False
+        self._trains_loaded = False
+        self.stations_version = 0  # Bumped whenever the cached stations change (see StationIndex)
+        self.stats = {"hits": 0, "misses": 0, "loads": 0}
+
+    def _load_stations(self):
+        rows = db_execute("SELECT station_id, station_name, station_code, city, state FROM stations", fetch='all',
+                          primary=True)
+        if rows is None:
+            return False  # DB error, try again on the next lookup
+        self.stations = {r[0]: tuple(r[1:]) for r in rows}
+        self._stations_loaded = True
+        self.stations_version += 1
+        self.stats["loads"] += 1
+        return True
+
+    def _load_trains(self):
+        rows = db_execute("SELECT train_id, train_name, train_type, total_seats FROM trains", fetch='all', primary=True)
+        if rows is None:
+            return False
+        self.trains = {r[0]: tuple(r[1:]) for r in rows}
+        self._trains_loaded = True
+        self.stats["loads"] += 1
+        return True
+
+    def _ensure_stations(self):
+        if not self._stations_loaded:
+            self._load_stations()
+
+    def _ensure_trains(self):
+        if not self._trains_loaded:
+            self._load_trains()
+
+    def get_station(self, station_id):
+        """Returns the cached station row, falling back to a single-row query for unknown IDs."""
+        with self._lock:
+            self._ensure_stations()
+            row = self.stations.get(station_id)
+            if row is not None:
+                self.stats["hits"] += 1
+                return row
+            self.stats["misses"] += 1
+            found = db_execute("SELECT station_name, station_code, city, state FROM stations WHERE station_id=%s", (station_id,),
+                               fetch='one', primary=True)
+            if found:
+                self.stations[station_id] = tuple(found)
+                self.stations_version += 1
+            return found
+
+    def get_train(self, train_id):
+        """Returns the cached train row, falling back to a single-row query for unknown IDs."""
+        with self._lock:
+            self._ensure_trains()
+            row = self.trains.get(train_id)
+            if row is not None:
+                self.stats["hits"] += 1
+                return row
+            self.stats["misses"] += 1
+            found = db_execute("SELECT train_name, train_type, total_seats FROM trains WHERE train_id=%s", (train_id,),
+                               fetch='one', primary=True)
+            if found:
+                self.trains[train_id] = tuple(found)
+            return found
+
+    def station_items(self):
+        """Returns (station_id, station_name) pairs sorted by name."""
+        with self._lock:
+            self._ensure_stations()
+            self.stats["hits"] += 1
+            return sorted(((sid, row[0]) for sid, row in self.stations.items()), key=lambda item: ((item[1] or "").casefold(), item[0]))
+
+    def station_snapshot(self):
+        """Returns (version, copy of the cached stations); the version is None if they could not be loaded."""
+        with self._lock:
+            self._ensure_stations()
+            return (self.stations_version if self._stations_loaded else None), dict(self.stations)
+
+    def train_items(self):
+        """Returns (train_id, train_name) pairs sorted by name."""
+        with self._lock:
+            self._ensure_trains()
+            self.stats["hits"] += 1
+            return sorted(((tid, row[0]) for tid, row in self.trains.items()), key=lambda item: ((item[1] or "").casefold(), item[0]))
+
+    # --- Write-through patching used by the master-data windows ---
+    def put_station(self, station_id, station_name, station_code, city, state):
+        with self._lock:
+            if self._stations_loaded:
+                self.stations[station_id] = (station_name, station_code, city, state)
+                self.stations_version += 1
+
+    def put_train(self, train_id, train_name, train_type, total_seats):
+        with self._lock:
+            if self._trains_loaded:
+                self.trains[train_id] = (train_name, train_type, total_seats)
+
+    def remove_station(self, station_id):
+        with self._lock:
+            if self.stations.pop(station_id, None) is not None:
+                self.stations_version += 1
+
+    def remove_train(self, train_id):
+        with self._lock:
+            self.trains.pop(train_id, None)
+
+    def invalidate(self, stations=True, trains=True):
+        """Drops cached tables so they are reloaded lazily on the next lookup."""
+        with self._lock:
+            if stations:
+                self._stations_loaded = False
+                self.stations = {}
+                self.stations_version += 1
+            if trains:
+                self._trains_loaded = False
+                self.trains = {}
+
+    def reload(self):
+        """Forces an immediate reload of both tables."""
+        with self._lock:
+            return self._load_stations() and self._load_trains()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["stations"] = len(self.stations)
+            stats["trains"] = len(self.trains)
+            return stats
+
+reference_cache = ReferenceCache()
+
 # ---------------- DATA LOOKUPS ----------------
 def get_station_name_by_id(station_id):
-    """Fetches a station name by its ID."""
-    row = db_execute("SELECT station_name FROM stations WHERE station_id=%s", (station_id,), fetch='one')
+    """Returns a station name by its ID from the reference cache."""
+    row = reference_cache.get_station(station_id)
     return row[0] if row else str(station_id)
 
 def get_train_name_by_id(train_id):
-    """Fetches a train name by its ID."""
-    row = db_execute("SELECT train_name FROM trains WHERE train_id=%s", (train_id,), fetch='one')
+    """Returns a train name by its ID from the reference cache."""
+    row = reference_cache.get_train(train_id)
     return row[0] if row else str(train_id)
 
-def get_stations_for_combobox():
-    """Fetches all stations for combobox display."""
-    rows = db_execute("SELECT station_id, station_name FROM stations ORDER BY station_name", fetch='all')
-    return [f"{r[0]} - {r[1]}" for r in rows] if rows else []
-
 def get_trains_for_combobox():
-    """Fetches all trains for combobox display."""
-    rows = db_execute("SELECT train_id, train_name FROM trains ORDER BY train_name", fetch='all')
-    return [f"{r[0]} - {r[1]}" for r in rows] if rows else []
-
-def search_trains_between_stations(from_station_id, to_station_id):
+    """Returns all trains for combobox display."""
+    return [f"{tid} - {name}" for tid, name in reference_cache.train_items()]
+
+# ---------------- STATION SEARCH INDEX ----------------
+# Type-ahead for the station pickers. Every word of a station's name, code
+# and city goes into one sorted list, so the stations with a word starting
+# with a typed word are a single bisect range; names are kept sorted too,
+# so stations whose name starts with the query need no ranking at all. A
+# query word that starts no station word is taken as a misspelling and
+# looked up again with one letter replaced, added, dropped or swapped.
+# Built from the reference cache on first use and rebuilt when it changes.
+STATION_SUGGESTIONS = 10  # Matches offered per keystroke
+TYPO_MIN_LENGTH = 4  # Shorter query words are matched by prefix only
+CODE, NAME, CITY, TYPO = 0, 1, 2, 3  # How a query word matched a station, best first
+_SEARCH_WORD = re.compile(r"\w+")
+
+def search_words(text):
+    """Case-folded words of a station field or search query."""
+    return _SEARCH_WORD.findall((text or "").casefold())
+
+def typo_variants(word, alphabet):
+    """Words one typo away from 'word' (a letter replaced, added, dropped or swapped), keeping its first letter."""
+    variants = set()
+    for i in range(1, len(word)):
+        head, tail = word[:i], word[i:]
+        variants.add(head + tail[1:])
+        variants.update(head + c + tail[1:] for c in alphabet)
+        variants.update(head + c + tail for c in alphabet)
+        if len(tail) > 1:
+            variants.add(head + tail[1] + tail[0] + tail[2:])
+    variants.discard(word)
+    return variants
+
+class StationIndex:
     """
-    Finds all trains that travel from a given station to a destination station.
-    Ensures the 'from' station appears before the 'to' station in the schedule.
+    In-memory station search over the reference cache. search() ranks an
+    exact station code first, then names starting with the query, then
+    stations whose name or code words start with every query word, then
+    those matched through their city, then misspellings.
+    """
+    def __init__(self, cache):
+        self.cache = cache
+        self.version = None  # reference_cache.stations_version the index was built from
+        self._lock = threading.Lock()
+        self.build({})
+
+    def build(self, stations):
+        """Indexes {station_id: (station_name, station_code, city, state)}."""
+        entries, names, codes = [], [], {}
+        for sid, (name, code, city, _state) in stations.items():
+            name_words, code_words, city_words = search_words(name), search_words(code), search_words(city)
+            entries.extend((word, CODE, sid) for word in code_words)
+            entries.extend((word, NAME, sid) for word in name_words)
+            entries.extend((word, CITY, sid) for word in city_words)
+            names.append((" ".join(name_words), sid))
+            codes.setdefault(" ".join(code_words), []).append(sid)
+        entries.sort()
+        names.sort()
+        self.rows = stations
+        self.words = [word for word, _, _ in entries]
+        self.postings = [(field, sid) for _, field, sid in entries]
+        self.alphabet = sorted(set(itertools.chain.from_iterable(self.words)))
+        self.names = names
+        self.codes = codes
+        self.rank_of = {sid: i for i, (_, sid) in enumerate(names)}  # Alphabetical tie-break
+
+    def sync(self):
+        """Rebuilds the index if the cached stations changed since it was built."""
+        if self.version is not None and self.version == self.cache.stations_version:
+            return
+        with self._lock:
+            version, stations = self.cache.station_snapshot()
+            if version is None or version != self.version:
+                self.build(stations)
+                self.version = version
+
+    def _prefix(self, word, within):
+        """{station_id: best field} of the stations (of 'within', if given) with a word starting with 'word'."""
+        lo = bisect.bisect_left(self.words, word)
+        hi = bisect.bisect_left(self.words, word + "\uffff", lo)
+        found = {}
+        for field, sid in self.postings[lo:hi]:
+            if (within is None or sid in within) and found.get(sid, TYPO) > field:
+                found[sid] = field
+        return found
+
+    def _misspelt(self, word, within):
+        """{station_id: TYPO} of the stations (of 'within', if given) with a word starting one typo from 'word'."""
+        found = {}
+        for variant in typo_variants(word, self.alphabet):
+            lo = bisect.bisect_left(self.words, variant)
+            if lo == len(self.words) or not self.words[lo].startswith(variant):
+                continue
+            hi = bisect.bisect_left(self.words, variant + "\uffff", lo)
+            found.update((sid, TYPO) for _, sid in self.postings[lo:hi] if within is None or sid in within)
+        return found
+
+    def _word_matches(self, words):
+        """
+        {station_id: worst field} of the stations matching every query word,
+        by prefix or else, for longer words, as a misspelling.
+        """
+        matches = None
+        for word in sorted(set(words), key=len, reverse=True):  # Longest (most selective) first
+            found = self._prefix(word, matches)
+            if not found and len(word) >= TYPO_MIN_LENGTH:
+                found = self._misspelt(word, matches)
+            if matches is not None:
+                found = {sid: max(field, matches[sid]) for sid, field in found.items()}
+            matches = found
+            if not matches:
+                break
+        return matches
+
+    def _name_matches(self, phrase, limit):
+        """Up to 'limit' stations whose name starts with 'phrase', alphabetically."""
+        start = bisect.bisect_left(self.names, (phrase,))
+        return [sid for name, sid in self.names[start:start + limit] if name.startswith(phrase)]  # Contiguous
+
+    def search(self, query, limit=STATION_SUGGESTIONS):
+        """Best matches for 'query' as (station_id, station_name, station_code, city) tuples."""
+        self.sync()
+        words = search_words(query)
+        if not words:
+            return []
+        phrase = " ".join(words)
+        with self._lock:
+            found = self.codes.get(phrase, [])[:limit]
+            found += [sid for sid in self._name_matches(phrase, limit) if sid not in found][:limit - len(found)]
+            if len(found) < limit:
+                matches = self._word_matches(words)
+                rest = [sid for sid in matches if sid not in found]
+                found += heapq.nsmallest(limit - len(found), rest, key=lambda sid: (max(matches[sid], NAME), self.rank_of[sid]))
+            return [(sid, *self.rows[sid][:3]) for sid in found]
+
+    def label(self, station_id):
+        """The picker value of an indexed station, or None."""
+        row = self.rows.get(station_id)
+        return station_label(station_id, row[0]) if row else None
+
+station_index = StationIndex(reference_cache)
+
+def station_label(station_id, station_name):
+    """The 'ID - Name' value station pickers hold (see parse_id_from_combo)."""
+    return f"{station_id} - {station_name}"
+
+# ---------------- KEYSET PAGINATION ----------------
+def build_keyset_query(select_from, key_columns, filters=(), params=(), descending=False,
+                       cursor=None, direction="next", limit=None):
     """
-    query = """
+    Adds keyset pagination to a 'SELECT ... FROM ...' statement.
+    Rows are ordered by 'key_columns'; 'cursor' is the key of the last row
+    (direction 'next') or the first row (direction 'prev') already shown.
+    'prev' pages come back in reverse order, see fetch_keyset_page().
+    Returns (query, params).
+    """
+    filters, params = list(filters), list(params)
+    if cursor is not None:
+        op = ">" if (direction == "next") != descending else "<"
+        clauses = []
+        for i, column in enumerate(key_columns):
+            parts = [f"{c}=%s" for c in key_columns[:i]] + [f"{column} {op} %s"]
+            clauses.append("(" + " AND ".join(parts) + ")")
+            params.extend(cursor[:i + 1])
+        filters.append("(" + " OR ".join(clauses) + ")")
+
+    query = select_from
+    if filters:
+        query += " WHERE " + " AND ".join(filters)
+    order_desc = descending if direction == "next" else not descending
+    query += " ORDER BY " + ", ".join(f"{c} {'DESC' if order_desc else 'ASC'}" for c in key_columns)
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return query, tuple(params)
+
+def fetch_keyset_page(select_from, key_columns, filters=(), params=(), descending=False,
+                      cursor=None, direction="next", limit=None):
+    """Runs build_keyset_query() and returns the page in display order (None on DB error)."""
+    query, query_params = build_keyset_query(select_from, key_columns, filters, params, descending, cursor, direction, limit)
+    rows = db_execute(query, query_params, fetch='all')
+    if rows is not None and direction == "prev":
+        rows.reverse()
+    return rows
+
+# ---------------- TICKET VIEW QUERIES ----------------
+# Column order of every row returned by build_ticket_view_query()
+TICKET_VIEW_COLUMNS = ("pnr", "passenger_name", "train_name", "from_station", "to_station",
+                       "seat_number", "class_type", "status", "booking_date", "ticket_id", "journey_date")
+# Keyset order of the ticket view, newest booking first
+TICKET_VIEW_KEY = ("tk.booking_date", "tk.ticket_id")
+
+def ticket_view_key(row):
+    """Returns the keyset cursor of a ticket view row."""
+    return (row[8], row[9])
+
+def build_ticket_view_query(train_id=None, status=None, date_from=None, date_to=None, passenger_id=None,
+                            cursor=None, direction="next", limit=None):
+    """
+    Builds one joined query that returns fully hydrated ticket rows
+    (train and station names instead of IDs) in TICKET_VIEW_COLUMNS order,
+    newest booking first. Only the filters that are not None are applied;
+    cursor/direction/limit select one keyset page. Returns (query, params).
+    """
+    select_from = """
     SELECT
+        tk.pnr,
+        tk.passenger_name,
+        COALESCE(tr.train_name, CAST(tk.train_id AS CHAR)),
+        COALESCE(fs.station_name, CAST(tk.from_station AS CHAR)),
+        COALESCE(ts.station_name, CAST(tk.to_station AS CHAR)),
+        tk.seat_number,
+        tk.class_type,
+        tk.status,
+        tk.booking_date,
+        tk.ticket_id,
+        tk.journey_date
+    FROM tickets AS tk
+    LEFT JOIN trains AS tr ON tr.train_id = tk.train_id
+    LEFT JOIN stations AS fs ON fs.station_id = tk.from_station
+    LEFT JOIN stations AS ts ON ts.station_id = tk.to_station
+    """
+    filters, params = [], []
+    if train_id is not None:
+        filters.append("tk.train_id=%s"); params.append(train_id)
+    if status:
+        filters.append("tk.status=%s"); params.append(status)
+    if date_from:
+        filters.append("tk.booking_date >= %s"); params.append(date_from)
+    if date_to:
+        filters.append("tk.booking_date <= %s"); params.append(date_to)
+    if passenger_id is not None:
+        filters.append("tk.passenger_id=%s"); params.append(passenger_id)
+
+    return build_keyset_query(select_from, TICKET_VIEW_KEY, filters, params, descending=True,
+                              cursor=cursor, direction=direction, limit=limit)
+
+def fetch_ticket_view(**filters):
+    """Runs build_ticket_view_query() and returns the hydrated rows in display order (None on DB error)."""
+    query, params = build_ticket_view_query(**filters)
+    rows = db_execute(query, params, fetch='all')
+    if rows is not None and filters.get("direction") == "prev":
+        rows.reverse()
+    return rows
+
+# ---------------- REPORT EXPORT ----------------
+EXPORT_CHUNK_ROWS = 1000  # Rows fetched from the server and written per chunk
+# Columns of the on-screen report (every ticket view column but the keyset tiebreaker)
+REPORT_COLUMNS = TICKET_VIEW_COLUMNS[:9] + TICKET_VIEW_COLUMNS[10:]
+REPORT_HEADINGS = ("PNR", "Passenger", "Train", "From", "To", "Seat", "Class", "Status", "Booking Date", "Journey Date")
+
+class ExportCancelled(Exception):
+    """Raised by export_ticket_view() when the caller cancels the export."""
+
+def count_ticket_view(**filters):
+    """Returns how many rows build_ticket_view_query() would return (None on DB error)."""
+    query, params = build_ticket_view_query(**filters)
+    row = db_execute(f"SELECT COUNT(*) FROM ({query}) AS report", params, fetch='one')
+    return row[0] if row else None
+
+def stream_ticket_view(chunk_size=EXPORT_CHUNK_ROWS, **filters):
+    """
+    Yields ticket view rows in lists of up to chunk_size. The query runs on an
+    unbuffered cursor, so rows stream from the server and only one chunk is
+    held in memory. A connection left with unread rows (the consumer stopped
+    early) is closed rather than returned to the pool. The query runs on a
+    replica when one is up to date.
+    """
+    query, params = build_ticket_view_query(**filters)
+    router = get_replica_router()
+    replica = router.pick()
+    requested = time.perf_counter()
+    conn = None
+    if replica is not None:
+        pool = replica.pool
+        try:
+            conn = pool.acquire()
+        except DB_ERRORS as err:
+            router.failed(replica, err)
+    if conn is None:
+        pool = get_db_pool()
+        conn = pool.acquire()
+    acquired = time.perf_counter()
+    finished = False
+    busy, streamed = 0.0, 0  # Time spent in the database (not in the consumer) and rows so far
+    try:
+        cursor = conn.cursor(buffered=False)
+        cursor.execute(query, params)
+        busy = time.perf_counter() - acquired
+        while True:
+            started = time.perf_counter()
+            rows = cursor.fetchmany(chunk_size)
+            busy += time.perf_counter() - started
+            if not rows:
+                break
+            streamed += len(rows)
+            yield rows
+        cursor.close()
+        finished = True
+    finally:
+        query_metrics.record_query(query, busy, streamed, acquired - requested)
+        if finished:
+            pool.release(conn)
+        else:
+            pool.discard(conn)
+
+def report_row(row):
+    """Formats a ticket view row the way the on-screen report shows it."""
+    return row[:5] + (row[5] or "",) + row[6:8] + (str(row[8]), str(row[10]))
+
+class ExportWriter:
+    """Writes rows as CSV (with a heading row) or as JSON Lines objects keyed by 'columns'."""
+
+    def __init__(self, f, as_json, columns, headings):
+        self.f = f
+        self.columns = columns
+        self.csv = None if as_json else csv.writer(f)
+        if self.csv:
+            self.csv.writerow(headings)
+
+    def write(self, rows):
+        if self.csv:
+            self.csv.writerows(rows)
+        else:
+            self.f.writelines(json.dumps(dict(zip(self.columns, r)), ensure_ascii=False, default=str) + "\n"
+                              for r in rows)
+
+@contextmanager
+def export_file(path, columns, headings):
+    """
+    Opens an ExportWriter on 'path'. The format follows the file name: '.csv'
+    or '.jsonl', gzip-compressed when it ends in '.gz'. Rows go to a '.part'
+    file that only replaces 'path' once the block completes without error.
+    """
+    name = path[:-3] if path.endswith(".gz") else path
+    opener = gzip.open if path.endswith(".gz") else open
+    part_path = path + ".part"
+    try:
+        with opener(part_path, "wt", newline="", encoding="utf-8") as f:
+            yield ExportWriter(f, name.lower().endswith(".jsonl"), columns, headings)
+        os.replace(part_path, path)
+    except BaseException:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+def export_ticket_view(path, filters, progress=None, cancel_event=None, chunk_size=EXPORT_CHUNK_ROWS):
+    """
+    Streams the filtered report to 'path' (see export_file()) without
+    loading it into memory. progress(rows_written) is called after every
+    chunk and setting cancel_event stops the export with ExportCancelled.
+    Returns the number of rows written.
+    """
+    written = 0
+    with export_file(path, REPORT_COLUMNS, REPORT_HEADINGS) as writer, \
+         closing(stream_ticket_view(chunk_size, **filters)) as chunks:
+        for rows in chunks:
+            if cancel_event is not None and cancel_event.is_set():
+                raise ExportCancelled(f"Export cancelled after {written} rows")
+            writer.write(report_row(r) for r in rows)
+            written += len(rows)
+            if progress:
+                progress(written)
+    return written
+
+# ---------------- ORIGIN-DESTINATION INDEX ----------------
+# train_od_index holds one row per (train, boarding stop, later stop) pair so
+# that a route search is a single indexed lookup instead of a schedule self-join.
+OD_INDEX_INSERT = """
+    INSERT INTO train_od_index (train_id, from_station, to_station, from_sequence, to_sequence, departure_time, arrival_time)
+    SELECT s1.train_id, s1.station_id, s2.station_id, s1.sequence, s2.sequence, s1.departure_time, s2.arrival_time
+    FROM train_schedule AS s1
+    JOIN train_schedule AS s2 ON s1.train_id = s2.train_id AND s1.sequence < s2.sequence
+"""
+
+def refresh_od_index(cursor, train_id=None):
+    """Rebuilds the OD pairs of one train (or of every train) using the given transaction cursor."""
+    if train_id is None:
+        cursor.execute("DELETE FROM train_od_index")
+        cursor.execute(OD_INDEX_INSERT)
+    else:
+        cursor.execute("DELETE FROM train_od_index WHERE train_id=%s", (train_id,))
+        cursor.execute(OD_INDEX_INSERT + " WHERE s1.train_id=%s", (train_id,))
+
+def rebuild_od_index():
+    """Recomputes the whole OD index from train_schedule. Returns True on success."""
+    try:
+        with db_transaction() as cursor:
+            refresh_od_index(cursor)
+    except DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        return False
+    return True
+
+def apply_schedule_change(query, params, train_id):
+    """Runs a train_schedule write and refreshes that train's OD pairs in the same transaction."""
+    try:
+        with db_transaction() as cursor:
+            cursor.execute(query, params)
+            refresh_od_index(cursor, train_id)
+    except DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        return False
+    journey_planner.refresh_train(train_id)
+    return True
+
+ROUTE_SEARCH_QUERY = """
+    SELECT DISTINCT
         t.train_id,
         t.train_name,
         t.train_type,
-        s1.departure_time,
-        s2.arrival_time
-    FROM trains AS t
-    JOIN train_schedule AS s1 ON t.train_id = s1.train_id
-    JOIN train_schedule AS s2 ON t.train_id = s2.train_id
-    WHERE
-        s1.station_id = %s AND
-        s2.station_id = %s AND
-        s1.sequence < s2.sequence
-    GROUP BY t.train_id, t.train_name, t.train_type, s1.departure_time, s2.arrival_time
-    """
-    return db_execute(query, (from_station_id, to_station_id), fetch='all')
+        od.departure_time,
+        od.arrival_time
+    FROM train_od_index AS od
+    JOIN trains AS t ON t.train_id = od.train_id
+    WHERE od.from_station = %s AND od.to_station = %s
+    """
+
+def search_trains_between_stations(from_station_id, to_station_id):
+    """
+    Finds all trains that travel from a given station to a destination station.
+    Looks the pair up in train_od_index, where 'from' is always before 'to'.
+    """
+    return db_execute(ROUTE_SEARCH_QUERY, (from_station_id, to_station_id), fetch='all')
+
+# Seats held per class of a set of trains on one journey date; {placeholders} is one %s per train.
+# Reads only that date's range of the seat_claims key, never the ticket history.
+BOOKED_BY_CLASS_QUERY = """SELECT train_id, class_type, COUNT(*) FROM seat_claims
+    WHERE journey_date=%s AND train_id IN ({placeholders})
+    GROUP BY train_id, class_type"""
+
+def search_with_availability(from_station_id, to_station_id, journey_date=None):
+    """
+    Finds trains between two stations together with their seat availability
+    on 'journey_date' (default today). Uses the route search plus one batched
+    count query for all matching trains. Returns a list of dicts (None on DB
+    error); 'booked_by_class' maps class type to its confirmed seats and
+    'available_by_class' to the seats still free.
+    """
+    trains = search_trains_between_stations(from_station_id, to_station_id)
+    if not trains:
+        return trains
+
+    journey_date = journey_date or datetime.date.today()
+    train_ids = sorted({t[0] for t in trains})
+    placeholders = ", ".join(["%s"] * len(train_ids))
+    counts = db_execute(BOOKED_BY_CLASS_QUERY.format(placeholders=placeholders), (journey_date, *train_ids), fetch='all')
+    if counts is None:
+        return None
+
+    booked_by_class = {}
+    for train_id, class_type, count in counts:
+        booked_by_class.setdefault(train_id, {})[class_type] = count
+
+    results = []
+    for train_id, train_name, train_type, dep, arr in trains:
+        train = reference_cache.get_train(train_id)
+        total_seats = (train[2] if train else 0) or 0
+        by_class = booked_by_class.get(train_id, {})
+        available_by_class = {class_type: max(0, seats - by_class.get(class_type, 0))
+                              for class_type, seats in class_seat_counts(total_seats).items()}
+        results.append({
+            "train_id": train_id,
+            "train_name": train_name,
+            "train_type": train_type,
+            "departure_time": dep,
+            "arrival_time": arr,
+            "journey_date": journey_date,
+            "total_seats": total_seats,
+            "booked": sum(by_class.values()),
+            "available": sum(available_by_class.values()),
+            "booked_by_class": by_class,
+            "available_by_class": available_by_class
+        })
+    return results
+
+# ---------------- JOURNEY PLANNER ----------------
+MINUTES_PER_DAY = 24 * 60
+MIN_TRANSFER_MINUTES = 15  # Default minimum time to change trains at a station
+
+def time_to_minutes(value):
+    """Converts a TIME column value (timedelta, time or 'HH:MM[:SS]' string) to minutes after midnight."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.timedelta):
+        return int(value.total_seconds()) // 60
+    if isinstance(value, datetime.time):
+        return value.hour * 60 + value.minute
+    parts = str(value).split(":")
+    try:
+        return int(parts[0]) * 60 + int(parts[1])
+    except (ValueError, IndexError):
+        return None
+
+def format_journey_time(minutes):
+    """Formats absolute journey minutes as 'HH:MM', with a '+N' suffix for later days."""
+    day, minute_of_day = divmod(int(minutes), MINUTES_PER_DAY)
+    text = f"{minute_of_day // 60:02d}:{minute_of_day % 60:02d}"
+    return f"{text} (+{day})" if day else text
+
+class JourneyPlanner:
+    """
+    RAPTOR-style planner for direct and connecting journeys over train_schedule.
+    Every train is treated as a route that runs once a day; stop times are stored
+    as minutes from the train's origin-day midnight so overnight runs roll over.
+    The timetable is loaded once and refreshed per train on schedule edits.
+    """
+    def __init__(self, min_transfer=MIN_TRANSFER_MINUTES):
+        self._lock = threading.Lock()
+        self.min_transfer = min_transfer
+        self.transfer_minutes = {}  # station_id -> minimum change time override
+        self.routes = {}            # train_id -> [(station_id, arrival, departure), ...]
+        self.station_routes = {}    # station_id -> {train_id: first stop index}
+        self._loaded = False
+
+    @staticmethod
+    def build_route(stops):
+        """Turns ordered (station_id, arrival_time, departure_time) rows into monotonic stop offsets."""
+        route, day, last = [], 0, -1
+        for station_id, arrival, departure in stops:
+            arr = time_to_minutes(arrival)
+            dep = time_to_minutes(departure)
+            if arr is None and dep is None:
+                continue  # No timing at this stop, it cannot be used for boarding or alighting
+            times = []
+            for t in (arr if arr is not None else dep, dep if dep is not None else arr):
+                t += day * MINUTES_PER_DAY
+                while t < last:  # Crossed midnight
+                    day += 1
+                    t += MINUTES_PER_DAY
+                last = t
+                times.append(t)
+            route.append((station_id, times[0], times[1]))
+        return route
+
+    def _index_route(self, train_id, route):
+        self.routes[train_id] = route
+        for i, (station_id, _, _) in enumerate(route):
+            self.station_routes.setdefault(station_id, {}).setdefault(train_id, i)
+
+    def _unindex_route(self, train_id):
+        for station_id, _, _ in self.routes.pop(train_id, ()):
+            trains = self.station_routes.get(station_id)
+            if trains:
+                trains.pop(train_id, None)
+
+    def load(self, rows=None):
+        """
+        Loads the full timetable. 'rows' are (train_id, station_id, arrival_time,
+        departure_time) ordered by train and sequence; fetched from the DB if omitted.
+        """
+        if rows is None:
+            rows = db_execute("""SELECT train_id, station_id, arrival_time, departure_time
+                                 FROM train_schedule ORDER BY train_id, sequence""", fetch='all', primary=True)
+            if rows is None:
+                return False
+        stops_by_train = {}
+        for train_id, station_id, arrival, departure in rows:
+            stops_by_train.setdefault(train_id, []).append((station_id, arrival, departure))
+        with self._lock:
+            self.routes, self.station_routes = {}, {}
+            for train_id, stops in stops_by_train.items():
+                self._index_route(train_id, self.build_route(stops))
+            self._loaded = True
+        return True
+
+    def refresh_train(self, train_id):
+        """Reloads one train's stops after a schedule edit."""
+        if not self._loaded:
+            return
+        rows = db_execute("""SELECT station_id, arrival_time, departure_time
+                             FROM train_schedule WHERE train_id=%s ORDER BY sequence""", (train_id,), fetch='all',
+                          primary=True)
+        with self._lock:
+            if rows is None:
+                self._loaded = False  # Fall back to a full reload on the next query
+                return
+            self._unindex_route(train_id)
+            if rows:
+                self._index_route(train_id, self.build_route(rows))
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded = False
+
+    def _transfer(self, station_id):
+        return self.transfer_minutes.get(station_id, self.min_transfer)
+
+    def plan(self, from_station, to_station, depart_after=0, max_changes=2):
+        """
+        Returns the Pareto-optimal itineraries (fewer changes vs. earlier arrival)
+        with at most 'max_changes' changes, leaving 'from_station' no earlier than
+        'depart_after' minutes past midnight on day 0.
+        Each itinerary is a dict with 'changes', 'departure', 'arrival' and 'legs'.
+        """
+        if not self._loaded and not self.load():
+            return []
+        with self._lock:
+            rounds = max_changes + 1
+            # Only trains that reach the destination matter in the last round, and only
+            # trains that feed those trains matter in the round before it.
+            target_trains = self.station_routes.get(to_station, {})
+            feeders = {to_station}
+            for train_id, idx in target_trains.items():
+                feeders.update(station_id for station_id, _, _ in self.routes[train_id][:idx])
+            feeder_trains = set()
+            for station_id in feeders:
+                feeder_trains.update(self.station_routes.get(station_id, ()))
+
+            labels = {from_station: depart_after}  # Earliest known arrival per station
+            parents = [{}]                           # Per round: station -> (train_id, board_idx, alight_idx, day)
+            marked = {from_station}
+            itineraries = []
+            inf = float("inf")
+
+            for k in range(1, rounds + 1):
+                if k == rounds:
+                    allowed_trains, useful = target_trains, {to_station}
+                elif k == rounds - 1:
+                    allowed_trains, useful = feeder_trains, feeders
+                else:
+                    allowed_trains, useful = None, None
+
+                previous = {station_id: labels[station_id] for station_id in marked}
+                queue = {}
+                for station_id in marked:
+                    for train_id, idx in self.station_routes.get(station_id, {}).items():
+                        if allowed_trains is not None and train_id not in allowed_trains:
+                            continue
+                        if idx < queue.get(train_id, inf):
+                            queue[train_id] = idx
+
+                round_parents, marked = {}, set()
+                for train_id, start in queue.items():
+                    route = self.routes[train_id]
+                    day = board_idx = board_station = None
+                    for i in range(start, len(route)):
+                        station_id, arr, dep = route[i]
+                        if day is not None and station_id != board_station and (useful is None or station_id in useful):
+                            arrival = day * MINUTES_PER_DAY + arr
+                            if arrival < labels.get(station_id, inf) and arrival < labels.get(to_station, inf):
+                                labels[station_id] = arrival
+                                round_parents[station_id] = (train_id, board_idx, i, day)
+                                marked.add(station_id)
+                        ready = previous.get(station_id)
+                        if ready is None:
+                            continue
+                        if k > 1:
+                            ready += self._transfer(station_id)
+                        board_day = -((dep - ready) // MINUTES_PER_DAY)  # ceil((ready - dep) / day)
+                        if day is None or board_day < day:
+                            day, board_idx, board_station = board_day, i, station_id
+                parents.append(round_parents)
+
+                if to_station in round_parents:
+                    itineraries.append(self._reconstruct(parents, k, to_station))
+                if not marked:
+                    break
+            return itineraries
+
+    def _reconstruct(self, parents, k, station_id):
+        legs = []
+        while k > 0:
+            parent = parents[k].get(station_id)
+            if parent is None:
+                k -= 1  # Label was set in an earlier round
+                continue
+            train_id, board_idx, alight_idx, day = parent
+            route = self.routes[train_id]
+            legs.append({
+                "train_id": train_id,
+                "from_station": route[board_idx][0],
+                "to_station": route[alight_idx][0],
+                "departure": day * MINUTES_PER_DAY + route[board_idx][2],
+                "arrival": day * MINUTES_PER_DAY + route[alight_idx][1]
+            })
+            station_id = route[board_idx][0]
+            k -= 1
+        legs.reverse()
+        return {
+            "changes": len(legs) - 1,
+            "departure": legs[0]["departure"],
+            "arrival": legs[-1]["arrival"],
+            "legs": legs
+        }
+
+journey_planner = JourneyPlanner()
+
+def plan_journeys(from_station_id, to_station_id, depart_after=0, max_changes=2):
+    """Shortcut for journey_planner.plan()."""
+    return journey_planner.plan(from_station_id, to_station_id, depart_after, max_changes)
 
 # ---------------- SEAT ALLOCATION LOGIC ----------------
-def get_next_available_seat(train_id):
+# Each class has its own coaches, numbered from 1 with the class's prefix
+# ('S3-10' Sleeper, 'A1-5' AC, 'G2-40' General), and gets this share of the
+# train's total_seats; the remainder left by rounding goes to the first class.
+CLASS_SEATS = {"Sleeper": ("S", 0.5), "AC": ("A", 0.25), "General": ("G", 0.25)}
+SEAT_PATTERN = re.compile(r"^([A-Z])(\d+)-(\d+)$", re.IGNORECASE)
+
+def class_seat_counts(total_seats):
+    """Splits a train's seats between the classes. Returns {class_type: seats}."""
+    counts = {class_type: int((total_seats or 0) * share) for class_type, (_, share) in CLASS_SEATS.items()}
+    first = next(iter(counts))
+    counts[first] += (total_seats or 0) - sum(counts.values())
+    return counts
+
+def class_capacity(train_id, class_type):
+    """Seats of one class on a train (0 for an unknown train or class)."""
+    train = reference_cache.get_train(train_id)
+    return class_seat_counts(train[2]).get(class_type, 0) if train else 0
+
+def seat_prefix(class_type):
+    return CLASS_SEATS[class_type][0] if class_type in CLASS_SEATS else "S"
+
+def parse_seat_number(seat_num, prefix="S"):
     """
-    Calculates and returns the next available seat string (e.g., 'S1-23').
-    Returns None if the train is full.
+    Converts a seat string like 'S2-15' to its 1-based linear seat number
+    within its class (None if unparseable or not a 'prefix' coach).
     """
-    train_info = db_execute("SELECT total_seats FROM trains WHERE train_id=%s", (train_id,), fetch='one')
-    if not train_info:
+    if not seat_num:
         return None
-    total_seats = train_info[0]
+    match = SEAT_PATTERN.match(str(seat_num).strip())
+    if not match or match.group(1).upper() != prefix:
+        return None
+    coach = int(match.group(2))
+    seat_in_coach = int(match.group(3))
+    return (coach - 1) * SEATS_PER_COACH + seat_in_coach
 
-    tickets = db_execute("SELECT seat_number FROM tickets WHERE train_id=%s AND status='Confirmed'", (train_id,), fetch='all')
-    if tickets is None:
-        return None # DB Error
+def format_seat_number(n, prefix="S"):
+    """Converts a 1-based linear seat number to its '<prefix><coach>-<seat>' string."""
+    coach_no = (n - 1) // SEATS_PER_COACH + 1
+    seat_in_coach = (n - 1) % SEATS_PER_COACH + 1
+    return f"{prefix}{coach_no}-{seat_in_coach}"
+
+class SeatBitmap:
+    """
+    Free-seat bitmap for one train. Bit (n - 1) is set while seat n is free,
+    so the lowest free seat is found with a single bit trick instead of a scan.
+    """
+    def __init__(self, total_seats, used=()):
+        self.total_seats = total_seats
+        # Built as a binary string so construction stays linear in the seat count
+        flags = ["1"] * total_seats
+        for n in used:
+            if 1 <= n <= total_seats:
+                flags[total_seats - n] = "0"
+        self.free = int("".join(flags), 2) if total_seats > 0 else 0
+
+    def next_free(self):
+        """Returns the lowest free linear seat number, or None if the train is full."""
+        if not self.free:
+            return None
+        return (self.free & -self.free).bit_length()
+
+    def mark_used(self, n):
+        if 1 <= n <= self.total_seats:
+            self.free &= ~(1 << (n - 1))
+
+    def mark_free(self, n):
+        if 1 <= n <= self.total_seats:
+            self.free |= 1 << (n - 1)
+
+    def is_free(self, n):
+        return 1 <= n <= self.total_seats and bool(self.free >> (n - 1) & 1)
+
+    def available(self):
+        return bin(self.free).count("1")
+
+    def find_block(self, count, seats_per_coach=SEATS_PER_COACH):
+        """
+        Picks 'count' free seats for a group without claiming them. Prefers the
+        lowest run of adjacent seats inside one coach; otherwise fills the
+        coaches with the most free seats first so the group spans as few
+        coaches as possible. Returns a sorted list of linear seat numbers, or
+        None if fewer than 'count' seats are free.
+        """
+        if count <= 0 or self.available() < count:
+            return None
+        if count <= seats_per_coach:
+            # Bit p of 'runs' stays set only if seats p+1 .. p+count are all free
+            runs = self.free
+            for shift in range(1, count):
+                runs &= self.free >> shift
+            # Runs may only start where they end inside the same coach
+            starts = 0
+            span = (1 << (seats_per_coach - count + 1)) - 1
+            for coach_start in range(0, self.total_seats, seats_per_coach):
+                starts |= span << coach_start
+            runs &= starts
+            if runs:
+                first = (runs & -runs).bit_length()
+                return list(range(first, first + count))
+
+        coaches = []
+        for coach_start in range(0, self.total_seats, seats_per_coach):
+            coach_free = (self.free >> coach_start) & ((1 << seats_per_coach) - 1)
+            coaches.append((-bin(coach_free).count("1"), coach_start, coach_free))
+        seats = []
+        for _, coach_start, coach_free in sorted(coaches):
+            while coach_free and len(seats) < count:
+                low = coach_free & -coach_free
+                seats.append(coach_start + low.bit_length())
+                coach_free ^= low
+            if len(seats) == count:
+                break
+        return sorted(seats)
+
+INVENTORY_MAX_PARTITIONS = 20000  # Seat bitmaps kept in memory; the least recently used are dropped first
+# The claimed seats of one (train, journey date, class) partition: one range of the seat_claims key
+PARTITION_SEATS_QUERY = "SELECT seat_number FROM seat_claims WHERE journey_date=%s AND train_id=%s AND class_type=%s"
+PARTITION_COUNT_QUERY = "SELECT COUNT(*) FROM seat_claims WHERE journey_date=%s AND train_id=%s AND class_type=%s"
+
+class SeatInventory:
+    """
+    Seat bitmaps per (train, journey date, class) partition, kept in sync
+    with bookings and cancellations. A partition is built from its own
+    seat_claims rows on first use and at most max_partitions are kept;
+    rebuild() loads every partition from today on that holds bookings
+    (used on startup). Partitions are read from the database outside the
+    lock, and a failed read raises DatabaseError rather than looking like a
+    full class.
+    """
+    def __init__(self, max_partitions=INVENTORY_MAX_PARTITIONS):
+        self._lock = threading.Lock()
+        self.max_partitions = max_partitions
+        self._partitions = OrderedDict()  # (train_id, journey_date, class_type) -> SeatBitmap, oldest use first
+        self._generation = 0  # Bumped when partitions are dropped or replaced, so older loads are not stored
+
+    def _store(self, key, bitmap):
+        self._partitions[key] = bitmap
+        while len(self._partitions) > self.max_partitions:
+            self._partitions.popitem(last=False)
+
+    def _build(self, key):
+        """A partition's bitmap from its seat_claims rows, or None if the class has no seats. Call without the lock."""
+        train_id, journey_date, class_type = key
+        seats = class_capacity(train_id, class_type)
+        if not seats:
+            return None
+        claims = db_execute(PARTITION_SEATS_QUERY, (journey_date, train_id, class_type), fetch='all', primary=True)
+        if claims is None:
+            raise DatabaseError(f"Could not load the seats of train {train_id} on {journey_date} ({class_type})")
+        prefix = seat_prefix(class_type)
+        return SeatBitmap(seats, (parse_seat_number(seat, prefix) or 0 for (seat,) in claims))
+
+    @contextmanager
+    def _get(self, train_id, journey_date, class_type):
+        """
+        Holds the lock over a partition's bitmap (None if the class has no
+        seats). One not kept yet is built before taking the lock and stored
+        only if no other thread stored it, or dropped partitions, meanwhile.
+        """
+        key = (train_id, journey_date, class_type)
+        while True:
+            with self._lock:
+                bitmap = self._partitions.get(key)
+                if bitmap is not None:
+                    self._partitions.move_to_end(key)
+                    yield bitmap
+                    return
+                generation = self._generation
+            bitmap = self._build(key)
+            with self._lock:
+                if key in self._partitions or generation != self._generation:
+                    continue  # Use the other thread's partition, or reload after an invalidation
+                if bitmap is not None:
+                    self._store(key, bitmap)
+                yield bitmap
+                return
+
+    def rebuild(self):
+        """Rebuilds the partitions of every journey date from today on in one pass over seat_claims."""
+        rows = db_execute("SELECT train_id, journey_date, class_type, seat_number FROM seat_claims WHERE journey_date >= %s",
+                          (datetime.date.today(),), fetch='all', primary=True)
+        if rows is None:
+            return False
+        reference_cache.reload()
+        used = {}
+        for train_id, journey_date, class_type, seat in rows:
+            used.setdefault((train_id, journey_date, class_type), []).append(parse_seat_number(seat, seat_prefix(class_type)) or 0)
+        partitions = OrderedDict()
+        # Nearest dates last, so they are the last to be dropped
+        for key in sorted(used, key=lambda k: k[1], reverse=True)[-self.max_partitions:]:
+            seats = class_capacity(key[0], key[2])
+            if seats:
+                partitions[key] = SeatBitmap(seats, used[key])
+        with self._lock:
+            self._partitions = partitions
+            self._generation += 1
+        return True
+
+    def next_free(self, train_id, journey_date, class_type):
+        """Returns the next free seat string without claiming it."""
+        with self._get(train_id, journey_date, class_type) as bitmap:
+            n = bitmap.next_free() if bitmap else None
+        return format_seat_number(n, seat_prefix(class_type)) if n else None
+
+    def allocate(self, train_id, journey_date, class_type):
+        """Claims and returns the next free seat string, or None if the class is full on that date."""
+        with self._get(train_id, journey_date, class_type) as bitmap:
+            n = bitmap.next_free() if bitmap else None
+            if not n:
+                return None
+            bitmap.mark_used(n)
+        return format_seat_number(n, seat_prefix(class_type))
+
+    def allocate_block(self, train_id, journey_date, class_type, count):
+        """Claims seats for a group (see SeatBitmap.find_block) and returns their strings, or None."""
+        with self._get(train_id, journey_date, class_type) as bitmap:
+            seats = bitmap.find_block(count) if bitmap else None
+            if not seats:
+                return None
+            for n in seats:
+                bitmap.mark_used(n)
+        return [format_seat_number(n, seat_prefix(class_type)) for n in seats]
+
+    def mark_used(self, train_id, journey_date, class_type, seat_num):
+        n = parse_seat_number(seat_num, seat_prefix(class_type))
+        with self._lock:
+            bitmap = self._partitions.get((train_id, journey_date, class_type))
+            if bitmap and n:
+                bitmap.mark_used(n)
+
+    def release(self, train_id, journey_date, class_type, seat_num):
+        """Returns a seat to its partition after a cancellation or a failed booking."""
+        n = parse_seat_number(seat_num, seat_prefix(class_type))
+        with self._lock:
+            bitmap = self._partitions.get((train_id, journey_date, class_type))
+            if bitmap and n:
+                bitmap.mark_free(n)
+
+    def available(self, train_id, journey_date, class_type):
+        with self._get(train_id, journey_date, class_type) as bitmap:
+            return bitmap.available() if bitmap else 0
+
+    def invalidate(self, train_id=None, journey_date=None):
+        """Drops the partitions of one train (on one date, if given), or all, so they are rebuilt on next use."""
+        with self._lock:
+            self._generation += 1
+            if train_id is None:
+                self._partitions = OrderedDict()
+            else:
+                for key in [k for k in self._partitions
+                            if k[0] == train_id and journey_date in (None, k[1])]:
+                    del self._partitions[key]
+
+    def prune(self, before):
+        """Drops the partitions of journey dates before 'before'."""
+        with self._lock:
+            for key in [k for k in self._partitions if k[1] < before]:
+                del self._partitions[key]
 
-    used_seats = set()
-    seat_pattern = re.compile(r"^S(\d+)-(\d+)$", re.IGNORECASE)
+seat_inventory = SeatInventory()
 
-    for (seat_num,) in tickets:
-        if not seat_num:
+def get_next_available_seat(train_id, journey_date=None, class_type="Sleeper"):
+    """
+    Returns the next available seat string (e.g., 'S1-23') of a class on a
+    journey date (default today) from the seat inventory.
+    Returns None if the class is full.
+    """
+    return seat_inventory.next_free(train_id, journey_date or datetime.date.today(), class_type)
+
+def prune_seat_claims(before=None):
+    """
+    Drops the seat claims, and inventory partitions, of journeys before
+    'before' (default today); the tickets themselves stay as history. The
+    journey date leads the seat_claims key, so this is one index range
+    delete, and run daily it only touches a single day. Returns True on success.
+    """
+    before = before or datetime.date.today()
+    if not db_execute("DELETE FROM seat_claims WHERE journey_date < %s", (before,)):
+        return False
+    seat_inventory.prune(before)
+    return True
+
+# ---------------- BOOKING ROLLUPS ----------------
+# daily_train_stats (per booking day, train and class), monthly_train_stats
+# (the same per month, keyed by its first day) and daily_route_stats (per
+# booking day and route) count the tickets booked, how many of those were
+# cancelled since, and the revenue of the ones still confirmed, valued at
+# the fare each ticket was booked at (waitlisted tickets count as booked,
+# but only earn once promoted to a seat). journey_class_stats counts, per journey date,
+# train and class, the tickets holding a seat and the ones waitlisted, for
+# occupancy. Every booking, cancellation and promotion updates them in its
+# own transaction with one upsert per table, so the dashboard never scans
+# tickets; rebuild_rollups() recomputes them from ticket history. Date
+# ranges read whole months from the monthly table and only the days at
+# either end from the daily one.
+BOOKING_COUNTERS = ("booked", "cancelled", "revenue")
+JOURNEY_COUNTERS = ("confirmed", "waitlisted")
+ROLLUP_TABLES = (  # (table, period of a ticket, key columns, counter columns)
+    ("daily_train_stats", "tk.booking_date", ("train_id", "class_type"), BOOKING_COUNTERS),
+    ("monthly_train_stats", "DATE_FORMAT(tk.booking_date, '%Y-%m-01')", ("train_id", "class_type"), BOOKING_COUNTERS),
+    ("daily_route_stats", "tk.booking_date", ("from_station", "to_station"), BOOKING_COUNTERS),
+    ("journey_class_stats", "tk.journey_date", ("train_id", "class_type"), JOURNEY_COUNTERS),
+)
+_ROLLUP_FARE = "{fare}"  # Filled in by rollup_statements()
+TICKET_FARE = "COALESCE(tk.fare, 0)"
+# Tickets before schema version 9 carry no fare; migration 3 values them at the fare_master fare
+FARE_MASTER_SOURCE = """tickets AS tk
+            LEFT JOIN fare_master AS f
+              ON f.from_station = tk.from_station AND f.to_station = tk.to_station AND f.class_type = tk.class_type"""
+# Sets the fare of tickets booked without one to the route's fare_master fare
+BACKFILL_TICKET_FARES = """UPDATE tickets SET fare = (SELECT f.fare_amount FROM fare_master AS f
+                                                      WHERE f.from_station = tickets.from_station
+                                                        AND f.to_station = tickets.to_station
+                                                        AND f.class_type = tickets.class_type)
+                           WHERE fare IS NULL"""
+_SEATED = "CASE WHEN tk.seat_number IS NOT NULL THEN 1 ELSE 0 END"
+_QUEUED = "CASE WHEN tk.seat_number IS NULL THEN 1 ELSE 0 END"
+# Counter deltas of the matching tickets per event, as SQL over alias tk (tickets)
+ROLLUP_DELTAS = {
+    "add": {"booked": "COUNT(*)", "cancelled": "SUM(CASE WHEN tk.status='Cancelled' THEN 1 ELSE 0 END)",
+            "revenue": f"SUM(CASE WHEN tk.status='Confirmed' THEN {_ROLLUP_FARE} ELSE 0 END)",
+            "confirmed": "SUM(CASE WHEN tk.status='Confirmed' THEN 1 ELSE 0 END)",
+            "waitlisted": "SUM(CASE WHEN tk.status='Waitlisted' THEN 1 ELSE 0 END)"},
+    # Cancelled tickets that still hold a seat number were confirmed (and earning); waitlisted ones never had a seat
+    "cancel": {"booked": "0", "cancelled": "COUNT(*)",
+               "revenue": f"-SUM(CASE WHEN tk.seat_number IS NOT NULL THEN {_ROLLUP_FARE} ELSE 0 END)",
+               "confirmed": f"-SUM({_SEATED})", "waitlisted": f"-SUM({_QUEUED})"},
+    # A waitlisted ticket promoted to a seat starts earning and leaves the waitlist count
+    "confirm": {"booked": "0", "cancelled": "0", "revenue": f"SUM({_ROLLUP_FARE})",
+                "confirmed": "COUNT(*)", "waitlisted": "-COUNT(*)"},
+}
+_TICKET_COLUMN = re.compile(r"tk\.(\w+)")
+
+@functools.lru_cache(maxsize=64)
+def rollup_statements(where, event="add", sign=1, tables=ROLLUP_TABLES, source="tickets AS tk", fare=TICKET_FARE):
+    """
+    One INSERT ... SELECT upsert per rollup table adding the 'event' deltas
+    (times 'sign') of tickets matching 'where'. 'fare' is the SQL for a
+    ticket's fare over 'source'.
+    """
+    deltas = {c: d.format(fare=fare) for c, d in ROLLUP_DELTAS[event].items()}
+    if sign < 0:
+        deltas = {c: f"-({d})" for c, d in deltas.items()}
+    statements = []
+    for table, period, keys, counters in tables:
+        key_columns = ", ".join(f"tk.{k}" for k in keys)
+        not_null = " AND ".join(f"tk.{k} IS NOT NULL" for k in _TICKET_COLUMN.findall(period) + list(keys))
+        statements.append(f"""
+            INSERT INTO {table} (stat_date, {', '.join(keys)}, {', '.join(counters)})
+            SELECT {period}, {key_columns}, {', '.join(deltas[c] for c in counters)}
+            FROM {source}
+            WHERE {not_null} AND ({where})
+            GROUP BY {period}, {key_columns}
+            ON DUPLICATE KEY UPDATE {', '.join(f"{c} = {c} + VALUES({c})" for c in counters)}""")
+    return tuple(statements)
+
+def add_to_rollups(cursor, where, params=(), sign=1):
+    """Counts the tickets matching 'where' into the rollups (sign=-1 takes them out again, before deleting them)."""
+    for statement in rollup_statements(where, "add", sign):
+        cursor.execute(statement, params)
+
+def cancel_in_rollups(cursor, where, params=()):
+    """Moves the tickets matching 'where' to cancelled; run right after the UPDATE that cancelled them."""
+    for statement in rollup_statements(f"tk.status='Cancelled' AND ({where})", "cancel"):
+        cursor.execute(statement, params)
+
+def confirm_in_rollups(cursor, where, params=()):
+    """Moves the waitlisted tickets matching 'where' to confirmed and their fares to revenue; run before confirming them."""
+    for statement in rollup_statements(f"tk.status='Waitlisted' AND ({where})", "confirm"):
+        cursor.execute(statement, params)
+
+def rebuild_rollups():
+    """Recomputes every rollup table from the tickets in one transaction. Returns True on success."""
+    try:
+        with db_transaction() as cursor:
+            for table, _, _, _ in ROLLUP_TABLES:
+                cursor.execute(f"DELETE FROM {table}")
+            add_to_rollups(cursor, "1=1")
+    except DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        return False
+    return True
+
+def _next_month(day):
+    return (day.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+
+def _stat_range(start, stop):
+    """WHERE clause and params for start <= stat_date < stop; either bound may be None (open)."""
+    conditions, params = [], []
+    if start is not None:
+        conditions.append("stat_date >= %s")
+        params.append(start)
+    if stop is not None:
+        conditions.append("stat_date < %s")
+        params.append(stop)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+def train_class_stats(date_from=None, date_to=None):
+    """
+    (train_id, class_type, booked, cancelled, revenue) for tickets booked
+    from 'date_from' to 'date_to' (datetime.date, inclusive, None = open).
+    """
+    start = date_from
+    stop = date_to + datetime.timedelta(days=1) if date_to else None
+    first = start if start is None or start.day == 1 else _next_month(start)  # Whole months: [first, last)
+    last = stop if stop is None or stop.day == 1 else stop.replace(day=1)
+    if first is not None and last is not None and first >= last:
+        parts = [("daily_train_stats", start, stop)]
+    else:
+        parts = [("monthly_train_stats", first, last)]
+        if start != first:
+            parts.append(("daily_train_stats", start, first))
+        if stop != last:
+            parts.append(("daily_train_stats", last, stop))
+    selects, params = [], []
+    for table, part_start, part_stop in parts:
+        where, part_params = _stat_range(part_start, part_stop)
+        selects.append(f"SELECT train_id, class_type, booked, cancelled, revenue FROM {table}{where}")
+        params.extend(part_params)
+    return db_execute(f"""SELECT train_id, class_type, SUM(booked), SUM(cancelled), SUM(revenue)
+                          FROM ({" UNION ALL ".join(selects)}) AS stats
+                          GROUP BY train_id, class_type ORDER BY train_id, class_type""", tuple(params), fetch='all')
+
+def journey_class_stats(date_from=None, date_to=None, limit=None):
+    """
+    (journey_date, train_id, class_type, confirmed, waitlisted) per journey
+    and class for journey dates from 'date_from' to 'date_to' (inclusive,
+    None = open), latest journey first.
+    """
+    where, params = _stat_range(date_from, date_to + datetime.timedelta(days=1) if date_to else None)
+    where += (" AND" if where else " WHERE") + " (confirmed <> 0 OR waitlisted <> 0)"
+    query = f"""SELECT stat_date, train_id, class_type, confirmed, waitlisted
+                FROM journey_class_stats{where}
+                ORDER BY stat_date DESC, train_id, class_type"""
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return db_execute(query, tuple(params), fetch='all')
+
+def route_day_stats(date_from=None, date_to=None, limit=None):
+    """(stat_date, from_station, to_station, booked, cancelled, revenue) per day and route, newest day first."""
+    where, params = _stat_range(date_from, date_to + datetime.timedelta(days=1) if date_to else None)
+    query = f"""SELECT stat_date, from_station, to_station, booked, cancelled, revenue
+                FROM daily_route_stats{where}
+                ORDER BY stat_date DESC, revenue DESC"""
+    if limit:
+        query += f" LIMIT {int(limit)}"
+    return db_execute(query, tuple(params), fetch='all')
+
+# ---------------- WAITLIST ----------------
+# A booking for a full class joins the queue of its (train, journey date,
+# class) partition as 'Waitlisted' tickets without seats. The queue is the
+# waitlist table in ticket_id (booking) order: idx_waitlist_queue leads
+# with the partition and promoted_at, so joining the queue and finding its
+# head are each one index descent, O(log n), and waitlist_queues keeps
+# each queue's length for the limit check. Per class, the first RAC_SHARE
+# of its seats' worth of places are shown as RAC (reservation against
+# cancellation), the rest as WL. Each cancelled seat goes to the head of
+# its queue in the cancelling transaction; promoted rows keep promoted_at
+# as the event shown in PNR lookup and My Bookings.
+RAC_SHARE = 0.1       # RAC places per class and journey date, as a share of the class's seats
+WAITLIST_LIMIT = 200  # WL places per class and journey date after the RAC ones; beyond that bookings fail
+
+QUEUE_JOIN = """INSERT INTO waitlist_queues (journey_date, train_id, class_type, queued) VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE queued = queued + VALUES(queued)"""
+QUEUE_HEAD_QUERY = """SELECT ticket_id FROM waitlist
+                      WHERE journey_date=%s AND train_id=%s AND class_type=%s AND promoted_at IS NULL
+                      ORDER BY ticket_id LIMIT 1 FOR UPDATE"""
+
+def rac_places(train_id, class_type):
+    return int(class_capacity(train_id, class_type) * RAC_SHARE)
+
+def waitlist_label(position, train_id, class_type):
+    """'RAC n' or 'WL n' for the ticket at 'position' (1 = head) of a class's queue."""
+    rac = rac_places(train_id, class_type)
+    return f"RAC {position}" if position <= rac else f"WL {position - rac}"
+
+class WaitlistFull(Exception):
+    """Raised inside a booking transaction to roll it back when the queue has no room left."""
+
+def join_queue(cursor, train_id, journey_date, class_type, count):
+    """
+    Adds 'count' tickets to the length of a class's queue inside the
+    booking transaction. The upsert locks the queue's row, so concurrent
+    bookings line up here. Raises WaitlistFull if the queue is then too long.
+    """
+    cursor.execute(QUEUE_JOIN, (journey_date, train_id, class_type, count))
+    cursor.execute("SELECT queued FROM waitlist_queues WHERE journey_date=%s AND train_id=%s AND class_type=%s",
+                   (journey_date, train_id, class_type))
+    if cursor.fetchone()[0] > rac_places(train_id, class_type) + WAITLIST_LIMIT:
+        raise WaitlistFull(f"The {class_type} waitlist of train {train_id} on {journey_date} is full")
+
+def leave_queue(cursor, train_id, journey_date, class_type, count):
+    cursor.execute("""UPDATE waitlist_queues SET queued = queued - %s
+                      WHERE journey_date=%s AND train_id=%s AND class_type=%s""",
+                   (count, journey_date, train_id, class_type))
+
+def promote_waitlist(cursor, train_id, journey_date, class_type, seat_number):
+    """
+    Gives a freed seat, whose claim is already deleted, to the head of its
+    partition's queue inside the cancelling transaction: the ticket is
+    confirmed with the seat, claims it and earns its fare in the rollups.
+    Returns the promoted ticket_id, or None if nobody is waiting.
+    """
+    cursor.execute(QUEUE_HEAD_QUERY, (journey_date, train_id, class_type))
+    head = cursor.fetchone()
+    if not head:
+        return None
+    ticket_id = head[0]
+    leave_queue(cursor, train_id, journey_date, class_type, 1)
+    confirm_in_rollups(cursor, "tk.ticket_id=%s", (ticket_id,))
+    cursor.execute("UPDATE tickets SET status='Confirmed', seat_number=%s WHERE ticket_id=%s", (seat_number, ticket_id))
+    cursor.execute("UPDATE waitlist SET promoted_at=%s WHERE ticket_id=%s",
+                   (datetime.datetime.now().replace(microsecond=0), ticket_id))
+    cursor.execute("""INSERT INTO seat_claims (journey_date, train_id, class_type, seat_number, ticket_id)
+                      VALUES (%s, %s, %s, %s, %s)""", (journey_date, train_id, class_type, seat_number, ticket_id))
+    return ticket_id
+
+def waitlist_details(ticket_ids):
+    """
+    Queue state of those of 'ticket_ids' that joined a waitlist:
+    {ticket_id: {'position', 'waitlist' ('RAC 2', 'WL 5'), 'queued_at',
+    'promoted_at'}}, with position and waitlist None once promoted.
+    Positions count the queued tickets ahead in the same partition, an
+    index range each. Returns None on database error.
+    """
+    ticket_ids = list(ticket_ids)
+    if not ticket_ids:
+        return {}
+    placeholders = ", ".join(["%s"] * len(ticket_ids))
+    rows = db_execute(f"""SELECT w.ticket_id, w.train_id, w.class_type, w.queued_at, w.promoted_at,
+                                 CASE WHEN w.promoted_at IS NULL THEN
+                                     (SELECT COUNT(*) FROM waitlist AS ahead
+                                      WHERE ahead.journey_date = w.journey_date AND ahead.train_id = w.train_id
+                                        AND ahead.class_type = w.class_type AND ahead.promoted_at IS NULL
+                                        AND ahead.ticket_id <= w.ticket_id) END
+                          FROM waitlist AS w WHERE w.ticket_id IN ({placeholders})""", tuple(ticket_ids), fetch='all')
+    if rows is None:
+        return None
+    return {ticket_id: {"position": position,
+                        "waitlist": waitlist_label(position, train_id, class_type) if position else None,
+                        "queued_at": queued_at, "promoted_at": promoted_at}
+            for ticket_id, train_id, class_type, queued_at, promoted_at, position in rows}
+
+def describe_status(ticket):
+    """Status text of a ticket dict: its RAC/WL place while queued, and any promotion off the waitlist."""
+    if ticket["status"] == "Waitlisted" and ticket.get("waitlist"):
+        return ticket["waitlist"]
+    if ticket["status"] == "Confirmed" and ticket.get("promoted_at"):
+        return f"Confirmed (off waitlist {ticket['promoted_at']:%Y-%m-%d %H:%M})"
+    return ticket["status"]
+
+# ---------------- BOOKING TRANSACTIONS ----------------
+BOOKING_MAX_RETRIES = 5  # PNR collisions in a row before a booking gives up
+
+def booking_conflict(err, pnr, train_id=None, journey_date=None, class_type=None, seats=()):
+    """
+    Which unique key a failed booking insert ran into, asked of the database
+    rather than read from the driver's message: 'seat' if another session
+    holds one of 'seats' (on train_id/journey_date/class_type), 'pnr' if
+    another booking has 'pnr'. Anything else, such as a foreign key no
+    retry can satisfy, re-raises 'err'.
+    """
+    if seats:
+        placeholders = ", ".join(["%s"] * len(seats))
+        claimed = db_execute(f"{PARTITION_SEATS_QUERY} AND seat_number IN ({placeholders})",
+                             (journey_date, train_id, class_type, *seats), fetch='all', primary=True)
+        if claimed:
+            return "seat"
+    if db_execute("SELECT 1 FROM tickets WHERE pnr=%s", (pnr,), fetch='all', primary=True):
+        return "pnr"
+    raise err
+
+def booking_fare(cursor, from_id, to_id, class_type):
+    """
+    The fare_master fare a ticket is booked at, read inside its booking
+    transaction (None if the route has no fare). The ticket keeps it, so
+    later fare changes leave its refund and the rollups alone.
+    """
+    cursor.execute(FARE_QUERY, (from_id, to_id, class_type))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def book_seat(train_id, passenger_id, from_id, to_id, class_type, passenger_name, passenger_age, passenger_gender,
+              journey_date=None, inventory=None, waitlist=False):
+    """
+    Books one seat of 'class_type' for 'journey_date' (default today)
+    atomically: the ticket row and its seat_claims row are inserted in one
+    transaction (which also counts it into the rollups), and the
+    (journey_date, train_id, class_type, seat_number) key of seat_claims
+    rejects a seat another session already took. On such a conflict the
+    partition is reloaded from seat_claims and the next free seat tried,
+    until the class is full. With 'waitlist', a full class waitlists the
+    ticket instead (see book_waitlisted), giving a seat_number of None.
+    Returns (pnr, seat_number, booking_date, fare), 'fare' being the one
+    stored on the ticket (None if the route has no fare), or None if the
+    class is full.
+    Raises one of DB_ERRORS on database failure.
+    """
+    inventory = inventory or seat_inventory
+    booking_date = datetime.date.today()
+    journey_date = journey_date or booking_date
+    collisions = 0
+    while True:
+        seat_string = inventory.allocate(train_id, journey_date, class_type)
+        if not seat_string and waitlist:
+            booking = book_waitlisted(train_id, passenger_id, from_id, to_id, class_type,
+                                      [(passenger_name, passenger_age, passenger_gender)], journey_date, inventory)
+            return booking and (booking[0], booking[1][0], booking[2], booking[3])
+        if not seat_string:
+            return None
+        pnr = generate_pnr()
+        try:
+            with db_transaction() as cursor:
+                fare = booking_fare(cursor, from_id, to_id, class_type)
+                cursor.execute(
+                    """INSERT INTO tickets (pnr, train_id, passenger_id, from_station, to_station, seat_number, class_type, booking_date, journey_date, status, passenger_name, passenger_age, passenger_gender, fare)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, 'Confirmed', %s, %s, %s, %s)""",
+                    (pnr, train_id, passenger_id, from_id, to_id, seat_string, class_type, booking_date, journey_date,
+                     passenger_name, passenger_age, passenger_gender, fare))
+                cursor.execute("""INSERT INTO seat_claims (journey_date, train_id, class_type, seat_number, ticket_id)
+                                  VALUES (%s, %s, %s, %s, %s)""",
+                               (journey_date, train_id, class_type, seat_string, cursor.lastrowid))
+                add_to_rollups(cursor, "tk.pnr=%s", (pnr,))
+        except DB_INTEGRITY_ERRORS as err:
+            inventory.release(train_id, journey_date, class_type, seat_string)
+            if booking_conflict(err, pnr, train_id, journey_date, class_type, [seat_string]) == "seat":
+                # Another session took the seat, and likely others this partition still shows free
+                inventory.invalidate(train_id, journey_date)
+                continue
+            collisions += 1
+            if collisions >= BOOKING_MAX_RETRIES:
+                raise DatabaseError(f"Could not find a free PNR after {BOOKING_MAX_RETRIES} attempts")
             continue
-        match = seat_pattern.match(str(seat_num).strip())
-        if match:
-            coach = int(match.group(1))
-            seat_in_coach = int(match.group(2))
-            linear_seat = (coach - 1) * SEATS_PER_COACH + seat_in_coach
-            used_seats.add(linear_seat)
+        except DB_ERRORS:
+            inventory.release(train_id, journey_date, class_type, seat_string)
+            raise
+        return pnr, seat_string, booking_date, fare
 
-    for n in range(1, total_seats + 1):
-        if n not in used_seats:
-            coach_no = (n - 1) // SEATS_PER_COACH + 1
-            seat_in_coach = (n - 1) % SEATS_PER_COACH + 1
-            return f"S{coach_no}-{seat_in_coach}"
+def book_group(train_id, passenger_id, from_id, to_id, class_type, passengers, journey_date=None, inventory=None,
+               waitlist=False):
+    """
+    Books seats for several passengers under one shared PNR. Seats come from
+    SeatInventory.allocate_block (adjacent within a coach where possible);
+    all ticket rows go in with one multi-row INSERT and their seat claims
+    with one INSERT ... SELECT, and the rollups are updated, all in a
+    single transaction, so the group is booked completely or not at all.
+    'passengers' is a list of (name, age, gender) tuples; rows are numbered
+    by passenger_seq. 'journey_date' defaults to today. With 'waitlist',
+    a group the class lacks seats for is waitlisted as a whole, with seat
+    numbers of None. Seat conflicts are retried as in book_seat.
+    Returns (pnr, seat_numbers, booking_date, fare), or None if the class
+    lacks seats.
+    Raises one of DB_ERRORS on database failure.
+    """
+    inventory = inventory or seat_inventory
+    booking_date = datetime.date.today()
+    journey_date = journey_date or booking_date
+    collisions = 0
+    while True:
+        seats = inventory.allocate_block(train_id, journey_date, class_type, len(passengers))
+        if not seats and waitlist:
+            return book_waitlisted(train_id, passenger_id, from_id, to_id, class_type, passengers, journey_date, inventory)
+        if not seats:
+            return None
+        pnr = generate_pnr()
+        try:
+            with db_transaction() as cursor:
+                fare = booking_fare(cursor, from_id, to_id, class_type)
+                rows = [(pnr, seq, train_id, passenger_id, from_id, to_id, seat, class_type, booking_date, journey_date,
+                         name, age, gender, fare)
+                        for seq, (seat, (name, age, gender)) in enumerate(zip(seats, passengers), start=1)]
+                # executemany() sends a single multi-row INSERT for this statement shape
+                cursor.executemany(
+                    """INSERT INTO tickets (pnr, passenger_seq, train_id, passenger_id, from_station, to_station, seat_number, class_type, booking_date, journey_date, status, passenger_name, passenger_age, passenger_gender, fare)
+                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'Confirmed', %s, %s, %s, %s)""", rows)
+                cursor.execute(
+                    """INSERT INTO seat_claims (journey_date, train_id, class_type, seat_number, ticket_id)
+                       SELECT journey_date, train_id, class_type, seat_number, ticket_id FROM tickets WHERE pnr=%s""", (pnr,))
+                add_to_rollups(cursor, "tk.pnr=%s", (pnr,))
+        except DB_INTEGRITY_ERRORS as err:
+            for seat in seats:
+                inventory.release(train_id, journey_date, class_type, seat)
+            if booking_conflict(err, pnr, train_id, journey_date, class_type, seats) == "seat":
+                # Another session holds some of these seats: resync the partition from the database
+                inventory.invalidate(train_id, journey_date)
+                continue
+            collisions += 1
+            if collisions >= BOOKING_MAX_RETRIES:
+                raise DatabaseError(f"Could not find a free PNR after {BOOKING_MAX_RETRIES} attempts")
+            continue
+        except DB_ERRORS:
+            for seat in seats:
+                inventory.release(train_id, journey_date, class_type, seat)
+            raise
+        return pnr, seats, booking_date, fare
 
-    return None # Train is full
+def book_waitlisted(train_id, passenger_id, from_id, to_id, class_type, passengers, journey_date, inventory=None):
+    """
+    Books tickets without seats at the back of the (train, journey date,
+    class) queue, under one PNR and in one transaction. Should the seat
+    claims show that other sessions freed seats this process has not seen,
+    the partition is reloaded and those seats booked instead. Returns
+    (pnr, seat_numbers or Nones, booking_date, fare), or None if the class
+    has no seats at all or its queue is full.
+    Raises one of DB_ERRORS on database failure.
+    """
+    inventory = inventory or seat_inventory
+    seats = class_capacity(train_id, class_type)
+    if not seats:
+        return None
+    claimed = db_execute(PARTITION_COUNT_QUERY, (journey_date, train_id, class_type), fetch='one', primary=True)
+    if claimed and claimed[0] + len(passengers) <= seats:
+        inventory.invalidate(train_id, journey_date)
+        booking = book_group(train_id, passenger_id, from_id, to_id, class_type, passengers, journey_date, inventory)
+        if booking:
+            return booking
+    booking_date = datetime.date.today()
+    for _ in range(BOOKING_MAX_RETRIES):
+        pnr = generate_pnr()
+        try:
+            with db_transaction() as cursor:
+                join_queue(cursor, train_id, journey_date, class_type, len(passengers))
+                fare = booking_fare(cursor, from_id, to_id, class_type)
+                rows = [(pnr, seq, train_id, passenger_id, from_id, to_id, class_type, booking_date, journey_date,
+                         name, age, gender, fare) for seq, (name, age, gender) in enumerate(passengers, start=1)]
+                cursor.executemany(
+                    """INSERT INTO tickets (pnr, passenger_seq, train_id, passenger_id, from_station, to_station, seat_number, class_type, booking_date, journey_date, status, passenger_name, passenger_age, passenger_gender, fare)
+                       VALUES (%s, %s, %s, %s, %s, %s, NULL, %s, %s, %s, 'Waitlisted', %s, %s, %s, %s)""", rows)
+                cursor.execute("""INSERT INTO waitlist (ticket_id, journey_date, train_id, class_type, queued_at)
+                                  SELECT ticket_id, journey_date, train_id, class_type, %s FROM tickets WHERE pnr=%s""",
+                               (datetime.datetime.now().replace(microsecond=0), pnr))
+                add_to_rollups(cursor, "tk.pnr=%s", (pnr,))
+        except WaitlistFull:
+            return None
+        except DB_INTEGRITY_ERRORS as err:
+            booking_conflict(err, pnr)  # Retried only if the PNR was taken
+            continue
+        return pnr, [None] * len(passengers), booking_date, fare
+    raise DatabaseError(f"Could not find a free PNR after {BOOKING_MAX_RETRIES} attempts")
+
+CANCEL_BATCH_ROWS = 500  # Tickets cancelled per transaction by bulk_cancel()
+# What a cancellation returns per ticket it changed: enough for the refund and the passenger's notification
+CANCELLED_COLUMNS = ("ticket_id", "pnr", "passenger_seq", "passenger_id", "passenger_name", "train_id",
+                     "from_station", "to_station", "class_type", "journey_date", "seat_number", "fare")
+CANCELLED_TICKETS_QUERY = """
+    SELECT tk.ticket_id, tk.pnr, tk.passenger_seq, tk.passenger_id, tk.passenger_name, tk.train_id,
+           tk.from_station, tk.to_station, tk.class_type, tk.journey_date, tk.seat_number, COALESCE(tk.fare, 0)
+    FROM tickets AS tk"""
+# The status check and the update in one statement: only tickets still live and not yet travelled match
+CANCEL_PNR = "UPDATE tickets SET status='Cancelled' WHERE pnr=%s AND status<>'Cancelled' AND journey_date >= %s"
+
+def release_cancelled(cursor, tickets, promote=True):
+    """
+    Frees what the just cancelled 'tickets' (CANCELLED_COLUMNS rows) held,
+    inside their transaction: seat claims are deleted, queued tickets leave
+    their waitlist and, with 'promote', each freed seat goes to the head of
+    its queue (see promote_waitlist). Returns the seats nobody took, as
+    (train_id, journey_date, class_type, seat_number), for the inventory.
+    """
+    placeholders = ", ".join(["%s"] * len(tickets))
+    ids = [t[0] for t in tickets]
+    seated = [(t[5], t[9], t[8], t[10]) for t in tickets if t[10]]
+    queued = Counter((t[5], t[9], t[8]) for t in tickets if not t[10])
+    if seated:
+        cursor.execute(f"DELETE FROM seat_claims WHERE ticket_id IN ({placeholders})", ids)
+    if queued:
+        for (train_id, journey_date, class_type), count in queued.items():
+            leave_queue(cursor, train_id, journey_date, class_type, count)
+        cursor.execute(f"DELETE FROM waitlist WHERE promoted_at IS NULL AND ticket_id IN ({placeholders})", ids)
+    if promote:
+        seated = [seat for seat in seated if promote_waitlist(cursor, *seat) is None]
+    return seated
+
+def cancel_booking(pnr, not_before=None):
+    """
+    Cancels every ticket under a PNR whose journey is on or after
+    'not_before' (default today), in one transaction. A single conditional
+    UPDATE both checks the status and changes it, so there is no earlier
+    read to race with; the rows it changed are then read back under its
+    locks, moved to cancelled in the rollups and their seats handed to the
+    waitlist or, after commit, returned to the inventory (release_cancelled).
+    Returns the cancelled tickets as CANCELLED_COLUMNS tuples, empty if none
+    could be cancelled, or None on database error.
+    """
+    try:
+        with db_transaction() as cursor:
+            cursor.execute(CANCEL_PNR, (pnr, not_before or datetime.date.today()))
+            if not cursor.rowcount:
+                return []
+            cursor.execute(CANCELLED_TICKETS_QUERY + " WHERE tk.pnr=%s ORDER BY tk.passenger_seq", (pnr,))
+            tickets = cursor.fetchall()
+            cancel_in_rollups(cursor, "tk.pnr=%s", (pnr,))
+            freed = release_cancelled(cursor, tickets)
+    except DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        return None
+    for train_id, journey_date, class_type, seat_number in freed:
+        seat_inventory.release(train_id, journey_date, class_type, seat_number)
+    return tickets
+
+# ---------------- BULK CANCELLATION ----------------
+# Cancelling everything on a withdrawn service, or a list of PNRs, in
+# batches of CANCEL_BATCH_ROWS tickets per transaction. Each batch picks
+# the next live tickets by ticket_id and cancels them with one conditional
+# UPDATE; should another session have cancelled some of them in between,
+# the batch is rolled back and picked again. Every ticket cancelled goes
+# into a refund/notification manifest.
+MANIFEST_COLUMNS = ("pnr", "passenger_seq", "passenger_id", "passenger_name", "train_id", "from_station", "to_station",
+                    "class_type", "journey_date", "seat_number", "previous_status", "refund")
+MANIFEST_HEADINGS = ("PNR", "Seq", "Passenger ID", "Passenger", "Train", "From", "To", "Class", "Journey Date", "Seat",
+                     "Previous Status", "Refund")
+
+class _BatchConflict(Exception):
+    """Rolls a bulk cancellation batch back when another session cancelled some of its tickets first."""
+
+def manifest_row(ticket):
+    """MANIFEST_COLUMNS values of a CANCELLED_COLUMNS row: tickets without a seat were waitlisted."""
+    return (ticket[1], ticket[2], ticket[3], ticket[4], ticket[5], ticket[6], ticket[7], ticket[8], str(ticket[9]),
+            ticket[10] or "", "Confirmed" if ticket[10] else "Waitlisted", float(ticket[11]))
+
+def _cancel_batch(where, params, after, batch_size, promote):
+    """Cancels the next batch of live tickets matching 'where' with ticket_id > 'after'. Returns (tickets, freed seats)."""
+    with db_transaction() as cursor:
+        cursor.execute(f"""SELECT ticket_id FROM tickets
+                           WHERE ({where}) AND status<>'Cancelled' AND journey_date >= %s AND ticket_id > %s
+                           ORDER BY ticket_id LIMIT {int(batch_size)}""", params + (datetime.date.today(), after))
+        ids = [r[0] for r in cursor.fetchall()]
+        if not ids:
+            return [], []
+        in_ids = f"ticket_id IN ({', '.join(['%s'] * len(ids))})"
+        cursor.execute(f"UPDATE tickets SET status='Cancelled' WHERE {in_ids} AND status<>'Cancelled'", ids)
+        if cursor.rowcount != len(ids):
+            raise _BatchConflict()
+        cursor.execute(f"{CANCELLED_TICKETS_QUERY} WHERE tk.{in_ids} ORDER BY tk.ticket_id", ids)
+        tickets = cursor.fetchall()
+        cancel_in_rollups(cursor, f"tk.{in_ids}", ids)
+        return tickets, release_cancelled(cursor, tickets, promote)
+
+def bulk_cancel(train_id=None, journey_date=None, pnrs=None, manifest_path=None, batch_size=CANCEL_BATCH_ROWS,
+                on_batch=None):
+    """
+    Cancels every live ticket, journey today or later, on 'train_id'
+    and/or 'journey_date', or else under the PNRs in 'pnrs'. When a service is
+    withdrawn its whole waitlist is cancelled with it, so freed seats only
+    go to waitlisted passengers in PNR mode. Freed seats return to the
+    inventory after each batch, and on_batch(tickets) gets its
+    CANCELLED_COLUMNS rows. With 'manifest_path' each cancelled ticket is
+    written there (see export_file()). Returns a summary dict: 'cancelled', 'pnrs',
+    'seats_released', 'promoted', 'refund_total', 'elapsed' and
+    'tickets_per_sec'. Raises ValueError unless given one kind of filter,
+    and one of DB_ERRORS on database failure (batches already committed
+    stay cancelled, and in the manifest).
+    """
+    pnrs = sorted(set(pnrs or ()))
+    if train_id is None and journey_date is None and not pnrs:
+        raise ValueError("bulk_cancel() needs a train, a journey date or PNRs")
+    if pnrs and (train_id is not None or journey_date is not None):
+        raise ValueError("bulk_cancel() takes either a train and/or date or PNRs, not both")
+    # Each group is walked by ticket_id along an index: a train's own, or a PNR chunk's
+    if train_id is not None and journey_date is not None:
+        groups = [("train_id=%s AND journey_date=%s", (train_id, journey_date))]
+    elif train_id is not None:
+        groups = [("train_id=%s", (train_id,))]
+    elif journey_date is not None:
+        trains = db_execute("SELECT DISTINCT train_id FROM tickets WHERE journey_date=%s", (journey_date,), fetch='all')
+        if trains is None:
+            raise DatabaseError(f"Could not list the trains running on {journey_date}")
+        groups = [("train_id=%s AND journey_date=%s", (t, journey_date)) for (t,) in trains]
+    else:
+        groups = []
+    for start in range(0, len(pnrs), batch_size):
+        chunk = pnrs[start:start + batch_size]
+        groups.append((f"pnr IN ({', '.join(['%s'] * len(chunk))})", tuple(chunk)))
+
+    started = time.perf_counter()
+    summary = {"cancelled": 0, "pnrs": 0, "seats_released": 0, "promoted": 0, "refund_total": 0.0}
+    seen_pnrs = set()
+    with (export_file(manifest_path, MANIFEST_COLUMNS, MANIFEST_HEADINGS) if manifest_path else nullcontext()) as writer:
+        for where, group_params in groups:
+            after = 0
+            while True:
+                for _ in range(BOOKING_MAX_RETRIES):
+                    try:
+                        tickets, freed = _cancel_batch(where, group_params, after, batch_size, promote=bool(pnrs))
+                        break
+                    except _BatchConflict:
+                        continue
+                else:
+                    raise DatabaseError(f"Could not cancel a batch after {BOOKING_MAX_RETRIES} attempts")
+                if not tickets:
+                    break
+                after = tickets[-1][0]
+                for train, date, class_type, seat in freed:
+                    seat_inventory.release(train, date, class_type, seat)
+                seated = sum(1 for t in tickets if t[10])
+                summary["cancelled"] += len(tickets)
+                summary["seats_released"] += seated
+                summary["promoted"] += seated - len(freed)
+                summary["refund_total"] += sum(float(t[11]) for t in tickets)
+                seen_pnrs.update(t[1] for t in tickets)
+                if writer:
+                    writer.write(manifest_row(t) for t in tickets)
+                if on_batch:
+                    on_batch(tickets)
+    elapsed = time.perf_counter() - started
+    summary.update(pnrs=len(seen_pnrs), manifest=manifest_path, elapsed=elapsed,
+                   tickets_per_sec=summary["cancelled"] / elapsed if elapsed else 0.0)
+    return summary
+
+# ---------------- BOOKING SERVICE ----------------
+# Display-free entry points shared by the Tk windows and the HTTP server
+# (booking_server.py). They validate their input, return plain dicts/lists
+# and raise ServiceError for anything the caller has to report.
+TRAVEL_CLASSES = ("Sleeper", "AC", "General")
+GENDERS = ("Male", "Female", "Other")
+SERVICE_PAGE_SIZE = 100  # Default and maximum rows per bookings/report page
+GROUP_MAX_PASSENGERS = 6   # Passengers per PNR in group booking
+BULK_MAX_PASSENGERS = 500  # Passengers per PNR in bulk-agent mode
+DASHBOARD_ROUTE_ROWS = 500  # Route/day rows returned by booking_dashboard()
+DASHBOARD_JOURNEY_ROWS = 500  # Journey/class occupancy rows returned by booking_dashboard()
+ADVANCE_BOOKING_DAYS = 120  # How far ahead journeys can be searched and booked
+
+class ServiceError(Exception):
+    """A request the service refused; 'status' is the matching HTTP status code."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _require_int(value, name):
+    if isinstance(value, bool) or not is_int(str(value)):
+        raise ServiceError(f"{name} must be an integer.")
+    return int(value)
+
+def _require_rows(rows):
+    if rows is None:
+        raise ServiceError("Database error, please try again.", 503)
+    return rows
+
+def _require_date(value, name):
+    if value in (None, ""):
+        return None
+    if isinstance(value, datetime.date):
+        return value
+    try:
+        return datetime.date.fromisoformat(str(value).strip())
+    except ValueError:
+        raise ServiceError(f"{name} must be a date (YYYY-MM-DD).")
+
+def _require_journey_date(value):
+    """A journey date from today up to ADVANCE_BOOKING_DAYS ahead; empty means today."""
+    today = datetime.date.today()
+    journey_date = _require_date(value, "Journey date") or today
+    if not today <= journey_date <= today + datetime.timedelta(days=ADVANCE_BOOKING_DAYS):
+        raise ServiceError(f"Journey date must be between {today} and {ADVANCE_BOOKING_DAYS} days ahead.")
+    return journey_date
+
+@timed_operation("login")
+def authenticate_user(username, password):
+    """Checks a username/password pair. Returns {'user_id', 'role', 'username'}."""
+    username = (username or "").strip()
+    if not username or not password:
+        raise ServiceError("Username and Password are required.")
+    row = db_execute("SELECT user_id, role, password, username FROM users WHERE username=%s", (username,), fetch='one')
+    if not row or row[2] != password:
+        raise ServiceError("Invalid username or password.", 401)
+    return {"user_id": row[0], "role": row[1], "username": row[3]}
+
+@timed_operation("search")
+def find_trains(from_id, to_id, journey_date=None):
+    """
+    Direct trains between two stations with their availability on the
+    journey date, today if not given (see search_with_availability). When
+    there are none, 'connections' lists the 1- and 2-change itineraries
+    from the journey planner.
+    """
+    from_id, to_id = _require_int(from_id, "From station"), _require_int(to_id, "To station")
+    if from_id == to_id:
+        raise ServiceError("'From' and 'To' stations cannot be the same.")
+    journey_date = _require_journey_date(journey_date)
+    trains = _require_rows(search_with_availability(from_id, to_id, journey_date))
+    connections = [] if trains else [j for j in plan_journeys(from_id, to_id) if j["changes"] > 0]
+    return {"trains": trains, "connections": connections}
+
+def get_train_availability(train_id, journey_date=None):
+    """Seat availability of one train per class on a journey date (default today), from the seat inventory."""
+    train_id = _require_int(train_id, "Train ID")
+    journey_date = _require_journey_date(journey_date)
+    train = reference_cache.get_train(train_id)
+    if not train:
+        raise ServiceError(f"Train {train_id} does not exist.", 404)
+    classes = {}
+    for class_type, seats in class_seat_counts(train[2]).items():
+        try:
+            available = seat_inventory.available(train_id, journey_date, class_type)
+        except DB_ERRORS as err:
+            print(f"Database Error: {err}")
+            raise ServiceError("Database error, please try again.", 503)
+        classes[class_type] = {"total_seats": seats, "booked": max(0, seats - available), "available": available}
+    total_seats = train[2] or 0
+    available = sum(c["available"] for c in classes.values())
+    return {"train_id": train_id, "train_name": train[0], "journey_date": journey_date, "total_seats": total_seats,
+            "booked": max(0, total_seats - available), "available": available, "classes": classes}
+
+FARE_QUERY = "SELECT fare_amount FROM fare_master WHERE from_station=%s AND to_station=%s AND class_type=%s"
+
+def get_fare(from_id, to_id, class_type):
+    """Fare for a route and class, or None if the fare master has no entry."""
+    row = db_execute(FARE_QUERY,
+                     (_require_int(from_id, "From station"), _require_int(to_id, "To station"), class_type), fetch='one')
+    return float(row[0]) if row else None
+
+def suggest_stations(query, limit=None):
+    """Type-ahead station matches for 'query', best first (see StationIndex.search)."""
+    limit = min(_require_int(limit, "Limit"), SERVICE_PAGE_SIZE) if limit is not None else STATION_SUGGESTIONS
+    return [{"station_id": sid, "station_name": name, "station_code": code, "city": city}
+            for sid, name, code, city in station_index.search(query, max(limit, 1))]
+
+def _require_passenger(name, age, gender):
+    """Validates one passenger's details. Returns (name, age, gender)."""
+    name = (name or "").strip()
+    if not (name and gender):
+        raise ServiceError("All passenger fields are required.")
+    if gender not in GENDERS:
+        raise ServiceError(f"Gender must be one of: {', '.join(GENDERS)}.")
+    age = _require_int(age, "Age")
+    if not 0 < age < 120:
+        raise ServiceError("Please enter a valid age.")
+    return name, age, gender
+
+def _require_trip(passenger_id, train_id, class_type):
+    passenger_id = _require_int(passenger_id, "Passenger ID")
+    train_id = _require_int(train_id, "Train ID")
+    if class_type not in TRAVEL_CLASSES:
+        raise ServiceError(f"Class must be one of: {', '.join(TRAVEL_CLASSES)}.")
+    if not reference_cache.get_train(train_id):
+        raise ServiceError(f"Train {train_id} does not exist.", 404)
+    return passenger_id, train_id
+
+TRAIN_SERVES_QUERY = "SELECT 1 FROM train_od_index WHERE train_id=%s AND from_station=%s AND to_station=%s"
+
+def _require_route(train_id, from_id, to_id):
+    """Validates that the train calls at 'from_id' and later at 'to_id'. Returns (from_id, to_id)."""
+    from_id, to_id = _require_int(from_id, "From station"), _require_int(to_id, "To station")
+    if from_id == to_id:
+        raise ServiceError("From and To stations must be different.")
+    if not _require_rows(db_execute(TRAIN_SERVES_QUERY, (train_id, from_id, to_id), fetch='all')):
+        raise ServiceError(f"Train {train_id} does not run from station {from_id} to station {to_id}.")
+    return from_id, to_id
+
+@timed_operation("book")
+def reserve_ticket(passenger_id, train_id, from_id, to_id, class_type, passenger_name, passenger_age, passenger_gender,
+                   journey_date=None):
+    """
+    Books one seat for the journey date, today if not given (see book_seat),
+    and returns the ticket as a dict. A full class waitlists the ticket:
+    'status' is then 'Waitlisted', 'seat_number' None and 'waitlist' its
+    place ('RAC 2', 'WL 5'). A route with no fare is booked at 0.00 and
+    flagged with 'fare_missing'.
+    """
+    passenger_id, train_id = _require_trip(passenger_id, train_id, class_type)
+    from_id, to_id = _require_route(train_id, from_id, to_id)
+    passenger_name, age, passenger_gender = _require_passenger(passenger_name, passenger_age, passenger_gender)
+    journey_date = _require_journey_date(journey_date)
+
+    booking = book_seat(train_id, passenger_id, from_id, to_id, class_type, passenger_name, age, passenger_gender,
+                        journey_date, waitlist=True)
+    if not booking:
+        raise ServiceError(f"Sorry, no {class_type} seats or waitlist places are left on this train on {journey_date}.", 409)
+
+    pnr, seat_string, booking_date, fare = booking
+    waitlist = _waitlist_places(pnr) if seat_string is None else {}
+    return {
+        'pnr': pnr,
+        'passenger_name': passenger_name,
+        'passenger_age': age,
+        'passenger_gender': passenger_gender,
+        'train_id': train_id,
+        'train_name': get_train_name_by_id(train_id),
+        'from_station': get_station_name_by_id(from_id),
+        'to_station': get_station_name_by_id(to_id),
+        'booking_date': booking_date,
+        'journey_date': journey_date,
+        'class_type': class_type,
+        'seat_number': seat_string,
+        'status': 'Waitlisted' if seat_string is None else 'Confirmed',
+        'waitlist': waitlist.get(1),
+        'fare': float(fare or 0),
+        'fare_missing': fare is None
+    }
+
+@timed_operation("book")
+def reserve_group(passenger_id, train_id, from_id, to_id, class_type, passengers, bulk=False, journey_date=None):
+    """
+    Books seats for a group under one PNR (see book_group). 'passengers' is a
+    list of dicts with 'name', 'age' and 'gender'. Up to GROUP_MAX_PASSENGERS
+    may travel together, or BULK_MAX_PASSENGERS in bulk-agent mode. Returns
+    the booking with a 'passengers' list (each with its seat), 'fare' per
+    passenger and 'total_fare'. A group the class lacks seats for is
+    waitlisted whole, as in reserve_ticket, each passenger with a 'waitlist' place.
+    """
+    passenger_id, train_id = _require_trip(passenger_id, train_id, class_type)
+    from_id, to_id = _require_route(train_id, from_id, to_id)
+    journey_date = _require_journey_date(journey_date)
+    limit = BULK_MAX_PASSENGERS if bulk else GROUP_MAX_PASSENGERS
+    if not passengers or not isinstance(passengers, list):
+        raise ServiceError("At least one passenger is required.")
+    if len(passengers) > limit:
+        raise ServiceError(f"At most {limit} passengers can be booked together.")
+    details = []
+    for p in passengers:
+        if not isinstance(p, dict):
+            raise ServiceError("Each passenger must have a name, age and gender.")
+        details.append(_require_passenger(p.get('name'), p.get('age'), p.get('gender')))
+
+    booking = book_group(train_id, passenger_id, from_id, to_id, class_type, details, journey_date, waitlist=True)
+    if not booking:
+        raise ServiceError(f"Sorry, this train has neither {len(details)} free {class_type} seats nor "
+                           f"waitlist places on {journey_date}.", 409)
+
+    pnr, seats, booking_date, fare = booking
+    waitlist = _waitlist_places(pnr) if seats[0] is None else {}
+    return {
+        'pnr': pnr,
+        'train_id': train_id,
+        'train_name': get_train_name_by_id(train_id),
+        'from_station': get_station_name_by_id(from_id),
+        'to_station': get_station_name_by_id(to_id),
+        'booking_date': booking_date,
+        'journey_date': journey_date,
+        'class_type': class_type,
+        'status': 'Waitlisted' if seats[0] is None else 'Confirmed',
+        'passengers': [{'passenger_seq': seq, 'name': name, 'age': age, 'gender': gender, 'seat_number': seat,
+                        'waitlist': waitlist.get(seq)}
+                       for seq, ((name, age, gender), seat) in enumerate(zip(details, seats), start=1)],
+        'fare': float(fare or 0),
+        'total_fare': float(fare or 0) * len(details),
+        'fare_missing': fare is None
+    }
+
+STAFF_ROLES = ('agent', 'admin')
+
+def _require_owner(user, passenger_id):
+    """
+    Lets 'user' ({'user_id', 'role'}) act on a ticket booked by
+    'passenger_id' if it is theirs or they are staff; None is a trusted
+    caller. Someone else's PNR is reported as unknown, not forbidden, so
+    PNRs cannot be probed.
+    """
+    if user is not None and user['role'].lower() not in STAFF_ROLES and user['user_id'] != passenger_id:
+        raise ServiceError("Invalid PNR. Please check and try again.", 404)
+
+def lookup_ticket(pnr, user=None):
+    """
+    Returns a ticket by PNR with train and station names filled in. The
+    top-level passenger fields describe the first passenger; 'passengers'
+    lists everyone booked under the PNR. Tickets that joined a waitlist
+    carry their current 'waitlist' place and 'promoted_at' time (None
+    otherwise). Given the acting 'user', only their own tickets are found
+    unless they are staff (see _require_owner).
+    """
+    pnr = (pnr or "").strip()
+    if not pnr:
+        raise ServiceError("PNR is required.")
+    rows = _require_rows(db_execute(
+        """SELECT pnr, status, train_id, seat_number, from_station, to_station, class_type, booking_date,
+                  passenger_name, passenger_age, passenger_gender, passenger_id, passenger_seq, journey_date, ticket_id
+           FROM tickets WHERE pnr=%s ORDER BY passenger_seq""", (pnr,), fetch='all'))
+    if not rows:
+        raise ServiceError("Invalid PNR. Please check and try again.", 404)
+    _require_owner(user, rows[0][11])
+    queue = _require_rows(waitlist_details(r[14] for r in rows))
+    waitlist = [queue.get(r[14], {}) for r in rows]
+    row = rows[0]
+    return {
+        'pnr': row[0],
+        'status': row[1],
+        'train_id': row[2],
+        'train_name': get_train_name_by_id(row[2]),
+        'seat_number': row[3],
+        'from_station': get_station_name_by_id(row[4]),
+        'to_station': get_station_name_by_id(row[5]),
+        'class_type': row[6],
+        'booking_date': row[7],
+        'journey_date': row[13],
+        'passenger_name': row[8],
+        'passenger_age': row[9],
+        'passenger_gender': row[10],
+        'passenger_id': row[11],
+        'waitlist': waitlist[0].get('waitlist'),
+        'promoted_at': waitlist[0].get('promoted_at'),
+        'passengers': [{'passenger_seq': r[12], 'name': r[8], 'age': r[9], 'gender': r[10],
+                        'seat_number': r[3], 'status': r[1], 'waitlist': w.get('waitlist'),
+                        'promoted_at': w.get('promoted_at')} for r, w in zip(rows, waitlist)]
+    }
+
+def _waitlist_places(pnr):
+    """{passenger_seq: 'RAC n'/'WL n'} of a PNR's queued tickets."""
+    return {p['passenger_seq']: p['waitlist'] for p in lookup_ticket(pnr)['passengers'] if p['waitlist']}
+
+@timed_operation("cancel")
+def cancel_reservation(pnr, user=None):
+    """
+    Cancels a confirmed or waitlisted ticket whose journey is today or
+    later with one conditional UPDATE (see cancel_booking), handing its
+    seats to the waitlist or freeing them. Returns the cancelled ticket with
+    each passenger's previous status and refund. Only when nothing could be
+    cancelled is the PNR looked up, to tell why. Given the acting 'user',
+    the ticket's owner is checked first unless they are staff.
+    """
+    pnr = (pnr or "").strip()
+    if not pnr:
+        raise ServiceError("PNR is required.")
+    if user is not None and user['role'].lower() not in STAFF_ROLES:
+        owner = _require_rows(db_execute("SELECT passenger_id FROM tickets WHERE pnr=%s", (pnr,),
+                                         fetch='all', primary=True))
+        if not owner:
+            raise ServiceError("Invalid PNR. Please check and try again.", 404)
+        _require_owner(user, owner[0][0])
+    tickets = cancel_booking(pnr)
+    if tickets is None:
+        raise ServiceError("Failed to cancel ticket.", 503)
+    if not tickets:
+        if lookup_ticket(pnr, user)['status'] == 'Cancelled':
+            raise ServiceError("This ticket has already been cancelled.", 409)
+        raise ServiceError("This journey has already taken place.", 409)
+    return cancellation_details(tickets)
+
+def cancellation_details(tickets):
+    """A cancelled PNR's tickets (CANCELLED_COLUMNS rows) as a dict, with names filled in."""
+    rows = [manifest_row(t) for t in tickets]
+    first = dict(zip(MANIFEST_COLUMNS, rows[0]))
+    return {
+        'pnr': first['pnr'],
+        'status': 'Cancelled',
+        'train_id': first['train_id'],
+        'train_name': get_train_name_by_id(first['train_id']),
+        'from_station': get_station_name_by_id(first['from_station']),
+        'to_station': get_station_name_by_id(first['to_station']),
+        'class_type': first['class_type'],
+        'journey_date': tickets[0][9],
+        'passenger_id': first['passenger_id'],
+        'refund': sum(r[11] for r in rows),
+        'passengers': [{'passenger_seq': r[1], 'name': r[3], 'seat_number': r[9] or None,
+                        'previous_status': r[10], 'refund': r[11]} for r in rows]
+    }
+
+@timed_operation("cancel")
+def withdraw_service(train_id=None, journey_date=None, pnrs=None):
+    """
+    Bulk cancellation for admins (see bulk_cancel): every live ticket on a
+    train and/or journey date, or under a list of PNRs. Returns the summary
+    with a 'manifest' of one refund/notification entry per PNR:
+    'pnr', 'passenger_id', 'tickets' and 'refund'.
+    """
+    train_id = _require_int(train_id, "Train ID") if train_id not in (None, "") else None
+    journey_date = _require_date(journey_date, "Journey date")
+    if pnrs is not None and (not isinstance(pnrs, list) or not all(isinstance(p, str) for p in pnrs)):
+        raise ServiceError("PNRs must be a list of strings.")
+    pnrs = [p.strip() for p in pnrs or () if p.strip()]
+    if train_id is None and journey_date is None and not pnrs:
+        raise ServiceError("A train, a journey date or PNRs are required.")
+    if pnrs and (train_id is not None or journey_date is not None):
+        raise ServiceError("Give either a train and/or journey date, or PNRs.")
+    manifest = {}
+
+    def collect(tickets):
+        for t in tickets:
+            entry = manifest.setdefault(t[1], {'pnr': t[1], 'passenger_id': t[3], 'tickets': 0, 'refund': 0.0})
+            entry['tickets'] += 1
+            entry['refund'] += float(t[11])
+    try:
+        summary = bulk_cancel(train_id, journey_date, pnrs, on_batch=collect)
+    except DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        raise ServiceError("Bulk cancellation failed; tickets cancelled so far stay cancelled.", 503)
+    summary['manifest'] = list(manifest.values())
+    return summary
+
+def _ticket_page(filters, cursor, limit):
+    limit = min(_require_int(limit, "Limit"), SERVICE_PAGE_SIZE) if limit is not None else SERVICE_PAGE_SIZE
+    rows = _require_rows(fetch_ticket_view(cursor=cursor, limit=limit, **filters))
+    queue = _require_rows(waitlist_details(r[9] for r in rows))
+    tickets = [dict(zip(TICKET_VIEW_COLUMNS, r), waitlist=queue.get(r[9], {}).get('waitlist'),
+                    promoted_at=queue.get(r[9], {}).get('promoted_at')) for r in rows]
+    next_cursor = ticket_view_key(rows[-1]) if len(rows) == limit else None
+    return {"tickets": tickets, "next_cursor": next_cursor}
+
+def list_bookings(passenger_id, cursor=None, limit=None):
+    """One keyset page of a passenger's tickets, newest first; pass 'next_cursor' back for the next page."""
+    return _ticket_page({"passenger_id": _require_int(passenger_id, "Passenger ID")}, cursor, limit)
+
+@timed_operation("report")
+def ticket_report(train_id=None, status=None, date_from=None, date_to=None, cursor=None, limit=None):
+    """One keyset page of the booking report with the same filters as the Reports window."""
+    date_from, date_to = _require_date(date_from, "From date"), _require_date(date_to, "To date")
+    if date_from and date_to and date_from > date_to:
+        raise ServiceError("From date must not be after To date.")
+    filters = {
+        "train_id": _require_int(train_id, "Train ID") if train_id not in (None, "") else None,
+        "status": status or None,
+        "date_from": date_from,
+        "date_to": date_to
+    }
+    return _ticket_page(filters, cursor, limit)
+
+@timed_operation("report")
+def booking_dashboard(date_from=None, date_to=None, route_limit=DASHBOARD_ROUTE_ROWS,
+                      journey_limit=DASHBOARD_JOURNEY_ROWS):
+    """
+    Revenue by route and day and bookings, revenue and cancellation rates
+    by train for tickets booked between 'date_from' and 'date_to', and
+    occupancy of the journeys run between the same dates (inclusive,
+    either may be open), read from the booking rollups. Occupancy is the
+    share of a class's seats on one journey held by confirmed tickets;
+    waitlisted tickets are counted beside it.
+    """
+    date_from, date_to = _require_date(date_from, "From date"), _require_date(date_to, "To date")
+    if date_from and date_to and date_from > date_to:
+        raise ServiceError("From date must not be after To date.")
+    classes = _require_rows(train_class_stats(date_from, date_to))
+    routes = _require_rows(route_day_stats(date_from, date_to, route_limit))
+    journeys = _require_rows(journey_class_stats(date_from, date_to, journey_limit))
+
+    by_train = {}
+    for train_id, class_type, booked, cancelled, revenue in classes:
+        train = reference_cache.get_train(train_id)
+        totals = by_train.setdefault(train_id, {"train_id": train_id, "train_name": train[0] if train else str(train_id),
+                                                "booked": 0, "cancelled": 0, "revenue": 0.0})
+        totals["booked"] += int(booked or 0)
+        totals["cancelled"] += int(cancelled or 0)
+        totals["revenue"] += float(revenue or 0)
+    cancellations = sorted(by_train.values(), key=lambda t: t["cancelled"], reverse=True)
+    for t in cancellations:
+        t["cancellation_rate"] = t["cancelled"] / t["booked"] * 100 if t["booked"] else 0.0
+
+    occupancy = []
+    for journey_date, train_id, class_type, confirmed, waitlisted in journeys:
+        train = reference_cache.get_train(train_id)
+        seats = class_capacity(train_id, class_type)
+        occupancy.append({"journey_date": journey_date, "train_id": train_id,
+                          "train_name": train[0] if train else str(train_id), "class_type": class_type,
+                          "confirmed": int(confirmed), "waitlisted": int(waitlisted), "seats": seats,
+                          "occupancy": int(confirmed) / seats * 100 if seats else 0.0})
+
+    booked = sum(t["booked"] for t in cancellations)
+    cancelled = sum(t["cancelled"] for t in cancellations)
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": {"booked": booked, "cancelled": cancelled, "revenue": sum(t["revenue"] for t in cancellations),
+                   "cancellation_rate": cancelled / booked * 100 if booked else 0.0},
+        "occupancy": occupancy,
+        "routes": [{"date": r[0], "from_station_id": r[1], "from_station": get_station_name_by_id(r[1]),
+                    "to_station_id": r[2], "to_station": get_station_name_by_id(r[2]),
+                    "booked": int(r[3]), "cancelled": int(r[4]), "revenue": float(r[5])} for r in routes],
+        "cancellations": cancellations,
+    }
+
+# ---------------- MASTER DATA IMPORT ----------------
+# Bulk loading of stations, trains, schedules and fares from CSV or JSON.
+# Every row is validated in memory (including references to stations and
+# trains that are in the database or in the same import) before anything is
+# written. Natural keys are resolved to primary keys in memory as well, so
+# each table is written with one chunked INSERT ... ON DUPLICATE KEY UPDATE
+# on its primary key: rows that match an existing record update it, new
+# rows get a fresh ID.
+#   stations:  station_name, station_code (natural key), city, state
+#   trains:    train_id (natural key), train_name, train_type, total_seats
+#   schedules: train_id, sequence (natural key together), station_code or
+#              station_id, arrival_time, departure_time
+#   fares:     from_code/from_station, to_code/to_station, class_type
+#              (natural key together), fare_amount
+IMPORT_CHUNK_ROWS = 1000    # Rows per executemany() batch
+IMPORT_MAX_ERRORS = 100     # Validation messages kept in the report
+IMPORT_KINDS = ("stations", "trains", "schedules", "fares")  # Also the write order
+TIME_PATTERN = re.compile(r"^([01]?\d|2[0-3]):[0-5]\d(:[0-5]\d)?$")
+
+IMPORT_UPSERTS = {
+    "stations": """INSERT INTO stations (station_id, station_name, station_code, city, state)
+                   VALUES (%s, %s, %s, %s, %s)
+                   ON DUPLICATE KEY UPDATE station_name=VALUES(station_name), station_code=VALUES(station_code),
+                                           city=VALUES(city), state=VALUES(state)""",
+    "trains": """INSERT INTO trains (train_id, train_name, train_type, total_seats)
+                 VALUES (%s, %s, %s, %s)
+                 ON DUPLICATE KEY UPDATE train_name=VALUES(train_name), train_type=VALUES(train_type),
+                                         total_seats=VALUES(total_seats)""",
+    "schedules": """INSERT INTO train_schedule (schedule_id, train_id, station_id, arrival_time, departure_time, sequence)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE station_id=VALUES(station_id), arrival_time=VALUES(arrival_time),
+                                            departure_time=VALUES(departure_time)""",
+    "fares": """INSERT INTO fare_master (fare_id, from_station, to_station, class_type, fare_amount)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE fare_amount=VALUES(fare_amount)""",
+}
+
+def read_import_file(path, kind=None):
+    """
+    Reads an import file into {kind: [row dicts]}. A JSON file holds either
+    an object keyed by kind or a list of rows; a CSV file holds one kind.
+    Without 'kind', a list or CSV takes its kind from the file name
+    (e.g. 'fares_2025.csv'). Empty values become None.
+    """
+    name = os.path.basename(path).lower()
+    if kind is None:
+        kind = next((k for k in IMPORT_KINDS if name.startswith(k) or name.startswith(k.rstrip("s"))), None)
+    if name.endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {kind: data}
+    else:
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            data = {kind: list(csv.DictReader(f))}
+    if None in data:
+        raise ValueError(f"Cannot tell what '{os.path.basename(path)}' contains; choose stations, trains, schedules or fares.")
+
+    cleaned = {}
+    for k, rows in data.items():
+        if k not in IMPORT_KINDS:
+            raise ValueError(f"Unknown import section '{k}'.")
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ValueError(f"Section '{k}' must be a list of objects.")
+        cleaned[k] = [{str(c).strip().lower(): (v.strip() or None) if isinstance(v, str) else v
+                       for c, v in row.items() if c is not None} for row in rows]
+    return cleaned
+
+class ImportValidator:
+    """Validates import rows against the database and each other, resolving natural keys to IDs."""
+
+    def __init__(self, data):
+        self.data = data
+        self.errors = []
+        self.error_count = 0
+        self.rows = {}  # kind -> list of parameter tuples for IMPORT_UPSERTS
+        # Existing natural keys, loaded once
+        self.station_codes, self.station_ids = {}, set()
+        for station_id, code in self._load("SELECT station_id, station_code FROM stations"):
+            self.station_ids.add(station_id)
+            if code:
+                self.station_codes.setdefault(code.upper(), []).append(station_id)
+        self.train_ids = {r[0] for r in self._load("SELECT train_id FROM trains")}
+        self.schedule_keys = {(t, s): sid for sid, t, s in
+                              self._load("SELECT schedule_id, train_id, sequence FROM train_schedule")}
+        self.fare_keys = {(f, t, c): fid for fid, f, t, c in
+                          self._load("SELECT fare_id, from_station, to_station, class_type FROM fare_master")}
+        self.new_codes = set()   # Station codes added by this import
+        self.new_trains = set()  # Train IDs added by this import
+
+    @staticmethod
+    def _load(query):
+        """
+        Rows of existing master data. Raises DatabaseError if they cannot be
+        read, as an empty table would let every row through as new.
+        """
+        rows = db_execute(query, fetch='all', primary=True)
+        if rows is None:
+            raise DatabaseError(f"Could not read the existing master data: {query}")
+        return rows
+
+    def is_new(self, kind, row):
+        """Whether a resolved row creates a record rather than updating one (trains keep their own IDs)."""
+        return row[0] not in self.train_ids if kind == "trains" else row[0] is None
+
+    def error(self, kind, index, message):
+        self.error_count += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append(f"{kind} row {index}: {message}")
+
+    def validate(self):
+        """Validates every section in write order. Returns True if there were no errors."""
+        for kind in IMPORT_KINDS:
+            rows = self.data.get(kind)
+            if rows:
+                getattr(self, f"check_{kind}")(rows)
+        return self.error_count == 0
+
+    def _int(self, kind, i, row, field, required=True, minimum=None):
+        value = row.get(field)
+        if value is None:
+            if required:
+                self.error(kind, i, f"'{field}' is required")
+            return None
+        if isinstance(value, bool) or not is_int(str(value)) or (minimum is not None and int(value) < minimum):
+            self.error(kind, i, f"'{field}' must be an integer" + (f" >= {minimum}" if minimum is not None else ""))
+            return None
+        return int(value)
+
+    def _text(self, kind, i, row, field, max_len, required=False):
+        value = row.get(field)
+        if value is None:
+            if required:
+                self.error(kind, i, f"'{field}' is required")
+            return None
+        value = str(value)
+        if len(value) > max_len:
+            self.error(kind, i, f"'{field}' is longer than {max_len} characters")
+        return value
+
+    def _station(self, kind, i, row, code_field, id_field):
+        """Resolves a station reference given by code or by ID; codes of new stations resolve after they are written."""
+        if row.get(id_field) is not None:
+            station_id = self._int(kind, i, row, id_field)
+            if station_id is not None and station_id not in self.station_ids:
+                self.error(kind, i, f"station {station_id} does not exist")
+            return station_id
+        code = row.get(code_field)
+        if code is None:
+            self.error(kind, i, f"'{code_field}' or '{id_field}' is required")
+            return None
+        code = str(code).upper()
+        if code in self.new_codes:
+            return code  # Replaced by the new station's ID once stations are written
+        ids = self.station_codes.get(code)
+        if not ids:
+            self.error(kind, i, f"station code '{code}' does not exist")
+            return None
+        if len(ids) > 1:
+            self.error(kind, i, f"station code '{code}' matches several stations; use '{id_field}'")
+            return None
+        return ids[0]
+
+    def check_stations(self, rows):
+        out, seen = [], set()
+        for i, row in enumerate(rows, start=1):
+            name = self._text("stations", i, row, "station_name", 50, required=True)
+            code = self._text("stations", i, row, "station_code", 10, required=True)
+            if code is None:
+                continue
+            code = code.upper()
+            if code in seen:
+                self.error("stations", i, f"station code '{code}' appears twice"); continue
+            seen.add(code)
+            ids = self.station_codes.get(code, [])
+            if len(ids) > 1:
+                self.error("stations", i, f"station code '{code}' matches several existing stations"); continue
+            if not ids:
+                self.new_codes.add(code)
+            out.append((ids[0] if ids else None, name, code,
+                        self._text("stations", i, row, "city", 50), self._text("stations", i, row, "state", 50)))
+        self.rows["stations"] = out
+
+    def check_trains(self, rows):
+        out, seen = [], set()
+        for i, row in enumerate(rows, start=1):
+            train_id = self._int("trains", i, row, "train_id", minimum=1)
+            name = self._text("trains", i, row, "train_name", 50, required=True)
+            train_type = self._text("trains", i, row, "train_type", 20)
+            seats = self._int("trains", i, row, "total_seats", minimum=1)
+            if train_id is None:
+                continue
+            if train_id in seen:
+                self.error("trains", i, f"train {train_id} appears twice"); continue
+            seen.add(train_id)
+            out.append((train_id, name, train_type, seats))
+        self.new_trains = seen - self.train_ids
+        self.rows["trains"] = out
+
+    def check_schedules(self, rows):
+        known_trains = self.train_ids | self.new_trains
+        out, seen = [], set()
+        for i, row in enumerate(rows, start=1):
+            train_id = self._int("schedules", i, row, "train_id")
+            station = self._station("schedules", i, row, "station_code", "station_id")
+            sequence = self._int("schedules", i, row, "sequence", minimum=1)
+            times = []
+            for field in ("arrival_time", "departure_time"):
+                value = row.get(field)
+                if value is not None and not TIME_PATTERN.match(str(value)):
+                    self.error("schedules", i, f"'{field}' must look like HH:MM or HH:MM:SS")
+                times.append(value)
+            if train_id is not None and train_id not in known_trains:
+                self.error("schedules", i, f"train {train_id} does not exist"); continue
+            if train_id is None or sequence is None:
+                continue
+            if (train_id, sequence) in seen:
+                self.error("schedules", i, f"train {train_id} has two stops with sequence {sequence}"); continue
+            seen.add((train_id, sequence))
+            out.append((self.schedule_keys.get((train_id, sequence)), train_id, station, times[0], times[1], sequence))
+        self.rows["schedules"] = out
+
+    def check_fares(self, rows):
+        out, seen = [], set()
+        for i, row in enumerate(rows, start=1):
+            from_station = self._station("fares", i, row, "from_code", "from_station")
+            to_station = self._station("fares", i, row, "to_code", "to_station")
+            class_type = row.get("class_type")
+            if class_type not in TRAVEL_CLASSES:
+                self.error("fares", i, f"'class_type' must be one of: {', '.join(TRAVEL_CLASSES)}")
+            try:
+                amount = float(row.get("fare_amount"))
+                if amount < 0: raise ValueError
+            except (TypeError, ValueError):
+                self.error("fares", i, "'fare_amount' must be a number >= 0"); continue
+            if from_station is None or to_station is None or class_type not in TRAVEL_CLASSES:
+                continue
+            if from_station == to_station:
+                self.error("fares", i, "from and to stations are the same"); continue
+            key = (from_station, to_station, class_type)
+            if key in seen:
+                self.error("fares", i, "the same route and class appears twice"); continue
+            seen.add(key)
+            out.append((self.fare_keys.get(key), from_station, to_station, class_type, f"{amount:.2f}"))
+        self.rows["fares"] = out
+
+def _resolve_new_codes(cursor, rows, columns):
+    """Swaps the station codes of stations created by this import for their new IDs."""
+    cursor.execute("SELECT station_code, MAX(station_id) FROM stations GROUP BY station_code")
+    ids = {code.upper(): sid for code, sid in cursor.fetchall() if code}
+    resolved = []
+    for row in rows:
+        row = list(row)
+        for c in columns:
+            if isinstance(row[c], str):
+                row[c] = ids[row[c]]
+        resolved.append(tuple(row))
+    return resolved
+
+def import_master_data(data, dry_run=False, chunk_size=IMPORT_CHUNK_ROWS):
+    """
+    Imports {kind: [row dicts]} (see read_import_file) as one transaction.
+    Nothing is written if any row fails validation or if dry_run is set.
+    Returns a report dict with per-kind 'counts', 'inserted' and 'updated'
+    rows, 'errors' (the first IMPORT_MAX_ERRORS) and 'error_count',
+    'elapsed' seconds and 'rows_per_sec'.
+    Raises one of DB_ERRORS if the existing master data cannot be read or
+    the write fails (it is rolled back).
+    """
+    started = time.perf_counter()
+    validator = ImportValidator(data)
+    valid = validator.validate()
+    report = {
+        "dry_run": dry_run,
+        "counts": {k: len(data.get(k) or []) for k in IMPORT_KINDS if data.get(k)},
+        "inserted": {k: sum(validator.is_new(k, r) for r in rows) for k, rows in validator.rows.items()},
+        "updated": {k: sum(not validator.is_new(k, r) for r in rows) for k, rows in validator.rows.items()},
+        "errors": validator.errors,
+        "error_count": validator.error_count,
+    }
+
+    if valid and not dry_run:
+        with db_transaction() as cursor:
+            for kind in IMPORT_KINDS:
+                rows = validator.rows.get(kind)
+                if not rows:
+                    continue
+                if kind == "schedules" and validator.new_codes:
+                    rows = _resolve_new_codes(cursor, rows, (2,))
+                elif kind == "fares" and validator.new_codes:
+                    rows = _resolve_new_codes(cursor, rows, (1, 2))
+                for start in range(0, len(rows), chunk_size):
+                    cursor.executemany(IMPORT_UPSERTS[kind], rows[start:start + chunk_size])
+            if validator.rows.get("schedules"):
+                refresh_od_index(cursor)
+        # Derived in-memory state follows the new master data
+        reference_cache.invalidate()
+        if validator.rows.get("trains"):
+            seat_inventory.invalidate()
+        if validator.rows.get("schedules"):
+            journey_planner.invalidate()
+
+    report["elapsed"] = time.perf_counter() - started
+    total = sum(report["counts"].values())
+    report["rows_per_sec"] = total / report["elapsed"] if report["elapsed"] > 0 else 0.0
+    return report
+
+def format_import_report(report):
+    """Renders an import report as text for the import window and the command line."""
+    lines = ["Dry run: nothing was written." if report["dry_run"] and not report["error_count"] else
+             "Import rejected: nothing was written." if report["error_count"] else "Import committed."]
+    for kind, count in report["counts"].items():
+        lines.append(f"  {kind}: {count} rows ({report['inserted'].get(kind, 0)} new, "
+                     f"{report['updated'].get(kind, 0)} updates)")
+    lines.append(f"  {report['elapsed']:.2f}s, {report['rows_per_sec']:.0f} rows/s")
+    if report["error_count"]:
+        lines.append(f"\n{report['error_count']} error(s):")
+        lines.extend("  " + e for e in report["errors"])
+        if report["error_count"] > len(report["errors"]):
+            lines.append(f"  ... and {report['error_count'] - len(report['errors'])} more")
+    return "\n".join(lines)
+
+# ---------------- SCHEMA MIGRATIONS ----------------
+# railway_system.sql is schema version 0. Each migration below moves the
+# database one version forward; schema_migrations records the versions
+# applied. 'down' undoes 'up' statement by statement (and is run in reverse
+# order), so a failed migration can be backed out on MySQL, where DDL is not
+# transactional. 'check' is a
+# query that must return no rows before the migration may run.
+SCHEMA_MIGRATIONS = (
+    {
+        "version": 1,
+        "name": "Composite indexes for availability, My Bookings, reports and station schedules",
+        "up": (
+            # Covers the per-class availability counts and the seat bitmap load
+            "CREATE INDEX idx_tickets_train_status ON tickets (train_id, status, class_type, seat_number)",
+            "CREATE INDEX idx_tickets_passenger_date ON tickets (passenger_id, booking_date)",
+            "CREATE INDEX idx_tickets_date_status ON tickets (booking_date, status)",
+            "CREATE INDEX idx_train_schedule_station ON train_schedule (station_id, train_id, sequence)",
+        ),
+        "down": (
+            "DROP INDEX idx_tickets_train_status ON tickets",
+            "DROP INDEX idx_tickets_passenger_date ON tickets",
+            "DROP INDEX idx_tickets_date_status ON tickets",
+            "DROP INDEX idx_train_schedule_station ON train_schedule",
+        ),
+    },
+    {
+        "version": 2,
+        "name": "Unique fare per route and class",
+        "check": ("""SELECT from_station, to_station, class_type, COUNT(*) FROM fare_master
+                     GROUP BY from_station, to_station, class_type HAVING COUNT(*) > 1""",
+                  "fare_master has several fares for the same route and class"),
+        "up": ("CREATE UNIQUE INDEX uq_fare_master_route_class ON fare_master (from_station, to_station, class_type)",),
+        "down": ("DROP INDEX uq_fare_master_route_class ON fare_master",),
+    },
+    {
+        "version": 3,
+        "name": "Booking rollup tables for the dashboard",
+        "up": (
+            """CREATE TABLE daily_train_stats (
+                   stat_date DATE NOT NULL,
+                   train_id INT NOT NULL,
+                   class_type VARCHAR(20) NOT NULL,
+                   booked INT NOT NULL DEFAULT 0,
+                   cancelled INT NOT NULL DEFAULT 0,
+                   revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+                   PRIMARY KEY (stat_date, train_id, class_type))""",
+            """CREATE TABLE monthly_train_stats (
+                   stat_date DATE NOT NULL,
+                   train_id INT NOT NULL,
+                   class_type VARCHAR(20) NOT NULL,
+                   booked INT NOT NULL DEFAULT 0,
+                   cancelled INT NOT NULL DEFAULT 0,
+                   revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+                   PRIMARY KEY (stat_date, train_id, class_type))""",
+            """CREATE TABLE daily_route_stats (
+                   stat_date DATE NOT NULL,
+                   from_station INT NOT NULL,
+                   to_station INT NOT NULL,
+                   booked INT NOT NULL DEFAULT 0,
+                   cancelled INT NOT NULL DEFAULT 0,
+                   revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+                   PRIMARY KEY (stat_date, from_station, to_station))""",
+            # Fill them from the existing tickets
+            *rollup_statements("1=1", tables=ROLLUP_TABLES[:3], source=FARE_MASTER_SOURCE,
+                               fare="COALESCE(f.fare_amount, 0)"),
+        ),
+        "down": (
+            "DROP TABLE daily_train_stats",
+            "DROP TABLE monthly_train_stats",
+            "DROP TABLE daily_route_stats",
+            "DELETE FROM daily_train_stats",
+            "DELETE FROM monthly_train_stats",
+            "DELETE FROM daily_route_stats",
+        ),
+    },
+    {
+        "version": 4,
+        "name": "Journey dates and seat claims partitioned by journey date, train and class",
+        "check": ("""SELECT train_id, booking_date, class_type, seat_number, COUNT(*) FROM tickets
+                     WHERE status = 'Confirmed' AND seat_number IS NOT NULL
+                     GROUP BY train_id, booking_date, class_type, seat_number HAVING COUNT(*) > 1""",
+                  "several confirmed tickets hold the same seat on the same day"),
+        "up": (
+            "ALTER TABLE tickets ADD COLUMN journey_date DATE NULL",
+            # Earlier tickets were for travel on the day they were booked
+            "UPDATE tickets SET journey_date = booking_date",
+            # One claim per ticket. The partition key leads with the journey date, so one
+            # date's claims, and the dates to prune, are each a single range of it
+            """CREATE TABLE seat_claims (
+                   journey_date DATE NOT NULL,
+                   train_id INT NOT NULL,
+                   class_type VARCHAR(20) NOT NULL,
+                   seat_number VARCHAR(10) NOT NULL,
+                   ticket_id INT NOT NULL,
+                   PRIMARY KEY (ticket_id),
+                   CONSTRAINT fk_seat_claims_train FOREIGN KEY (train_id) REFERENCES trains (train_id),
+                   CONSTRAINT fk_seat_claims_ticket FOREIGN KEY (ticket_id) REFERENCES tickets (ticket_id))""",
+            "CREATE UNIQUE INDEX uq_seat_claims_partition ON seat_claims (journey_date, train_id, class_type, seat_number)",
+            # The seats of the confirmed tickets
+            """INSERT INTO seat_claims (journey_date, train_id, class_type, seat_number, ticket_id)
+               SELECT journey_date, train_id, class_type, seat_number, ticket_id FROM tickets
+               WHERE status = 'Confirmed' AND seat_number IS NOT NULL""",
+        ),
+        "down": (
+            "ALTER TABLE tickets DROP COLUMN journey_date",
+            "UPDATE tickets SET journey_date = NULL",
+            "DROP TABLE seat_claims",
+            "DROP INDEX uq_seat_claims_partition ON seat_claims",
+            "DELETE FROM seat_claims",
+        ),
+    },
+    {
+        "version": 5,
+        "name": "Waitlist queues per journey date, train and class",
+        "up": (
+            """CREATE TABLE waitlist (
+                   ticket_id INT NOT NULL,
+                   journey_date DATE NOT NULL,
+                   train_id INT NOT NULL,
+                   class_type VARCHAR(20) NOT NULL,
+                   queued_at DATETIME NOT NULL,
+                   promoted_at DATETIME NULL,
+                   PRIMARY KEY (ticket_id),
+                   CONSTRAINT fk_waitlist_train FOREIGN KEY (train_id) REFERENCES trains (train_id),
+                   CONSTRAINT fk_waitlist_ticket FOREIGN KEY (ticket_id) REFERENCES tickets (ticket_id))""",
+            # Queued tickets of a partition in booking order: the queue head is the first entry of its range
+            "CREATE INDEX idx_waitlist_queue ON waitlist (journey_date, train_id, class_type, promoted_at, ticket_id)",
+            """CREATE TABLE waitlist_queues (
+                   journey_date DATE NOT NULL,
+                   train_id INT NOT NULL,
+                   class_type VARCHAR(20) NOT NULL,
+                   queued INT NOT NULL DEFAULT 0,
+                   PRIMARY KEY (journey_date, train_id, class_type))""",
+        ),
+        "down": (
+            "DROP TABLE waitlist",
+            "DROP INDEX idx_waitlist_queue ON waitlist",
+            "DROP TABLE waitlist_queues",
+        ),
+    },
+    {
+        "version": 6,
+        "name": "Tickets by journey date, for withdrawing a day's services",
+        "up": ("CREATE INDEX idx_tickets_journey_train ON tickets (journey_date, train_id)",),
+        "down": ("DROP INDEX idx_tickets_journey_train ON tickets",),
+    },
+    {
+        "version": 7,
+        "name": "Replication heartbeat for routing reads to replicas",
+        "up": (
+            "CREATE TABLE replication_heartbeat (id INT NOT NULL PRIMARY KEY, beat DOUBLE NOT NULL)",
+            "INSERT INTO replication_heartbeat (id, beat) VALUES (1, 0)",
+        ),
+        "down": (
+            "DROP TABLE replication_heartbeat",
+            "DELETE FROM replication_heartbeat",
+        ),
+    },
+    {
+        "version": 8,
+        "name": "Seated and waitlisted tickets per journey, for occupancy",
+        "up": (
+            """CREATE TABLE journey_class_stats (
+                   stat_date DATE NOT NULL,
+                   train_id INT NOT NULL,
+                   class_type VARCHAR(20) NOT NULL,
+                   confirmed INT NOT NULL DEFAULT 0,
+                   waitlisted INT NOT NULL DEFAULT 0,
+                   PRIMARY KEY (stat_date, train_id, class_type))""",
+            *rollup_statements("1=1", tables=ROLLUP_TABLES[3:]),
+        ),
+        "down": (
+            "DROP TABLE journey_class_stats",
+            "DELETE FROM journey_class_stats",
+        ),
+    },
+    {
+        "version": 9,
+        "name": "Fare each ticket was booked at, for refunds and revenue",
+        "up": (
+            "ALTER TABLE tickets ADD COLUMN fare DECIMAL(10,2) NULL",
+            # Earlier tickets are valued at today's fares, as the rollups valued them
+            BACKFILL_TICKET_FARES,
+        ),
+        "down": (
+            "ALTER TABLE tickets DROP COLUMN fare",
+            "UPDATE tickets SET fare = NULL",
+        ),
+    },
+    {
+        "version": 10,
+        "name": "Origin-destination index for route search",
+        "up": (
+            # One row per train and pair of its stops, 'from' before 'to' (see ORIGIN-DESTINATION INDEX)
+            """CREATE TABLE train_od_index (
+                   train_id INT NOT NULL,
+                   from_station INT NOT NULL,
+                   to_station INT NOT NULL,
+                   from_sequence INT NOT NULL,
+                   to_sequence INT NOT NULL,
+                   departure_time TIME NULL,
+                   arrival_time TIME NULL,
+                   PRIMARY KEY (train_id, from_sequence, to_sequence))""",
+            "CREATE INDEX idx_train_od_index_route ON train_od_index (from_station, to_station, train_id)",
+            OD_INDEX_INSERT,
+        ),
+        "down": (
+            "DROP TABLE train_od_index",
+            "DROP INDEX idx_train_od_index_route ON train_od_index",
+            "DELETE FROM train_od_index",
+        ),
+    },
+    {
+        "version": 11,
+        "name": "Several passengers per PNR",
+        "up": (
+            "ALTER TABLE tickets ADD COLUMN passenger_seq INT NOT NULL DEFAULT 1",
+            "DROP INDEX pnr ON tickets",
+            "CREATE UNIQUE INDEX pnr ON tickets (pnr, passenger_seq)",
+        ),
+        "down": (
+            "ALTER TABLE tickets DROP COLUMN passenger_seq",
+            # Fails while group bookings share a PNR
+            "CREATE UNIQUE INDEX pnr ON tickets (pnr)",
+            "DROP INDEX pnr ON tickets",
+        ),
+    },
+)
+SCHEMA_VERSION = max(m["version"] for m in SCHEMA_MIGRATIONS)
+
+class MigrationError(Exception):
+    """Raised when a migration cannot be applied or rolled back."""
+
+def applied_migrations(conn):
+    """Returns {version: applied_at} from schema_migrations, creating the table if needed."""
+    with conn.cursor(buffered=True) as cursor:
+        cursor.execute("""CREATE TABLE IF NOT EXISTS schema_migrations (
+                              version INT NOT NULL PRIMARY KEY,
+                              name VARCHAR(200) NOT NULL,
+                              applied_at DATETIME NOT NULL)""")
+        cursor.execute("SELECT version, applied_at FROM schema_migrations")
+        return dict(cursor.fetchall())
+
+def _run_migration(conn, migration, upgrade):
+    """Applies (or reverts) one migration; on failure the statements already run are undone."""
+    steps = list(zip(migration["up"], migration["down"]))
+    if not upgrade:
+        steps = [(down, up) for up, down in reversed(steps)]
+    done = []
+    conn.start_transaction()
+    try:
+        with conn.cursor(buffered=True) as cursor:
+            if upgrade and migration.get("check"):
+                query, problem = migration["check"]
+                cursor.execute(query)
+                conflicts = cursor.fetchall()
+                if conflicts:
+                    raise MigrationError(f"{problem}: {', '.join(map(str, conflicts[:5]))}"
+                                         f"{' ...' if len(conflicts) > 5 else ''}")
+            for statement, undo in steps:
+                cursor.execute(statement)
+                done.append(undo)
+            if upgrade:
+                cursor.execute("INSERT INTO schema_migrations (version, name, applied_at) VALUES (%s, %s, %s)",
+                               (migration["version"], migration["name"], datetime.datetime.now().replace(microsecond=0)))
+            else:
+                cursor.execute("DELETE FROM schema_migrations WHERE version=%s", (migration["version"],))
+        conn.commit()
+    except (MigrationError, *DB_ERRORS) as err:
+        conn.rollback()
+        # MySQL has committed every DDL statement already; SQLite rolled them back and these just fail
+        with conn.cursor(buffered=True) as cursor:
+            for statement in reversed(done):
+                try:
+                    cursor.execute(statement)
+                except DB_ERRORS:
+                    pass
+        action = "apply" if upgrade else "roll back"
+        raise MigrationError(f"Could not {action} migration {migration['version']} ({migration['name']}): {err}") from err
+
+def pending_migrations():
+    """Versions up to SCHEMA_VERSION not yet applied to the database, or None on database error."""
+    try:
+        with get_db_pool().connection() as conn:
+            applied = applied_migrations(conn)
+    except DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        return None
+    return [m["version"] for m in SCHEMA_MIGRATIONS if m["version"] not in applied]
+
+def migrate_schema(conn, target=SCHEMA_VERSION, progress=None):
+    """
+    Brings the database on 'conn' to schema version 'target', applying
+    pending migrations in order or reverting newer ones in reverse order.
+    progress(message) is called before each step. Returns the versions
+    changed. Raises MigrationError if a step fails (earlier steps stay).
+    """
+    applied = applied_migrations(conn)
+    changed = []
+    for migration in SCHEMA_MIGRATIONS:
+        if migration["version"] <= target and migration["version"] not in applied:
+            if progress:
+                progress(f"Applying {migration['version']}: {migration['name']}")
+            _run_migration(conn, migration, True)
+            changed.append(migration["version"])
+    for migration in reversed(SCHEMA_MIGRATIONS):
+        if migration["version"] > target and migration["version"] in applied:
+            if progress:
+                progress(f"Reverting {migration['version']}: {migration['name']}")
+            _run_migration(conn, migration, False)
+            changed.append(migration["version"])
+    return changed
+
+# The app's hot queries and the index each one should use once migrated:
+# (name, expected index, build(sample) -> (query, params)). 'sample' holds
+# existing ids to fill the parameters with (see query_plan_sample()).
+QUERY_PLAN_CHECKS = (
+    ("availability", "uq_seat_claims_partition",
+     lambda s: (BOOKED_BY_CLASS_QUERY.format(placeholders="%s"), (s["journey_date"], s["train_id"]))),
+    ("seat inventory", "uq_seat_claims_partition",
+     lambda s: (PARTITION_SEATS_QUERY, (s["journey_date"], s["train_id"], s["class_type"]))),
+    ("waitlist head", "idx_waitlist_queue",
+     lambda s: (QUEUE_HEAD_QUERY, (s["journey_date"], s["train_id"], s["class_type"]))),
+    ("trains on a date", "idx_tickets_journey_train",
+     lambda s: ("SELECT DISTINCT train_id FROM tickets WHERE journey_date=%s", (s["journey_date"],))),
+    ("my bookings", "idx_tickets_passenger_date",
+     lambda s: build_ticket_view_query(passenger_id=s["passenger_id"], limit=SERVICE_PAGE_SIZE)),
+    ("report", "idx_tickets_date_status",
+     lambda s: build_ticket_view_query(status="Confirmed", date_from=s["date_from"], limit=SERVICE_PAGE_SIZE)),
+    ("fare lookup", "uq_fare_master_route_class",
+     lambda s: (FARE_QUERY, (s["from_station"], s["to_station"], s["class_type"]))),
+    ("route search", "idx_train_od_index_route",
+     lambda s: (ROUTE_SEARCH_QUERY, (s["from_station"], s["to_station"]))),
+    ("route check", "idx_train_od_index_route",
+     lambda s: (TRAIN_SERVES_QUERY, (s["train_id"], s["from_station"], s["to_station"]))),
+)
+
+def query_plan_sample(rng=None):
+    """
+    Ids for QUERY_PLAN_CHECKS taken from a (random, if 'rng' is given)
+    existing ticket and fare; the ticket's booking date doubles as the
+    journey date, which older schema versions lack.
+    """
+    pick = (lambda rows: rng.choice(rows)) if rng else (lambda rows: rows[0])
+    tickets = db_execute("SELECT train_id, passenger_id, booking_date FROM tickets ORDER BY ticket_id DESC LIMIT 1000",
+                         fetch='all')
+    fares = db_execute("SELECT from_station, to_station, class_type FROM fare_master LIMIT 1000", fetch='all')
+    if not tickets or not fares:
+        return None
+    train_id, passenger_id, booking_date = pick(tickets)
+    from_station, to_station, class_type = pick(fares)
+    return {"train_id": train_id, "passenger_id": passenger_id, "date_from": booking_date, "journey_date": booking_date,
+            "from_station": from_station, "to_station": to_station, "class_type": class_type}
+
+def check_query_plans(sample):
+    """
+    EXPLAINs every QUERY_PLAN_CHECKS query. Returns a list of dicts with
+    'name', 'expected', 'indexes' (used by the plan), 'ok' and 'plan' lines.
+    A query the schema cannot run yet (not migrated) gets the error as its plan.
+    """
+    backend = get_db_backend()
+    results = []
+    with get_db_pool().connection() as conn:
+        with conn.cursor(buffered=True) as cursor:
+            for name, expected, build in QUERY_PLAN_CHECKS:
+                query, params = build(sample)
+                try:
+                    indexes, plan = backend.explain(cursor, query, params)
+                except DB_ERRORS as err:
+                    indexes, plan = [], [f"Error: {err}"]
+                results.append({"name": name, "expected": expected, "indexes": indexes,
+                                "ok": expected in indexes, "plan": plan})
+    return results
+
+# ---------------- BACKGROUND TASKS ----------------
+class TaskExecutor:
+    """
+    Runs DB and file work on a thread pool so the Tk main loop never blocks.
+    Results are queued by the workers and delivered on the Tk thread by a
+    poller scheduled with after(). Submitting again under the same key makes
+    earlier tasks with that key stale: their results are silently dropped.
+    """
+    POLL_MS = 25
+
+    def __init__(self, max_workers=DB_POOL_SIZE):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="railway-task")
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._generations = {}  # key -> (generation, future)
+        self._root = None
+
+    def start(self, root):
+        """Begins delivering results on the given Tk root."""
+        self._root = root
+        self._root.after(self.POLL_MS, self._drain)
+
+    def submit(self, widget, func, args=(), on_success=None, on_error=None, on_complete=None, key=None):
+        """
+        Runs func(*args) in the background. on_success(result) or on_error(exc) is
+        called on the Tk thread unless the task went stale or 'widget' was destroyed;
+        on_complete() always runs once the task is finished or dropped.
+        """
+        with self._lock:
+            generation = self._generations.get(key, (0, None))[0] + 1
+            if key is not None:
+                previous = self._generations.get(key)
+                if previous and previous[1] is not None:
+                    previous[1].cancel()  # Only succeeds if it has not started yet
+            future = self._pool.submit(self._run, func, args, self._scope(widget))
+            if key is not None:
+                self._generations[key] = (generation, future)
+        future.add_done_callback(lambda f: self._results.put((f, widget, key, generation, on_success, on_error, on_complete)))
+        return future
+
+    @staticmethod
+    def _scope(widget):
+        """Name of the window that submitted a task, for query instrumentation."""
+        try:
+            return type(widget.winfo_toplevel()).__name__ if widget is not None else None
+        except tk.TclError:
+            return None
+
+    @staticmethod
+    def _run(func, args, scope):
+        with query_scope(scope):
+            return func(*args)
+
+    def is_current(self, key, generation):
+        with self._lock:
+            current = self._generations.get(key)
+            return current is None or current[0] == generation
+
+    def _drain(self):
+        while True:
+            try:
+                future, widget, key, generation, on_success, on_error, on_complete = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(future, widget, key, generation, on_success, on_error, on_complete)
+        if self._root is not None:
+            try:
+                self._root.after(self.POLL_MS, self._drain)
+            except tk.TclError:
+                pass  # Application is shutting down
+
+    def _deliver(self, future, widget, key, generation, on_success, on_error, on_complete):
+        try:
+            alive = widget is None or bool(widget.winfo_exists())
+        except tk.TclError:
+            alive = False
+        stale = key is not None and not self.is_current(key, generation)
+        if alive and on_complete:
+            on_complete()
+        if not alive or stale or future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            if on_error:
+                on_error(error)
+        elif on_success:
+            on_success(future.result())
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+task_executor = TaskExecutor()
+
+# ---------------- IMAGE ASSETS ----------------
+# Window backgrounds are decoded once per run (at reduced JPEG scale where
+# that still covers the largest size needed) and scaled to every size the
+# windows use. Each variant is written to IMAGE_CACHE_DIR as a PPM, which Tk
+# reads natively, so later starts need neither PIL nor the JPEG decoder, and
+# kept in memory as a PhotoImage, so logging out and in again is free.
+IMAGE_CACHE_DIR = os.environ.get("RAILWAY_IMAGE_CACHE",
+                                 os.path.join(os.path.expanduser("~"), ".cache", "railway_system"))
+BACKGROUND_IMAGE = "bg.jpeg"
+IMAGE_VARIANTS = {BACKGROUND_IMAGE: ((1000, 600), (800, 600))}  # Login window, main menu
+
+class ImageAssets:
+    """Scaled image cache: prepare() may run on any thread, photo() on the Tk thread only."""
+
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, variants=IMAGE_VARIANTS):
+        self.cache_dir = cache_dir
+        self.variants = variants
+        self._lock = threading.Lock()
+        self._sources = {}  # path -> decoded image, kept until all its variants are scaled
+        self._scaled = {}   # (path, size) -> cache file, or the image itself if it could not be written
+        self._photos = {}   # (path, size) -> PhotoImage
+        self.stats = {"decoded": 0, "scaled": 0, "loaded": 0, "reused": 0}
+
+    def _cache_file(self, path, size):
+        """Cache file of one variant; its name changes whenever the source file does."""
+        info = os.stat(path)
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return os.path.join(self.cache_dir, f"{stem}-{size[0]}x{size[1]}-{info.st_mtime_ns:x}{info.st_size:x}.ppm")
+
+    def prepare(self, path, sizes):
+        """Scales 'path' to each of 'sizes' not cached yet. Raises FileNotFoundError if 'path' is missing."""
+        with self._lock:
+            for size in sizes:
+                key = (path, size)
+                if key in self._scaled:
+                    continue
+                cache_file = self._cache_file(path, size)
+                if os.path.exists(cache_file):
+                    self._scaled[key] = cache_file
+                    continue
+                image = self._source(path, sizes).resize(size)
+                self.stats["scaled"] += 1
+                self._scaled[key] = self._write(cache_file, image)
+            if all((path, size) in self._scaled for size in self.variants.get(path, ())):
+                self._sources.pop(path, None)
+
+    def _source(self, path, sizes):
+        image = self._sources.get(path)
+        if image is None:
+            from PIL import Image  # Only needed when a variant is not in the disk cache
+            image = Image.open(path)
+            wanted = set(sizes) | set(self.variants.get(path, ()))
+            image.draft("RGB", (max(w for w, _ in wanted), max(h for _, h in wanted)))
+            image = image.convert("RGB")
+            self._sources[path] = image
+            self.stats["decoded"] += 1
+        return image
+
+    def _write(self, cache_file, image):
+        """Saves a variant, replacing older versions of it. Returns what photo() should load it from."""
+        prefix = os.path.basename(cache_file).rsplit("-", 1)[0] + "-"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for name in os.listdir(self.cache_dir):
+                if name.startswith(prefix) and name.endswith(".ppm"):
+                    os.remove(os.path.join(self.cache_dir, name))
+            image.save(cache_file + ".part", "PPM")
+            os.replace(cache_file + ".part", cache_file)
+            return cache_file
+        except OSError as err:
+            print(f"Image cache error: {err}")
+            return image
+
+    def photo(self, path, size):
+        """
+        PhotoImage of 'path' scaled to 'size'. The first call for an image
+        also scales its other IMAGE_VARIANTS on the background executor.
+        """
+        key = (path, size)
+        photo = self._photos.get(key)
+        if photo is not None:
+            self.stats["reused"] += 1
+            return photo
+        self.prepare(path, (size,))
+        scaled = self._scaled[key]
+        if isinstance(scaled, str):
+            photo = tk.PhotoImage(file=scaled)
+        else:
+            from PIL import ImageTk
+            photo = ImageTk.PhotoImage(scaled)
+        self.stats["loaded"] += 1
+        self._photos[key] = photo
+        missing = tuple(s for s in self.variants.get(path, ()) if (path, s) not in self._scaled)
+        if missing:
+            task_executor.submit(None, self.prepare, (path, missing))
+        return photo
+
+image_assets = ImageAssets()
 
 # ---------------- BASE WINDOW CLASS ----------------
 class BaseWindow(tk.Toplevel):
     """Base class for all application windows to ensure consistent styling."""
     def __init__(self, title, geometry):
         super().__init__()
+        self.base_title = title
+        self.busy_count = 0
         self.title(title)
         self.geometry(geometry)
         self.configure(bg="#2c3e50") # Dark blue background
         self.center_window()
 
+    def set_busy(self, busy):
+        """Shows a loading indicator (title suffix and watch cursor) while tasks are running."""
+        self.busy_count = max(0, self.busy_count + (1 if busy else -1))
+        loading = self.busy_count > 0
+        self.title(f"{self.base_title} - Loading..." if loading else self.base_title)
+        self.configure(cursor="watch" if loading else "")
+
+    def run_task(self, func, *args, on_success=None, key=None, error_title="Error"):
+        """
+        Runs func(*args) on the background executor and passes the result to
+        on_success on the Tk thread. Errors are reported in a message box
+        (a ServiceError's own message is shown as is).
+        A new task with the same key makes the previous one stale.
+        """
+        def on_error(err):
+            message = str(err) if isinstance(err, ServiceError) else f"Operation failed: {err}"
+            messagebox.showerror(error_title, message, parent=self)
+
+        self.set_busy(True)
+        return task_executor.submit(
+            self, func, args,
+            on_success=on_success,
+            on_error=on_error,
+            on_complete=lambda: self.set_busy(False),
+            key=(id(self), key) if key else None
+        )
+
+    def create_table(self, title, columns, height):
+        """Packs a titled, read-only Treeview with the given columns and returns it."""
+        frame = ttk.LabelFrame(self, text=title, padding=5)
+        frame.pack(fill="both", expand=True, padx=10, pady=5)
+        tree = ttk.Treeview(frame, columns=columns, show="headings", height=height)
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=90, anchor="w")
+        tree.pack(fill="both", expand=True)
+        return tree
+
+    @staticmethod
+    def fill(tree, rows):
+        tree.delete(*tree.get_children())
+        for row in rows:
+            tree.insert("", "end", values=row)
+
     def center_window(self):
         """Centers the window on the screen."""
         self.update_idletasks()
@@ -192,6 +4378,107 @@ def create_styled_label(parent, text):
     """Creates a styled label."""
     return ttk.Label(parent, text=text, font=('Segoe UI', 10))
 
+class StationEntry(ttk.Entry):
+    """
+    Autocompleting station picker backed by station_index. Matches for the
+    typed text drop down under the entry on every keystroke; Up/Down move
+    through them, Return, Tab or a click picks one and Escape closes them.
+    Text left unpicked is settled on its best match when the field loses
+    focus or is read, so get() returns an 'ID - Name' value (see
+    parse_id_from_combo) or an empty string.
+    """
+    FOCUS_OUT_MS = 150  # Lets a click on the list land before focus-out resolves the text
+
+    def __init__(self, parent, width=30):
+        self.text = tk.StringVar()
+        super().__init__(parent, textvariable=self.text, width=width, font=('Segoe UI', 10))
+        self.matches = []
+        self.popup = self.listbox = None
+        self._typing = True
+        self.text.trace_add("write", self.on_type)
+        self.bind("<Down>", lambda e: self.move(1))
+        self.bind("<Up>", lambda e: self.move(-1))
+        self.bind("<Return>", self.on_accept)
+        self.bind("<Tab>", self.on_accept)
+        self.bind("<Escape>", lambda e: self.hide())
+        self.bind("<FocusOut>", lambda e: self.after(self.FOCUS_OUT_MS, self.on_leave))
+
+    def get(self):
+        self.settle()
+        return self.text.get()
+
+    def set(self, value):
+        """Replaces the text without offering matches, like Combobox.set()."""
+        self._typing = False
+        self.text.set(value)
+        self._typing = True
+        self.icursor(tk.END)
+        self.hide()
+
+    def on_type(self, *_):
+        if self._typing:
+            self.matches = station_index.search(self.text.get())
+            self.show() if self.matches else self.hide()
+
+    def show(self):
+        if self.popup is None:
+            self.popup = tk.Toplevel(self)
+            self.popup.overrideredirect(True)
+            self.listbox = tk.Listbox(self.popup, width=self.cget("width"), activestyle="none", exportselection=False,
+                                      takefocus=0, bg="#34495e", fg="#ecf0f1", selectbackground="#3498db",
+                                      font=('Segoe UI', 10), borderwidth=1, highlightthickness=0)
+            self.listbox.pack(fill="both", expand=True)
+            self.listbox.bind("<ButtonRelease-1>", lambda e: self.pick(self.listbox.nearest(e.y)))
+        self.listbox.delete(0, tk.END)
+        self.listbox.insert(tk.END, *(f"{name} ({code}), {city}" for _, name, code, city in self.matches))
+        self.listbox.configure(height=len(self.matches))
+        self.listbox.selection_set(0)
+        self.popup.geometry(f"+{self.winfo_rootx()}+{self.winfo_rooty() + self.winfo_height()}")
+        self.popup.deiconify()
+        self.popup.lift()
+
+    def hide(self):
+        if self.popup is not None:
+            self.popup.withdraw()
+
+    def showing(self):
+        return self.popup is not None and self.popup.winfo_viewable()
+
+    def move(self, step):
+        if not self.showing():
+            self.on_type()
+            return "break"
+        selected = self.listbox.curselection()
+        index = min(max((selected[0] if selected else -1) + step, 0), len(self.matches) - 1)
+        self.listbox.selection_clear(0, tk.END)
+        self.listbox.selection_set(index)
+        self.listbox.see(index)
+        return "break"
+
+    def pick(self, index):
+        if 0 <= index < len(self.matches):
+            station_id, name = self.matches[index][:2]
+            self.set(station_label(station_id, name))
+
+    def on_accept(self, event):
+        if self.showing():
+            selected = self.listbox.curselection()
+            self.pick(selected[0] if selected else 0)
+            if event.keysym == "Return":
+                return "break"  # Tab still moves on to the next field
+
+    def settle(self):
+        """Keeps a picked station; other text is replaced by its best match, or cleared if nothing matches."""
+        text = self.text.get()
+        if text and station_index.label(parse_id_from_combo(text)) != text:
+            best = station_index.search(text, limit=1)
+            self.set(station_label(*best[0][:2]) if best else "")
+
+    def on_leave(self):
+        if self.winfo_exists() and str(self.tk.call("focus")) != str(self):
+            self.hide()
+            self.settle()
+
 def setup_styles():
     """Sets up modern ttk styles for the application."""
     style = ttk.Style()
@@ -221,15 +4508,147 @@ def setup_styles():
     style.configure("TLabelframe", background=BG_COLOR, foreground=FG_COLOR, font=('Segoe UI', 11, 'bold'))
     style.configure("TLabelframe.Label", background=BG_COLOR, foreground=FG_COLOR)
 
+# ---------------- PAGED GRID ----------------
+GRID_PAGE_SIZE = 100  # Rows fetched per page
+GRID_MAX_PAGES = 4    # Pages kept in the widget at once
+
+class PagedTreeview(ttk.Frame):
+    """
+    A Treeview that loads rows page by page with keyset pagination.
+    fetch_page(cursor, direction, limit) runs on the background executor and
+    returns raw rows in display order; key_func(row) gives a row's keyset
+    cursor and format_row(row) its displayed values. Pages are fetched as the
+    user scrolls near either end, and only max_pages pages stay in the widget.
+    """
+    PREFETCH_MARGIN = 0.1  # Fraction of the scroll range that triggers the next fetch
+
+    def __init__(self, parent, columns, fetch_page, key_func, format_row=None, headings=None,
+                 page_size=GRID_PAGE_SIZE, max_pages=GRID_MAX_PAGES, column_width=120):
+        super().__init__(parent)
+        self.fetch_page = fetch_page
+        self.key_func = key_func
+        self.format_row = format_row or (lambda row: row)
+        self.page_size = page_size
+        self.max_pages = max_pages
+
+        self.tree = ttk.Treeview(self, columns=columns, show="headings")
+        for i, col in enumerate(columns):
+            self.tree.heading(col, text=headings[i] if headings else col.replace("_", " ").title())
+            self.tree.column(col, anchor="center", width=column_width)
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_scroll)
+        self.tree.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+
+        self.pages = deque()  # Each page is a list of (iid, key)
+        self.at_start = True
+        self.at_end = False
+        self.pending = None   # Token of the fetch in flight
+
+    def reload(self):
+        """Clears the grid and fetches the first page."""
+        for i in self.tree.get_children(): self.tree.delete(i)
+        self.pages.clear()
+        self.at_start, self.at_end = True, False
+        self.pending = None
+        self.request(None, "next")
+
+    def request(self, cursor, direction):
+        token = object()
+        self.pending = token
+        owner = self.winfo_toplevel()
+        set_busy = getattr(owner, "set_busy", None)
+        if set_busy: set_busy(True)
+
+        def complete():
+            if set_busy: set_busy(False)
+            if self.pending is token:
+                self.pending = None
+
+        task_executor.submit(
+            self, self.fetch_page, (cursor, direction, self.page_size),
+            on_success=lambda rows: self.add_page(rows, direction),
+            on_error=lambda err: messagebox.showerror("Error", f"Failed to load rows: {err}", parent=owner),
+            on_complete=complete,
+            key=(id(self), "page")
+        )
+
+    def add_page(self, rows, direction):
+        rows = rows or []
+        if len(rows) < self.page_size:
+            if direction == "next":
+                self.at_end = True
+            else:
+                self.at_start = True
+        if not rows:
+            return
+
+        anchor = self.first_visible()
+        if direction == "next":
+            page = [(self.tree.insert("", "end", values=self.format_row(r)), self.key_func(r)) for r in rows]
+            self.pages.append(page)
+            if len(self.pages) > self.max_pages:
+                self.drop_page(self.pages.popleft())
+                self.at_start = False
+        else:
+            page = [(self.tree.insert("", i, values=self.format_row(r)), self.key_func(r)) for i, r in enumerate(rows)]
+            self.pages.appendleft(page)
+            if len(self.pages) > self.max_pages:
+                self.drop_page(self.pages.pop())
+                self.at_end = False
+        if anchor and self.tree.exists(anchor):
+            # Keep the rows the user was looking at in place
+            self.tree.yview_moveto(self.tree.index(anchor) / max(1, len(self.tree.get_children())))
+
+    def drop_page(self, page):
+        self.tree.delete(*[iid for iid, _ in page])
+
+    def first_visible(self):
+        return self.tree.identify_row(5) or None
+
+    def on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self.pending is not None or not self.pages:
+            return
+        if float(last) >= 1 - self.PREFETCH_MARGIN and not self.at_end:
+            self.request(self.pages[-1][-1][1], "next")
+        elif float(first) <= self.PREFETCH_MARGIN and not self.at_start:
+            self.request(self.pages[0][0][1], "prev")
+
 # ---------------- APPLICATION CLASS ----------------
 class RailwayApp:
     def __init__(self):
         self.root = tk.Tk()
         self.root.withdraw() # Hide the main root window initially
         setup_styles()
+        task_executor.start(self.root)
         self.show_login_window()
+        # Connecting, the schema check and the seat inventory load run while the login window is up
+        task_executor.submit(self.root, self.prepare_database, on_success=self.database_ready,
+                             on_error=self.database_failed)
         self.root.mainloop()
 
+    @staticmethod
+    def prepare_database():
+        """Startup work kept off the Tk thread. Returns the pending schema migrations."""
+        with get_db_pool().connection():
+            pass  # Raises if the database cannot be reached
+        pending = pending_migrations()
+        if not pending:
+            prune_seat_claims()  # Yesterday's journeys no longer hold seats
+            seat_inventory.rebuild()
+        return pending
+
+    def database_ready(self, pending):
+        if pending:
+            messagebox.showwarning("Database Schema", "The database schema is out of date. "
+                                   "Run 'python migrate.py' before booking tickets.")
+
+    def database_failed(self, err):
+        messagebox.showerror("Database Error", f"Failed to connect to database: {err}\n\n"
+                             "Application cannot start without a database connection.")
+        self.root.destroy()
+
     def show_login_window(self):
         """Displays the login window."""
         LoginWindow(self)
@@ -247,9 +4666,7 @@ class LoginWindow(BaseWindow):
         self.create_widgets()
 
     def create_widgets(self):
-        bg_image = Image.open("bg.jpeg") # Ensure bg.jpeg is in the same directory
-        bg_image = bg_image.resize((1000, 600))
-        self.bg_photo = ImageTk.PhotoImage(bg_image)
+        self.bg_photo = image_assets.photo(BACKGROUND_IMAGE, (1000, 600))  # BACKGROUND_IMAGE is in the working directory
         bg_label = tk.Label(self, image=self.bg_photo, borderwidth=0)
         bg_label.place(x=0, y=0, relwidth=1, relheight=1)
 
@@ -282,19 +4699,13 @@ class LoginWindow(BaseWindow):
             messagebox.showerror("Login Failed", "Username and Password are required.")
             return
 
-        user_data = db_execute(
-            "SELECT user_id, role, password, username FROM users WHERE username=%s",
-            (username,),
-            fetch='one'
-        )
+        self.run_task(authenticate_user, username, password, on_success=self.finish_login, key="login",
+                      error_title="Login Failed")
 
-        if user_data and user_data[2] == password:
-            user_id, role, _, uname = user_data
-            messagebox.showinfo("Login Success", f"Welcome, {uname}!")
-            self.destroy()
-            self.app.show_main_menu(role, user_id, uname)
-        else:
-            messagebox.showerror("Login Failed", "Invalid username or password.")
+    def finish_login(self, user):
+        messagebox.showinfo("Login Success", f"Welcome, {user['username']}!")
+        self.destroy()
+        self.app.show_main_menu(user['role'], user['user_id'], user['username'])
 
 # ---------------- MAIN MENU -----------------
 class MainMenu(BaseWindow):
@@ -307,16 +4718,16 @@ class MainMenu(BaseWindow):
         self.username = username
         self.protocol("WM_DELETE_WINDOW", self.logout)
         self.create_widgets()
+        # Warm the station/train cache and the station search index off the Tk thread so pickers open instantly
+        task_executor.submit(None, lambda: reference_cache.reload() and station_index.sync())
 
     def create_widgets(self):
         # --- 1. SET THE BACKGROUND IMAGE ---
         try:
-            bg_image = Image.open("bg.jpeg")
-            bg_image = bg_image.resize((800, 600))
-            self.bg_photo = ImageTk.PhotoImage(bg_image)
+            self.bg_photo = image_assets.photo(BACKGROUND_IMAGE, (800, 600))
         except FileNotFoundError:
             self.bg_photo = None
-            print("Warning: dashboard_bg.jpg not found. Using default background color.")
+            print(f"Warning: {BACKGROUND_IMAGE} not found. Using default background color.")
 
         bg_label = tk.Label(self, image=self.bg_photo, borderwidth=0)
         bg_label.place(x=0, y=0, relwidth=1, relheight=1)
@@ -346,7 +4757,9 @@ class MainMenu(BaseWindow):
                 ("Station Master", self.station_master),
                 ("Train Schedule", self.train_schedule),
                 ("Fare Master", self.fare_master),
-                ("View Reports", self.reports)
+                ("View Reports", self.reports),
+                ("Import Master Data", self.import_data),
+                ("Diagnostics", self.diagnostics)
             ])
         
         buttons.extend([
@@ -385,8 +4798,10 @@ class MainMenu(BaseWindow):
     def train_schedule(self): TrainScheduleWindow()
     def fare_master(self): FareMasterWindow()
     def reports(self): ReportsWindow()
-    def ticket_reservation(self): TicketReservationWindow(self.user_id)
-    def ticket_cancellation(self): TicketCancellationWindow()
+    def import_data(self): ImportWindow()
+    def diagnostics(self): DiagnosticsWindow()
+    def ticket_reservation(self): TicketReservationWindow(self.user_id, self.role)
+    def ticket_cancellation(self): TicketCancellationWindow({'user_id': self.user_id, 'role': self.role})
     def my_bookings(self): MyBookingsWindow(self.user_id)
 
     def logout(self):
@@ -415,6 +4830,8 @@ class CrudWindow(BaseWindow):
                 entry = create_styled_entry(form_frame)
             elif widget_type == 'password':
                 entry = create_styled_entry(form_frame, show='*')
+            elif widget_type == 'station':
+                entry = StationEntry(form_frame)
             elif isinstance(widget_type, list): # Combobox
                 entry = ttk.Combobox(form_frame, values=widget_type, state='readonly')
             entry.grid(row=i // 2, column=(i % 2) * 2 + 1, padx=5, pady=5, sticky="ew")
@@ -426,20 +4843,10 @@ class CrudWindow(BaseWindow):
         create_styled_button(button_frame, "Save", self.save_entry).pack(side="left", padx=5)
         create_styled_button(button_frame, "Clear", self.clear_form).pack(side="left", padx=5)
 
-        # Treeview Frame
-        tree_frame = ttk.Frame(self)
-        tree_frame.pack(fill="both", expand=True, padx=10, pady=5)
-        
-        self.tree = ttk.Treeview(tree_frame, columns=self.columns, show="headings")
-        for col in self.columns:
-            self.tree.heading(col, text=col.replace("_", " ").title())
-            self.tree.column(col, anchor="center", width=120)
-        
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        # Paged Treeview
+        self.grid_view = PagedTreeview(self, self.columns, self.fetch_page, self.row_key, self.format_row)
+        self.grid_view.pack(fill="both", expand=True, padx=10, pady=5)
+        self.tree = self.grid_view.tree
         
         self.tree.bind("<<TreeviewSelect>>", self.on_select)
 
@@ -449,7 +4856,7 @@ class CrudWindow(BaseWindow):
 
     def clear_form(self):
         for entry in self.entries.values():
-            if isinstance(entry, ttk.Combobox):
+            if isinstance(entry, (ttk.Combobox, StationEntry)):
                 entry.set('')
             else:
                 entry.delete(0, tk.END)
@@ -473,7 +4880,9 @@ class CrudWindow(BaseWindow):
                 entry.delete(0, tk.END)
                 continue
 
-            if isinstance(entry, ttk.Combobox):
+            if isinstance(entry, StationEntry):
+                entry.set(str(value))
+            elif isinstance(entry, ttk.Combobox):
                 # Find the matching value in combobox items
                 for item_val in entry['values']:
                     if str(value) in str(item_val):
@@ -484,10 +4893,44 @@ class CrudWindow(BaseWindow):
                 entry.insert(0, value if value is not None else "")
 
 
-    def save_entry(self):
+    def refresh_table(self):
+        self.grid_view.reload()
+
+    def row_key(self, row):
+        """Keyset cursor of a row; the ID column by default."""
+        return (row[0],)
+
+    def format_row(self, row):
+        return row
+
+    def run_write(self, query, params, success_message, failure_message, exists=None, on_saved=None):
+        """
+        Runs a write statement in the background, then reports the outcome and refreshes the grid.
+        'exists' is an optional (query, params, message) duplicate check run before the write.
+        """
+        def write():
+            if exists and db_execute(exists[0], exists[1], fetch='one'):
+                return "exists"
+            return db_execute(query, params)
+
+        def finish(result):
+            if result == "exists":
+                messagebox.showerror("Error", exists[2]); return
+            if result:
+                if on_saved: on_saved()
+                messagebox.showinfo("Success", success_message)
+                self.clear_form()
+                self.refresh_table()
+            else:
+                messagebox.showerror("Database Error", failure_message)
+
+        self.run_task(write, on_success=finish)
+
+    def fetch_page(self, cursor, direction, limit):
+        """Returns one keyset page of rows; runs on the background executor so it must not touch widgets."""
         raise NotImplementedError("This method should be overridden by subclasses")
 
-    def refresh_table(self):
+    def save_entry(self):
         raise NotImplementedError("This method should be overridden by subclasses")
 
     def delete_selected(self):
@@ -505,11 +4948,9 @@ class ManageUsersWindow(CrudWindow):
         }
         super().__init__("Manage Users", "900x600", columns, form_fields)
 
-    def refresh_table(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        rows = db_execute("SELECT user_id, username, role, email, phone FROM users ORDER BY user_id", fetch='all')
-        if rows:
-            for row in rows: self.tree.insert("", "end", values=row)
+    def fetch_page(self, cursor, direction, limit):
+        return fetch_keyset_page("SELECT user_id, username, role, email, phone FROM users", ("user_id",),
+                                 cursor=cursor, direction=direction, limit=limit)
 
     def save_entry(self):
         vals = {label: entry.get().strip() for label, entry in self.entries.items()}
@@ -520,9 +4961,9 @@ class ManageUsersWindow(CrudWindow):
         if vals["Phone"] and not vals["Phone"].isdigit():
             messagebox.showerror("Validation Error", "Phone number must be numeric."); return
 
+        exists = None
         if self.selected_id is None: # Insert
-            if db_execute("SELECT 1 FROM users WHERE username=%s", (vals["Username"],), fetch='one'):
-                messagebox.showerror("Error", "Username already exists."); return
+            exists = ("SELECT 1 FROM users WHERE username=%s", (vals["Username"],), "Username already exists.")
             query = "INSERT INTO users (username, password, role, email, phone) VALUES (%s, %s, %s, %s, %s)"
             params = (vals["Username"], vals["Password"], vals["Role"], vals["Email"], vals["Phone"])
         else: # Update
@@ -533,23 +4974,14 @@ class ManageUsersWindow(CrudWindow):
                 query = "UPDATE users SET username=%s, role=%s, email=%s, phone=%s WHERE user_id=%s"
                 params = (vals["Username"], vals["Role"], vals["Email"], vals["Phone"], self.selected_id)
         
-        if db_execute(query, params):
-            messagebox.showinfo("Success", f"User {'updated' if self.selected_id else 'added'} successfully.")
-            self.clear_form()
-            self.refresh_table()
-        else:
-            messagebox.showerror("Database Error", "Failed to save user.")
+        self.run_write(query, params, f"User {'updated' if self.selected_id else 'added'} successfully.",
+                       "Failed to save user.", exists=exists)
 
     def delete_selected(self):
         if not self.selected_id:
             messagebox.showerror("Error", "Please select a user to delete."); return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete user ID {self.selected_id}?"):
-            if db_execute("DELETE FROM users WHERE user_id=%s", (self.selected_id,)):
-                messagebox.showinfo("Success", "User deleted.")
-                self.clear_form()
-                self.refresh_table()
-            else:
-                messagebox.showerror("Database Error", "Failed to delete user.")
+            self.run_write("DELETE FROM users WHERE user_id=%s", (self.selected_id,), "User deleted.", "Failed to delete user.")
 
 # ---------------- TRAIN MASTER ----------------
 class TrainMasterWindow(CrudWindow):
@@ -558,11 +4990,9 @@ class TrainMasterWindow(CrudWindow):
         form_fields = {"Train Name": "entry", "Train Type": "entry", "Total Seats": "entry"}
         super().__init__("Train Master", "900x600", columns, form_fields)
 
-    def refresh_table(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        rows = db_execute("SELECT train_id, train_name, train_type, total_seats FROM trains ORDER BY train_id", fetch='all')
-        if rows:
-            for row in rows: self.tree.insert("", "end", values=row)
+    def fetch_page(self, cursor, direction, limit):
+        return fetch_keyset_page("SELECT train_id, train_name, train_type, total_seats FROM trains", ("train_id",),
+                                 cursor=cursor, direction=direction, limit=limit)
 
     def save_entry(self):
         vals = {label: entry.get().strip() for label, entry in self.entries.items()}
@@ -578,23 +5008,25 @@ class TrainMasterWindow(CrudWindow):
             query = "UPDATE trains SET train_name=%s, train_type=%s, total_seats=%s WHERE train_id=%s"
             params = (vals["Train Name"], vals["Train Type"], int(vals["Total Seats"]), self.selected_id)
         
-        if db_execute(query, params):
-            messagebox.showinfo("Success", "Train data saved.")
-            self.clear_form()
-            self.refresh_table()
-        else:
-            messagebox.showerror("Database Error", "Failed to save train data.")
+        train_id = self.selected_id
+        def on_saved():
+            if train_id is None:
+                reference_cache.invalidate(stations=False)
+            else:
+                reference_cache.put_train(train_id, vals["Train Name"], vals["Train Type"], int(vals["Total Seats"]))
+                seat_inventory.invalidate(train_id)
+        self.run_write(query, params, "Train data saved.", "Failed to save train data.", on_saved=on_saved)
 
     def delete_selected(self):
         if not self.selected_id:
             messagebox.showerror("Error", "Please select a train to delete."); return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete train ID {self.selected_id}?"):
-            if db_execute("DELETE FROM trains WHERE train_id=%s", (self.selected_id,)):
-                messagebox.showinfo("Success", "Train deleted.")
-                self.clear_form()
-                self.refresh_table()
-            else:
-                messagebox.showerror("Database Error", "Failed to delete train.")
+            train_id = self.selected_id
+            def on_saved():
+                reference_cache.remove_train(train_id)
+                seat_inventory.invalidate(train_id)
+            self.run_write("DELETE FROM trains WHERE train_id=%s", (train_id,), "Train deleted.", "Failed to delete train.",
+                           on_saved=on_saved)
 
 # ---------------- STATION MASTER ----------------
 class StationMasterWindow(CrudWindow):
@@ -603,11 +5035,9 @@ class StationMasterWindow(CrudWindow):
         form_fields = {"Station Name": "entry", "Station Code": "entry", "City": "entry", "State": "entry"}
         super().__init__("Station Master", "900x600", columns, form_fields)
 
-    def refresh_table(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        rows = db_execute("SELECT station_id, station_name, station_code, city, state FROM stations ORDER BY station_id", fetch='all')
-        if rows:
-            for row in rows: self.tree.insert("", "end", values=row)
+    def fetch_page(self, cursor, direction, limit):
+        return fetch_keyset_page("SELECT station_id, station_name, station_code, city, state FROM stations", ("station_id",),
+                                 cursor=cursor, direction=direction, limit=limit)
 
     def save_entry(self):
         vals = {label: entry.get().strip() for label, entry in self.entries.items()}
@@ -615,52 +5045,52 @@ class StationMasterWindow(CrudWindow):
             messagebox.showerror("Validation Error", "All fields are required."); return
         
         code = vals["Station Code"].upper()
+        exists = None
         if self.selected_id is None:
-            if db_execute("SELECT 1 FROM stations WHERE station_code=%s", (code,), fetch='one'):
-                messagebox.showerror("Error", "Station code already exists."); return
+            exists = ("SELECT 1 FROM stations WHERE station_code=%s", (code,), "Station code already exists.")
             query = "INSERT INTO stations (station_name, station_code, city, state) VALUES (%s, %s, %s, %s)"
             params = (vals["Station Name"], code, vals["City"], vals["State"])
         else:
             query = "UPDATE stations SET station_name=%s, station_code=%s, city=%s, state=%s WHERE station_id=%s"
             params = (vals["Station Name"], code, vals["City"], vals["State"], self.selected_id)
         
-        if db_execute(query, params):
-            messagebox.showinfo("Success", "Station data saved.")
-            self.clear_form()
-            self.refresh_table()
-        else:
-            messagebox.showerror("Database Error", "Failed to save station data.")
+        station_id = self.selected_id
+        def on_saved():
+            if station_id is None:
+                reference_cache.invalidate(trains=False)
+            else:
+                reference_cache.put_station(station_id, vals["Station Name"], code, vals["City"], vals["State"])
+        self.run_write(query, params, "Station data saved.", "Failed to save station data.", exists=exists, on_saved=on_saved)
 
     def delete_selected(self):
         if not self.selected_id:
             messagebox.showerror("Error", "Please select a station to delete."); return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete station ID {self.selected_id}?"):
-            if db_execute("DELETE FROM stations WHERE station_id=%s", (self.selected_id,)):
-                messagebox.showinfo("Success", "Station deleted.")
-                self.clear_form()
-                self.refresh_table()
-            else:
-                messagebox.showerror("Database Error", "Failed to delete station.")
+            station_id = self.selected_id
+            self.run_write("DELETE FROM stations WHERE station_id=%s", (station_id,), "Station deleted.", "Failed to delete station.",
+                           on_saved=lambda: reference_cache.remove_station(station_id))
 
 # ---------------- FARE MASTER ----------------
 class FareMasterWindow(CrudWindow):
     def __init__(self):
-        stations = get_stations_for_combobox()
         columns = ("fare_id", "from_station", "to_station", "class_type", "fare_amount")
         form_fields = {
-            "From Station": stations, "To Station": stations,
+            "From Station": 'station', "To Station": 'station',
             "Class Type": ["Sleeper", "AC", "General"], "Fare Amount": "entry"
         }
         super().__init__("Fare Master", "1000x600", columns, form_fields)
 
-    def refresh_table(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        rows = db_execute("SELECT fare_id, from_station, to_station, class_type, fare_amount FROM fare_master ORDER BY fare_id", fetch='all')
-        if rows:
-            for r in rows:
-                from_name = get_station_name_by_id(r[1])
-                to_name = get_station_name_by_id(r[2])
-                self.tree.insert("", "end", values=(r[0], f"{r[1]} - {from_name}", f"{r[2]} - {to_name}", r[3], f"{float(r[4]):.2f}"))
+    def fetch_page(self, cursor, direction, limit):
+        select_from = """SELECT f.fare_id, f.from_station, fs.station_name, f.to_station, ts.station_name, f.class_type, f.fare_amount
+                         FROM fare_master AS f
+                         LEFT JOIN stations AS fs ON fs.station_id = f.from_station
+                         LEFT JOIN stations AS ts ON ts.station_id = f.to_station"""
+        return fetch_keyset_page(select_from, ("f.fare_id",), cursor=cursor, direction=direction, limit=limit)
+
+    def format_row(self, r):
+        from_name = r[2] if r[2] is not None else r[1]
+        to_name = r[4] if r[4] is not None else r[3]
+        return (r[0], f"{r[1]} - {from_name}", f"{r[3]} - {to_name}", r[5], f"{float(r[6]):.2f}")
 
     def save_entry(self):
         vals = {label: entry.get().strip() for label, entry in self.entries.items()}
@@ -680,32 +5110,23 @@ class FareMasterWindow(CrudWindow):
         if from_id is None or to_id is None:
             messagebox.showerror("Validation Error", "Invalid station selected."); return
 
+        exists = None
         if self.selected_id is None:
-            if db_execute("SELECT 1 FROM fare_master WHERE from_station=%s AND to_station=%s AND class_type=%s", (from_id, to_id, class_type), fetch='one'):
-                messagebox.showerror("Error", "Fare entry for this route and class already exists."); return
+            exists = ("SELECT 1 FROM fare_master WHERE from_station=%s AND to_station=%s AND class_type=%s", (from_id, to_id, class_type),
+                      "Fare entry for this route and class already exists.")
             query = "INSERT INTO fare_master (from_station, to_station, class_type, fare_amount) VALUES (%s, %s, %s, %s)"
             params = (from_id, to_id, class_type, fare)
         else:
             query = "UPDATE fare_master SET from_station=%s, to_station=%s, class_type=%s, fare_amount=%s WHERE fare_id=%s"
             params = (from_id, to_id, class_type, fare, self.selected_id)
 
-        if db_execute(query, params):
-            messagebox.showinfo("Success", "Fare data saved.")
-            self.clear_form()
-            self.refresh_table()
-        else:
-            messagebox.showerror("Database Error", "Failed to save fare data.")
+        self.run_write(query, params, "Fare data saved.", "Failed to save fare data.", exists=exists)
     
     def delete_selected(self):
         if not self.selected_id:
             messagebox.showerror("Error", "Please select a fare to delete."); return
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete fare ID {self.selected_id}?"):
-            if db_execute("DELETE FROM fare_master WHERE fare_id=%s", (self.selected_id,)):
-                messagebox.showinfo("Success", "Fare deleted.")
-                self.clear_form()
-                self.refresh_table()
-            else:
-                messagebox.showerror("Database Error", "Failed to delete fare.")
+            self.run_write("DELETE FROM fare_master WHERE fare_id=%s", (self.selected_id,), "Fare deleted.", "Failed to delete fare.")
 
 # ---------------- TRAIN SCHEDULE ----------------
 class TrainScheduleWindow(BaseWindow):
@@ -724,7 +5145,7 @@ class TrainScheduleWindow(BaseWindow):
         self.cb_train.grid(row=0, column=1, padx=5, pady=5)
 
         create_styled_label(form, "Station").grid(row=0, column=2, padx=5, pady=5, sticky="e")
-        self.cb_station = ttk.Combobox(form, values=get_stations_for_combobox(), width=30, state='readonly')
+        self.cb_station = StationEntry(form, width=30)
         self.cb_station.grid(row=0, column=3, padx=5, pady=5)
 
         create_styled_label(form, "Arrival (HH:MM)").grid(row=1, column=0, padx=5, pady=5, sticky="e")
@@ -742,21 +5163,12 @@ class TrainScheduleWindow(BaseWindow):
         add_button = create_styled_button(form, "Add Entry", self.add_schedule)
         add_button.grid(row=2, column=3, padx=5, pady=10, sticky="e")
 
-        # Treeview
-        tree_frame = ttk.Frame(self)
-        tree_frame.pack(fill="both", expand=True, padx=10, pady=5)
-        
+        # Paged Treeview
         cols = ("schedule_id", "train", "station", "arrival_time", "departure_time", "sequence")
-        self.tree = ttk.Treeview(tree_frame, columns=cols, show="headings")
-        for c in cols:
-            self.tree.heading(c, text=c.replace("_", " ").title())
-            self.tree.column(c, anchor="center", width=150)
-
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        self.grid_view = PagedTreeview(self, cols, self.fetch_page, lambda r: (r[1], r[7], r[0]),
+                                       self.format_row, column_width=150)
+        self.grid_view.pack(fill="both", expand=True, padx=10, pady=5)
+        self.tree = self.grid_view.tree
         
         delete_button = create_styled_button(self, "Delete Selected", self.delete_selected)
         delete_button.pack(pady=10, padx=10, anchor="e")
@@ -774,85 +5186,176 @@ class TrainScheduleWindow(BaseWindow):
             messagebox.showerror("Error", "Sequence must be an integer."); return
         
         query = "INSERT INTO train_schedule (train_id, station_id, arrival_time, departure_time, sequence) VALUES (%s, %s, %s, %s, %s)"
-        if db_execute(query, (train_id, station_id, arr, dep, int(seq))):
-            messagebox.showinfo("Success", "Schedule entry added.")
-            self.refresh_table()
-        else:
-            messagebox.showerror("Database Error", "Failed to add schedule entry.")
+        def finish(ok):
+            if ok:
+                messagebox.showinfo("Success", "Schedule entry added.")
+                self.refresh_table()
+            else:
+                messagebox.showerror("Database Error", "Failed to add schedule entry.")
+        self.run_task(apply_schedule_change, query, (train_id, station_id, arr, dep, int(seq)), train_id, on_success=finish)
 
     def refresh_table(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        query = """SELECT schedule_id, train_id, station_id, arrival_time, departure_time, sequence
-                   FROM train_schedule ORDER BY train_id, sequence"""
-        rows = db_execute(query, fetch='all')
-        if rows:
-            for r in rows:
-                tname = get_train_name_by_id(r[1])
-                sname = get_station_name_by_id(r[2])
-                arr_time = str(r[3]) if r[3] else "N/A"
-                dep_time = str(r[4]) if r[4] else "N/A"
-                self.tree.insert("", "end", values=(r[0], f"{r[1]} - {tname}", f"{r[2]} - {sname}", arr_time, dep_time, r[5]))
+        self.grid_view.reload()
+
+    def fetch_page(self, cursor, direction, limit):
+        select_from = """SELECT ts.schedule_id, ts.train_id, t.train_name, ts.station_id, s.station_name,
+                                ts.arrival_time, ts.departure_time, ts.sequence
+                         FROM train_schedule AS ts
+                         LEFT JOIN trains AS t ON t.train_id = ts.train_id
+                         LEFT JOIN stations AS s ON s.station_id = ts.station_id"""
+        return fetch_keyset_page(select_from, ("ts.train_id", "ts.sequence", "ts.schedule_id"),
+                                 cursor=cursor, direction=direction, limit=limit)
+
+    def format_row(self, r):
+        tname = r[2] if r[2] is not None else r[1]
+        sname = r[4] if r[4] is not None else r[3]
+        arr_time = str(r[5]) if r[5] else "N/A"
+        dep_time = str(r[6]) if r[6] else "N/A"
+        return (r[0], f"{r[1]} - {tname}", f"{r[3]} - {sname}", arr_time, dep_time, r[7])
 
     def delete_selected(self):
         selection = self.tree.selection()
         if not selection:
             messagebox.showerror("Error", "Please select a schedule entry to delete."); return
         
-        schedule_id = self.tree.item(selection[0])['values'][0]
+        values = self.tree.item(selection[0])['values']
+        schedule_id = values[0]
+        train_id = parse_id_from_combo(str(values[1]))
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete schedule ID {schedule_id}?"):
-            if db_execute("DELETE FROM train_schedule WHERE schedule_id=%s", (schedule_id,)):
-                messagebox.showinfo("Success", "Schedule entry deleted.")
-                self.refresh_table()
-            else:
-                messagebox.showerror("Database Error", "Failed to delete entry.")
+            def finish(ok):
+                if ok:
+                    messagebox.showinfo("Success", "Schedule entry deleted.")
+                    self.refresh_table()
+                else:
+                    messagebox.showerror("Database Error", "Failed to delete entry.")
+            self.run_task(apply_schedule_change, "DELETE FROM train_schedule WHERE schedule_id=%s", (schedule_id,), train_id,
+                          on_success=finish)
+
+# ---------------- MASTER DATA IMPORT WINDOW ----------------
+class ImportWindow(BaseWindow):
+    def __init__(self):
+        super().__init__("Import Master Data", "800x550")
+        self.paths = ()
+        self.create_widgets()
+
+    def create_widgets(self):
+        form = ttk.LabelFrame(self, text="Import Files (CSV or JSON)", padding=15)
+        form.pack(fill="x", padx=10, pady=10)
+
+        create_styled_button(form, "Choose Files...", self.choose_files).grid(row=0, column=0, padx=5, pady=5)
+        self.files_label = create_styled_label(form, "No files selected")
+        self.files_label.grid(row=0, column=1, columnspan=3, padx=5, pady=5, sticky="w")
+
+        create_styled_label(form, "Contents").grid(row=1, column=0, padx=5, pady=5, sticky="e")
+        self.cb_kind = ttk.Combobox(form, values=["Auto"] + list(IMPORT_KINDS), state='readonly', width=15)
+        self.cb_kind.set("Auto")
+        self.cb_kind.grid(row=1, column=1, padx=5, pady=5, sticky="w")
+
+        self.dry_run = tk.BooleanVar(value=True)
+        ttk.Checkbutton(form, text="Dry run (validate only)", variable=self.dry_run).grid(row=1, column=2, padx=15, pady=5)
+        create_styled_button(form, "Run Import", self.run_import).grid(row=1, column=3, padx=5, pady=5)
+
+        self.output = tk.Text(self, height=20, font=('Consolas', 10), state="disabled")
+        self.output.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+    def choose_files(self):
+        paths = filedialog.askopenfilenames(parent=self, filetypes=[("CSV or JSON", "*.csv *.json"), ("All files", "*.*")])
+        if paths:
+            self.paths = paths
+            self.files_label.config(text=", ".join(os.path.basename(p) for p in paths))
+
+    def run_import(self):
+        if not self.paths:
+            messagebox.showerror("Error", "Please choose at least one file.", parent=self); return
+        kind = None if self.cb_kind.get() == "Auto" else self.cb_kind.get()
+        self.run_task(self.load_and_import, self.paths, kind, self.dry_run.get(), on_success=self.show_report,
+                      key="import", error_title="Import Failed")
+
+    @staticmethod
+    def load_and_import(paths, kind, dry_run):
+        data = {}
+        for path in paths:
+            for section, rows in read_import_file(path, kind).items():
+                data.setdefault(section, []).extend(rows)
+        return import_master_data(data, dry_run=dry_run)
+
+    def show_report(self, report):
+        self.output.config(state="normal")
+        self.output.delete("1.0", "end")
+        self.output.insert("end", format_import_report(report))
+        self.output.config(state="disabled")
 
 # ---------------- PASSENGER DETAILS WINDOW ----------------
 class PassengerDetailsWindow(BaseWindow):
-    def __init__(self, parent, callback):
-        super().__init__("Enter Passenger Details", "600x500")
+    """Collects name, age and gender for 'count' passengers and passes the list of dicts to callback."""
+    def __init__(self, parent, callback, count=1):
+        super().__init__("Enter Passenger Details", "600x500" if count == 1 else "700x450")
         self.parent = parent
         self.callback = callback
+        self.count = count
         self.create_widgets()
 
     def create_widgets(self):
         frame = ttk.Frame(self, padding=20)
         frame.pack(expand=True, fill="both")
 
-        create_styled_label(frame, "Full Name").pack(pady=(0, 5))
-        self.name_entry = create_styled_entry(frame)
-        self.name_entry.pack(pady=(0, 15), ipady=4, fill='x')
+        if self.count == 1:
+            create_styled_label(frame, "Full Name").pack(pady=(0, 5))
+            self.name_entry = create_styled_entry(frame)
+            self.name_entry.pack(pady=(0, 15), ipady=4, fill='x')
 
-        create_styled_label(frame, "Age").pack(pady=(0, 5))
-        self.age_entry = create_styled_entry(frame)
-        self.age_entry.pack(pady=(0, 15), ipady=4, fill='x')
+            create_styled_label(frame, "Age").pack(pady=(0, 5))
+            self.age_entry = create_styled_entry(frame)
+            self.age_entry.pack(pady=(0, 15), ipady=4, fill='x')
 
-        create_styled_label(frame, "Gender").pack(pady=(0, 5))
-        self.gender_combo = ttk.Combobox(frame, values=["Male", "Female", "Other"], state='readonly')
-        self.gender_combo.pack(pady=(0, 20), ipady=4, fill='x')
+            create_styled_label(frame, "Gender").pack(pady=(0, 5))
+            self.gender_combo = ttk.Combobox(frame, values=list(GENDERS), state='readonly')
+            self.gender_combo.pack(pady=(0, 20), ipady=4, fill='x')
+            self.rows = [(self.name_entry, self.age_entry, self.gender_combo)]
+        else:
+            # One row per passenger of the group
+            grid = ttk.Frame(frame)
+            grid.pack(fill='x')
+            for col, text in enumerate(("#", "Full Name", "Age", "Gender")):
+                create_styled_label(grid, text).grid(row=0, column=col, padx=5, pady=(0, 5))
+            self.rows = []
+            for i in range(self.count):
+                ttk.Label(grid, text=str(i + 1)).grid(row=i + 1, column=0, padx=5, pady=4)
+                name_entry = create_styled_entry(grid)
+                name_entry.grid(row=i + 1, column=1, padx=5, pady=4, sticky="ew")
+                age_entry = ttk.Entry(grid, width=6, font=('Segoe UI', 10))
+                age_entry.grid(row=i + 1, column=2, padx=5, pady=4)
+                gender_combo = ttk.Combobox(grid, values=list(GENDERS), state='readonly', width=10)
+                gender_combo.grid(row=i + 1, column=3, padx=5, pady=4)
+                self.rows.append((name_entry, age_entry, gender_combo))
+            grid.columnconfigure(1, weight=1)
 
         create_styled_button(frame, "Confirm Details", self.submit_details).pack(pady=10, ipady=5, fill='x')
 
     def submit_details(self):
-        name = self.name_entry.get().strip()
-        age = self.age_entry.get().strip()
-        gender = self.gender_combo.get()
+        passengers = []
+        for name_entry, age_entry, gender_combo in self.rows:
+            name = name_entry.get().strip()
+            age = age_entry.get().strip()
+            gender = gender_combo.get()
+
+            if not (name and age and gender):
+                messagebox.showerror("Error", "All fields are required.", parent=self)
+                return
+            if not is_int(age) or not (0 < int(age) < 120):
+                messagebox.showerror("Error", "Please enter a valid age.", parent=self)
+                return
+            passengers.append({"name": name, "age": age, "gender": gender})
 
-        if not (name and age and gender):
-            messagebox.showerror("Error", "All fields are required.", parent=self)
-            return
-        if not is_int(age) or not (0 < int(age) < 120):
-            messagebox.showerror("Error", "Please enter a valid age.", parent=self)
-            return
-
-        details = {"name": name, "age": age, "gender": gender}
         self.destroy()
-        self.callback(details)
+        self.callback(passengers)
 
 # ---------------- TICKET RESERVATION (NEW VERSION) ----------------
 class TicketReservationWindow(BaseWindow):
-    def __init__(self, passenger_id):
+    def __init__(self, passenger_id, role="user"):
         super().__init__("Search Trains & Book Ticket", "900x700")
         self.passenger_id = passenger_id
+        self.bulk_allowed = role.lower() in STAFF_ROLES  # Bulk-agent mode
         self.selected_train_data = None  # To store details of the selected train
         self.create_widgets()
 
@@ -862,25 +5365,32 @@ class TicketReservationWindow(BaseWindow):
         search_frame.pack(fill="x", padx=10, pady=10)
 
         create_styled_label(search_frame, "From Station").grid(row=0, column=0, padx=5, pady=5, sticky="e")
-        self.cb_from = ttk.Combobox(search_frame, values=get_stations_for_combobox(), width=30, state='readonly')
+        self.cb_from = StationEntry(search_frame, width=30)
         self.cb_from.grid(row=0, column=1, padx=5, pady=5)
 
         create_styled_label(search_frame, "To Station").grid(row=0, column=2, padx=5, pady=5, sticky="e")
-        self.cb_to = ttk.Combobox(search_frame, values=get_stations_for_combobox(), width=30, state='readonly')
+        self.cb_to = StationEntry(search_frame, width=30)
         self.cb_to.grid(row=0, column=3, padx=5, pady=5)
 
+        create_styled_label(search_frame, "Journey Date").grid(row=1, column=0, padx=5, pady=5, sticky="e")
+        today = datetime.date.today()
+        dates = [f"{today + datetime.timedelta(days=d):%Y-%m-%d %a}" for d in range(ADVANCE_BOOKING_DAYS + 1)]
+        self.cb_date = ttk.Combobox(search_frame, values=dates, width=30, state='readonly')
+        self.cb_date.set(dates[0])
+        self.cb_date.grid(row=1, column=1, padx=5, pady=5)
+
         search_button = create_styled_button(search_frame, "Search Trains", self.search_trains)
-        search_button.grid(row=0, column=4, padx=15, pady=5)
+        search_button.grid(row=0, column=4, rowspan=2, padx=15, pady=5)
 
         # --- Results Frame ---
         results_frame = ttk.LabelFrame(self, text="Available Trains", padding=15)
         results_frame.pack(fill="both", expand=True, padx=10, pady=5)
 
-        cols = ("train_id", "train_name", "type", "departs", "arrives", "availability")
+        cols = ("train_id", "train_name", "type", "departs", "arrives") + TRAVEL_CLASSES
         self.tree = ttk.Treeview(results_frame, columns=cols, show="headings")
         for col in cols:
             self.tree.heading(col, text=col.replace("_", " ").title())
-            self.tree.column(col, anchor="center", width=120)
+            self.tree.column(col, anchor="center", width=100)
         
         self.tree.column("train_id", width=60) # Make ID column smaller
         self.tree.column("train_name", width=200, anchor="w") # Name column wider
@@ -898,18 +5408,29 @@ class TicketReservationWindow(BaseWindow):
         booking_frame.pack(fill="x")
 
         create_styled_label(booking_frame, "Class Type:").pack(side="left", padx=(10, 5))
-        self.cb_class = ttk.Combobox(booking_frame, values=["Sleeper", "AC", "General"], width=20, state='readonly')
+        self.cb_class = ttk.Combobox(booking_frame, values=list(TRAVEL_CLASSES), width=20, state='readonly')
         self.cb_class.pack(side="left", pady=(0, 10))
 
+        create_styled_label(booking_frame, "Passengers:").pack(side="left", padx=(20, 5))
+        self.sp_count = ttk.Spinbox(booking_frame, from_=1, to=GROUP_MAX_PASSENGERS, width=5, state='readonly')
+        self.sp_count.set(1)
+        self.sp_count.pack(side="left", pady=(0, 10))
+
         self.book_button = create_styled_button(booking_frame, "Book Selected Train", self.get_passenger_details)
         self.book_button.pack(side="right", padx=10, pady=(0, 10))
         self.book_button.state(['disabled']) # Initially disabled
 
+        if self.bulk_allowed:
+            self.bulk_button = create_styled_button(booking_frame, "Bulk Booking (CSV)", self.bulk_booking)
+            self.bulk_button.pack(side="right", padx=10, pady=(0, 10))
+            self.bulk_button.state(['disabled'])
+
     def search_trains(self):
         # Clear previous results and selection
         for i in self.tree.get_children(): self.tree.delete(i)
         self.selected_train_data = None
         self.book_button.state(['disabled'])
+        self.journey_date = self.cb_date.get().split()[0]  # Searched date, used for booking too
 
         from_station = self.cb_from.get()
         to_station = self.cb_to.get()
@@ -921,25 +5442,58 @@ class TicketReservationWindow(BaseWindow):
             messagebox.showerror("Error", "'From' and 'To' stations cannot be the same.")
             return
 
-        from_id = parse_id_from_combo(from_station)
-        to_id = parse_id_from_combo(to_station)
+        # Searched stations, used for booking too: the pickers may have been edited since
+        self.from_id = parse_id_from_combo(from_station)
+        self.to_id = parse_id_from_combo(to_station)
 
-        trains = search_trains_between_stations(from_id, to_id)
+        self.run_task(self.search_route, self.from_id, self.to_id, self.journey_date, on_success=self.show_trains,
+                      key="search")
 
+    @classmethod
+    def search_route(cls, from_id, to_id, journey_date):
+        """find_trains() plus the text shown when only connecting journeys exist."""
+        result = find_trains(from_id, to_id, journey_date)
+        result["summary"] = cls.describe_connections(result["connections"])
+        return result
+
+    def show_trains(self, result):
+        trains = result["trains"]
         if not trains:
-            messagebox.showinfo("No Trains Found", "Sorry, no direct trains were found for the selected route.")
+            text = result["summary"]
+            messagebox.showinfo("Connecting Journeys" if text else "No Trains Found",
+                                text or "Sorry, no direct or connecting trains were found for the selected route.")
             return
 
         for train in trains:
-            train_id, train_name, train_type, dep, arr = train
-            # Check availability
-            total_seats_row = db_execute("SELECT total_seats FROM trains WHERE train_id=%s", (train_id,), fetch='one')
-            total_seats = total_seats_row[0] if total_seats_row else 0
-            booked_count_row = db_execute("SELECT COUNT(*) FROM tickets WHERE train_id=%s AND status='Confirmed'", (train_id,), fetch='one')
-            booked_count = booked_count_row[0] if booked_count_row else 0
-            available = max(0, total_seats - booked_count)
-            
-            self.tree.insert("", "end", values=(train_id, train_name, train_type, dep or 'N/A', arr or 'N/A', f"{available} seats"))
+            self.tree.insert("", "end", values=(
+                train["train_id"], train["train_name"], train["train_type"],
+                train["departure_time"] or 'N/A', train["arrival_time"] or 'N/A',
+                *(self.availability_text(train, c) for c in TRAVEL_CLASSES)
+            ))
+
+    @staticmethod
+    def availability_text(train, class_type):
+        """Free seats of a class, or 'WL' when it is full and bookings go to the waitlist."""
+        available = train["available_by_class"].get(class_type, 0)
+        return available or ("WL" if class_capacity(train["train_id"], class_type) else 0)
+
+    @staticmethod
+    def describe_connections(journeys):
+        """Describes the 1- and 2-change itineraries of find_trains() (None if there are none)."""
+        if not journeys:
+            return None
+
+        lines = ["No direct trains were found. Connecting options:"]
+        for journey in journeys:
+            lines.append(f"\n{journey['changes']} change(s), arrive {format_journey_time(journey['arrival'])}")
+            for leg in journey["legs"]:
+                lines.append(
+                    f"  {get_train_name_by_id(leg['train_id'])}: {get_station_name_by_id(leg['from_station'])} "
+                    f"{format_journey_time(leg['departure'])} -> {get_station_name_by_id(leg['to_station'])} "
+                    f"{format_journey_time(leg['arrival'])}"
+                )
+        lines.append("\nSearch and book each leg separately.")
+        return "\n".join(lines)
 
     def on_train_select(self, event):
         selection = self.tree.selection()
@@ -954,57 +5508,57 @@ class TicketReservationWindow(BaseWindow):
             "train_name": values[1]
         }
         self.book_button.state(['!disabled']) # Enable the book button
+        if self.bulk_allowed:
+            self.bulk_button.state(['!disabled'])
 
-    def get_passenger_details(self):
+    def ready_to_book(self):
         if not self.selected_train_data:
-            messagebox.showerror("Error", "Please select a train from the list first."); return
+            messagebox.showerror("Error", "Please select a train from the list first."); return False
         if not self.cb_class.get():
-            messagebox.showerror("Error", "Please select a class type."); return
+            messagebox.showerror("Error", "Please select a class type."); return False
+        return True
 
-        PassengerDetailsWindow(self, self.book_ticket)
+    def get_passenger_details(self):
+        if not self.ready_to_book(): return
+        PassengerDetailsWindow(self, self.book_ticket, int(self.sp_count.get()))
 
-    def book_ticket(self, passenger_details):
+    def bulk_booking(self):
+        if not self.ready_to_book(): return
+        path = filedialog.askopenfilename(parent=self, title="Passenger List (name, age, gender)",
+                                          filetypes=[("CSV files", "*.csv"), ("All files", "*.*")])
+        if not path: return
+        self.run_task(self.read_passenger_csv, path, on_success=lambda passengers: self.book_ticket(passengers, bulk=True),
+                      key="book", error_title="Bulk Booking Failed")
+
+    @staticmethod
+    def read_passenger_csv(path):
+        """Reads a passenger list with 'name', 'age' and 'gender' columns."""
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            if not reader.fieldnames or not {"name", "age", "gender"} <= {c.strip().lower() for c in reader.fieldnames}:
+                raise ServiceError("The CSV file needs 'name', 'age' and 'gender' columns.")
+            return [{k.strip().lower(): (v or "").strip() for k, v in row.items() if k} for row in reader]
+
+    def book_ticket(self, passengers, bulk=False):
         train_id = self.selected_train_data['train_id']
-        from_id = parse_id_from_combo(self.cb_from.get())
-        to_id = parse_id_from_combo(self.cb_to.get())
+        from_id, to_id = self.from_id, self.to_id
         class_type = self.cb_class.get()
 
-        seat_string = get_next_available_seat(train_id)
-        if not seat_string:
-            messagebox.showerror("Booking Failed", "Sorry, no seats are available on this train."); return
-        
-        fare_row = db_execute("SELECT fare_amount FROM fare_master WHERE from_station=%s AND to_station=%s AND class_type=%s", (from_id, to_id, class_type), fetch='one')
-        fare = float(fare_row[0]) if fare_row else 0.0
-        if fare == 0.0:
-            messagebox.showwarning("Fare Warning", "Fare for this route and class is not set. It will be recorded as 0.00.")
-
-        pnr = generate_pnr()
-        booking_date = datetime.date.today()
-        
-        query = """INSERT INTO tickets (pnr, train_id, passenger_id, from_station, to_station, seat_number, class_type, booking_date, status, passenger_name, passenger_age, passenger_gender)
-                   VALUES (%s, %s, %s, %s, %s, %s, %s, %s, 'Confirmed', %s, %s, %s)"""
-        params = (pnr, train_id, self.passenger_id, from_id, to_id, seat_string, class_type, booking_date, 
-                  passenger_details['name'], passenger_details['age'], passenger_details['gender'])
-        
-        if db_execute(query, params):
-            ticket_data = {
-                'pnr': pnr,
-                'passenger_name': passenger_details['name'],
-                'passenger_age': passenger_details['age'],
-                'passenger_gender': passenger_details['gender'],
-                'train_name': self.selected_train_data['train_name'],
-                'from_station': get_station_name_by_id(from_id),
-                'to_station': get_station_name_by_id(to_id),
-                'booking_date': booking_date,
-                'class_type': class_type,
-                'seat_number': seat_string,
-                'fare': fare
-            }
-            
-            self.destroy()
-            TicketDetailsWindow(ticket_data)
+        if len(passengers) == 1 and not bulk:
+            p = passengers[0]
+            self.run_task(reserve_ticket, self.passenger_id, train_id, from_id, to_id, class_type,
+                          p['name'], p['age'], p['gender'], self.journey_date,
+                          on_success=self.show_booking, key="book", error_title="Booking Failed")
         else:
-            messagebox.showerror("Database Error", "Failed to book ticket.")
+            # The whole group is booked in one transaction under one PNR
+            self.run_task(reserve_group, self.passenger_id, train_id, from_id, to_id, class_type, passengers, bulk,
+                          self.journey_date, on_success=self.show_booking, key="book", error_title="Booking Failed")
+
+    def show_booking(self, ticket):
+        if ticket['fare_missing']:
+            messagebox.showwarning("Fare Warning", "Fare for this route and class is not set. It was recorded as 0.00.")
+        self.destroy()
+        TicketDetailsWindow(ticket)
 
 # ---------------- TICKET DETAILS WINDOW ----------------
 class TicketDetailsWindow(BaseWindow):
@@ -1023,20 +5577,36 @@ class TicketDetailsWindow(BaseWindow):
         details_frame = ttk.Frame(main_frame, style="TFrame")
         details_frame.pack(pady=10, padx=10, fill='x')
 
-        details_map = {
-            "PNR Number:": self.ticket_data['pnr'],
-            "Passenger Name:": self.ticket_data['passenger_name'],
-            "Age:": self.ticket_data['passenger_age'],
-            "Gender:": self.ticket_data['passenger_gender'],
-            "Train:": self.ticket_data['train_name'],
-            "From:": self.ticket_data['from_station'],
-            "To:": self.ticket_data['to_station'],
-            "Booking Date:": str(self.ticket_data['booking_date']),
-            "Class:": self.ticket_data['class_type'],
-            "Seat Number:": self.ticket_data['seat_number'],
-            "Fare:": f"₹{self.ticket_data['fare']:.2f}",
-            "Status:": "CONFIRMED"
-        }
+        group = self.ticket_data.get('passengers')
+        if group:
+            details_map = {
+                "PNR Number:": self.ticket_data['pnr'],
+                "Passengers:": len(group),
+                "Train:": self.ticket_data['train_name'],
+                "From:": self.ticket_data['from_station'],
+                "To:": self.ticket_data['to_station'],
+                "Journey Date:": str(self.ticket_data['journey_date']),
+                "Booking Date:": str(self.ticket_data['booking_date']),
+                "Class:": self.ticket_data['class_type'],
+                "Fare:": f"₹{self.ticket_data['fare']:.2f} x {len(group)} = ₹{self.ticket_data['total_fare']:.2f}",
+                "Status:": describe_status(self.ticket_data).upper()
+            }
+        else:
+            details_map = {
+                "PNR Number:": self.ticket_data['pnr'],
+                "Passenger Name:": self.ticket_data['passenger_name'],
+                "Age:": self.ticket_data['passenger_age'],
+                "Gender:": self.ticket_data['passenger_gender'],
+                "Train:": self.ticket_data['train_name'],
+                "From:": self.ticket_data['from_station'],
+                "To:": self.ticket_data['to_station'],
+                "Journey Date:": str(self.ticket_data['journey_date']),
+                "Booking Date:": str(self.ticket_data['booking_date']),
+                "Class:": self.ticket_data['class_type'],
+                "Seat Number:": self.ticket_data['seat_number'] or self.ticket_data['waitlist'],
+                "Fare:": f"₹{self.ticket_data['fare']:.2f}",
+                "Status:": describe_status(self.ticket_data).upper()
+            }
 
         for i, (label_text, value_text) in enumerate(details_map.items()):
             label = ttk.Label(details_frame, text=label_text, font=('Segoe UI', 11, 'bold'))
@@ -1044,6 +5614,18 @@ class TicketDetailsWindow(BaseWindow):
             value = ttk.Label(details_frame, text=str(value_text), font=('Segoe UI', 11))
             value.grid(row=i, column=1, sticky='w', pady=6, padx=5)
 
+        if group:
+            # Seat list of the group
+            cols = ("#", "Name", "Age", "Gender", "Seat")
+            seats = ttk.Treeview(main_frame, columns=cols, show="headings", height=min(len(group), 6))
+            for c in cols:
+                seats.heading(c, text=c)
+                seats.column(c, anchor="center", width=40 if c == "#" else 90)
+            for p in group:
+                seats.insert("", "end", values=(p['passenger_seq'], p['name'], p['age'], p['gender'],
+                                                p['seat_number'] or p['waitlist']))
+            seats.pack(fill='x', padx=10)
+
         button_frame = ttk.Frame(main_frame)
         button_frame.pack(pady=30)
 
@@ -1060,63 +5642,77 @@ class TicketDetailsWindow(BaseWindow):
         if not path:
             return
 
-        try:
-            pdf = FPDF()
-            pdf.add_page()
-            pdf.set_font("Arial", 'B', 20)
-            
-            # Header
-            pdf.cell(0, 15, "Railway E-Ticket", 0, 1, 'C')
-            pdf.ln(10)
+        self.run_task(self.write_pdf, path,
+                      on_success=lambda _: messagebox.showinfo("Success", f"Ticket saved as PDF to:\n{path}", parent=self))
+
+    def write_pdf(self, path):
+        """Renders the ticket to a PDF file; runs on the background executor."""
+        from fpdf import FPDF  # Only loaded when a ticket is printed
+        pdf = FPDF()
+        pdf.add_page()
+        pdf.set_font("Arial", 'B', 20)
+        
+        # Header
+        pdf.cell(0, 15, "Railway E-Ticket", 0, 1, 'C')
+        pdf.ln(10)
 
-            # Ticket Details
+        # Ticket Details
+        pdf.set_font("Arial", 'B', 12)
+        details = self.ticket_data
+        
+        def add_detail_row(label, value):
+            pdf.cell(50, 10, label, 0, 0)
+            pdf.set_font("Arial", '', 12)
+            pdf.cell(0, 10, str(value), 0, 1)
             pdf.set_font("Arial", 'B', 12)
-            details = self.ticket_data
-            
-            def add_detail_row(label, value):
-                pdf.cell(50, 10, label, 0, 0)
-                pdf.set_font("Arial", '', 12)
-                pdf.cell(0, 10, str(value), 0, 1)
-                pdf.set_font("Arial", 'B', 12)
-
-            add_detail_row("PNR Number:", details['pnr'])
-            add_detail_row("Status:", "CONFIRMED")
-            pdf.ln(5)
-            
-            pdf.set_font("Arial", 'B', 14)
-            pdf.cell(0, 10, "Passenger Details", 0, 1)
+
+        add_detail_row("PNR Number:", details['pnr'])
+        add_detail_row("Status:", describe_status(details).upper())
+        pdf.ln(5)
+        
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "Passenger Details", 0, 1)
+        pdf.set_font("Arial", 'B', 12)
+        group = details.get('passengers')
+        if group:
+            pdf.set_font("Arial", '', 12)
+            for p in group:
+                place = f"Seat {p['seat_number']}" if p['seat_number'] else p['waitlist']
+                pdf.cell(0, 8, f"{p['passenger_seq']}. {p['name']} ({p['age']}, {p['gender']}) - {place}", 0, 1)
             pdf.set_font("Arial", 'B', 12)
+        else:
             add_detail_row("Name:", details['passenger_name'])
             add_detail_row("Age:", details['passenger_age'])
             add_detail_row("Gender:", details['passenger_gender'])
-            pdf.ln(5)
-
-            pdf.set_font("Arial", 'B', 14)
-            pdf.cell(0, 10, "Journey Details", 0, 1)
-            pdf.set_font("Arial", 'B', 12)
-            add_detail_row("Train:", details['train_name'])
-            add_detail_row("From:", details['from_station'])
-            add_detail_row("To:", details['to_station'])
-            add_detail_row("Booking Date:", str(details['booking_date']))
-            add_detail_row("Class:", details['class_type'])
-            add_detail_row("Seat Number:", details['seat_number'])
+        pdf.ln(5)
+
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, "Journey Details", 0, 1)
+        pdf.set_font("Arial", 'B', 12)
+        add_detail_row("Train:", details['train_name'])
+        add_detail_row("From:", details['from_station'])
+        add_detail_row("To:", details['to_station'])
+        add_detail_row("Journey Date:", str(details['journey_date']))
+        add_detail_row("Booking Date:", str(details['booking_date']))
+        add_detail_row("Class:", details['class_type'])
+        if group:
+            add_detail_row("Fare:", f"Rs. {details['fare']:.2f} x {len(group)} = Rs. {details['total_fare']:.2f}")
+        else:
+            add_detail_row("Seat Number:", details['seat_number'] or details['waitlist'])
             add_detail_row("Fare:", f"Rs. {details['fare']:.2f}")
-            pdf.ln(10)
+        pdf.ln(10)
 
-            pdf.set_font("Arial", 'I', 10)
-            pdf.cell(0, 10, "Thank you for choosing our service. Happy journey!", 0, 1, 'C')
+        pdf.set_font("Arial", 'I', 10)
+        pdf.cell(0, 10, "Thank you for choosing our service. Happy journey!", 0, 1, 'C')
 
-            pdf.output(path)
-            messagebox.showinfo("Success", f"Ticket saved as PDF to:\n{path}")
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to generate PDF: {e}")
+        pdf.output(path)
 
 
 # ---------------- TICKET CANCELLATION ----------------
 class TicketCancellationWindow(BaseWindow):
-    def __init__(self):
+    def __init__(self, user):
         super().__init__("Ticket Cancellation", "500x350")
+        self.user = user  # {'user_id', 'role'}: passengers may only see and cancel their own tickets
         self.create_widgets()
 
     def create_widgets(self):
@@ -1139,34 +5735,33 @@ class TicketCancellationWindow(BaseWindow):
         pnr = self.e_pnr.get().strip()
         if not pnr: messagebox.showerror("Error", "PNR is required."); return
         
-        query = """SELECT status, train_id, seat_number, from_station, to_station
-                   FROM tickets WHERE pnr=%s"""
-        row = db_execute(query, (pnr,), fetch='one')
+        self.run_task(self.describe_ticket, pnr, self.user, on_success=lambda info: self.info_label.config(text=info),
+                      key="view")
 
-        if not row:
-            self.info_label.config(text="Invalid PNR. Please check and try again.")
-            return
-        
-        status, tid, seat, fs, ts = row
-        info = f"Train: {get_train_name_by_id(tid)}\nSeat: {seat}\nFrom: {get_station_name_by_id(fs)}\nTo: {get_station_name_by_id(ts)}\nStatus: {status}"
-        self.info_label.config(text=info)
+    @staticmethod
+    def describe_ticket(pnr, user):
+        try:
+            t = lookup_ticket(pnr, user)
+        except ServiceError as err:
+            return str(err)
+        seats = ", ".join(p['seat_number'] or p['waitlist'] or "-" for p in t['passengers'][:12]) \
+            + (", ..." if len(t['passengers']) > 12 else "")
+        label = "Seat" if len(t['passengers']) == 1 else f"Seats ({len(t['passengers'])} passengers)"
+        return (f"Train: {t['train_name']}\nJourney Date: {t['journey_date']}\n{label}: {seats}\n"
+                f"From: {t['from_station']}\nTo: {t['to_station']}\nStatus: {describe_status(t)}")
 
     def cancel_ticket(self):
         pnr = self.e_pnr.get().strip()
         if not pnr: messagebox.showerror("Error", "PNR is required."); return
+        if not messagebox.askyesno("Confirm Cancellation", f"Are you sure you want to cancel ticket {pnr}?"): return
 
-        status_row = db_execute("SELECT status FROM tickets WHERE pnr=%s", (pnr,), fetch='one')
-        if not status_row:
-            messagebox.showerror("Error", "Invalid PNR."); return
-        if status_row[0] == 'Cancelled':
-            messagebox.showinfo("Info", "This ticket has already been cancelled."); return
+        def finish(ticket):
+            messagebox.showinfo("Success", f"Ticket has been cancelled successfully.\nRefund: ₹{ticket['refund']:.2f}")
+            self.destroy()
 
-        if messagebox.askyesno("Confirm Cancellation", "Are you sure you want to cancel this ticket?"):
-            if db_execute("UPDATE tickets SET status='Cancelled' WHERE pnr=%s", (pnr,)):
-                messagebox.showinfo("Success", "Ticket has been cancelled successfully.")
-                self.destroy()
-            else:
-                messagebox.showerror("Database Error", "Failed to cancel ticket.")
+        # The status check happens in the cancelling UPDATE itself; its error explains a ticket it could not cancel
+        self.run_task(cancel_reservation, pnr, self.user, on_success=finish, key="cancel",
+                      error_title="Cancellation Failed")
 
 # ---------------- MY BOOKINGS ----------------
 class MyBookingsWindow(BaseWindow):
@@ -1177,32 +5772,26 @@ class MyBookingsWindow(BaseWindow):
         self.load_bookings()
 
     def create_widgets(self):
-        tree_frame = ttk.Frame(self)
-        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
-        
-        cols = ("PNR", "Passenger", "Train", "From", "To", "Seat", "Class", "Booking Date", "Status")
-        self.tree = ttk.Treeview(tree_frame, columns=cols, show="headings")
-        for c in cols:
-            self.tree.heading(c, text=c)
-            self.tree.column(c, anchor="center", width=120)
-
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        cols = ("PNR", "Passenger", "Train", "From", "To", "Seat", "Class", "Journey Date", "Booking Date", "Status")
+        self.grid_view = PagedTreeview(self, cols, self.fetch_page, ticket_view_key, self.format_row, headings=cols)
+        self.grid_view.pack(fill="both", expand=True, padx=10, pady=10)
+        self.tree = self.grid_view.tree
 
     def load_bookings(self):
-        query = """SELECT pnr, passenger_name, train_id, from_station, to_station, seat_number, class_type, booking_date, status
-                   FROM tickets WHERE passenger_id=%s ORDER BY booking_date DESC"""
-        rows = db_execute(query, (self.user_id,), fetch='all')
-        if rows:
-            for r in rows:
-                values = (
-                    r[0], r[1], get_train_name_by_id(r[2]), get_station_name_by_id(r[3]),
-                    get_station_name_by_id(r[4]), r[5], r[6], str(r[7]), r[8]
-                )
-                self.tree.insert("", "end", values=values)
+        self.grid_view.reload()
+
+    def fetch_page(self, cursor, direction, limit):
+        rows = fetch_ticket_view(passenger_id=self.user_id, cursor=cursor, direction=direction, limit=limit)
+        if not rows:
+            return rows
+        # Each row gets its waitlist place or promotion appended, for the Status column
+        queue = waitlist_details(r[9] for r in rows) or {}
+        return [r + (queue.get(r[9], {}),) for r in rows]
+
+    def format_row(self, r):
+        # Grid shows the dates before Status
+        status = describe_status({"status": r[7], **r[11]})
+        return (r[0], r[1], r[2], r[3], r[4], r[5] or "-", r[6], str(r[10]), str(r[8]), status)
 
 # ---------------- REPORTS ----------------
 class ReportsWindow(BaseWindow):
@@ -1220,7 +5809,7 @@ class ReportsWindow(BaseWindow):
         self.e_train.grid(row=0, column=1, padx=5, pady=5)
 
         create_styled_label(filter_frame, "Status").grid(row=0, column=2, padx=5, pady=5)
-        self.cb_status = ttk.Combobox(filter_frame, values=["", "Confirmed", "Cancelled"], state='readonly')
+        self.cb_status = ttk.Combobox(filter_frame, values=["", "Confirmed", "Waitlisted", "Cancelled"], state='readonly')
         self.cb_status.grid(row=0, column=3, padx=5, pady=5)
 
         create_styled_label(filter_frame, "From (YYYY-MM-DD)").grid(row=0, column=4, padx=5, pady=5)
@@ -1234,70 +5823,289 @@ class ReportsWindow(BaseWindow):
         btn_frame = ttk.Frame(filter_frame)
         btn_frame.grid(row=0, column=8, padx=20)
         create_styled_button(btn_frame, "Apply Filter", self.load_data).pack(side="left", padx=5)
-        create_styled_button(btn_frame, "Export CSV", self.export_csv).pack(side="left", padx=5)
-
-        # Treeview
-        tree_frame = ttk.Frame(self)
-        tree_frame.pack(fill="both", expand=True, padx=10, pady=10)
-        cols = ("PNR", "Passenger", "Train", "From", "To", "Seat", "Class", "Status", "Booking Date")
-        self.tree = ttk.Treeview(tree_frame, columns=cols, show="headings")
-        for c in cols:
-            self.tree.heading(c, text=c); self.tree.column(c, anchor="center", width=120)
-        
-        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.tree.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        self.export_button = create_styled_button(btn_frame, "Export", self.export_report)
+        self.export_button.pack(side="left", padx=5)
+        create_styled_button(btn_frame, "Dashboard", self.open_dashboard).pack(side="left", padx=5)
+
+        # Export progress
+        export_frame = ttk.Frame(self)
+        export_frame.pack(side="bottom", fill="x", padx=10, pady=(0, 10))
+        self.export_bar = ttk.Progressbar(export_frame, mode="determinate")
+        self.export_bar.pack(side="left", fill="x", expand=True, padx=(0, 10))
+        self.export_label = create_styled_label(export_frame, "")
+        self.export_label.pack(side="left", padx=5)
+        self.cancel_button = create_styled_button(export_frame, "Cancel Export", self.cancel_export)
+        self.cancel_button.pack(side="left", padx=5)
+        self.cancel_button.state(["disabled"])
+        self.export_cancel = None  # threading.Event of the export in flight
+        self.export_rows = 0       # Written by the export worker, polled by the Tk thread
+        self.export_total = None
+
+        # Paged Treeview
+        self.filters = {}
+        self.grid_view = PagedTreeview(self, REPORT_HEADINGS, self.fetch_page, ticket_view_key, self.format_row,
+                                       headings=REPORT_HEADINGS)
+        self.grid_view.pack(fill="both", expand=True, padx=10, pady=10)
+        self.tree = self.grid_view.tree
+
+    def read_filters(self):
+        """Returns the filter dict from the form, or None after showing an error."""
+        train_filter = self.e_train.get().strip()
+        if train_filter and not is_int(train_filter):
+            messagebox.showerror("Error", "Train ID must be an integer."); return None
+
+        return {
+            "train_id": int(train_filter) if train_filter else None,
+            "status": self.cb_status.get() or None,
+            "date_from": self.e_from.get().strip() or None,
+            "date_to": self.e_to.get().strip() or None
+        }
 
     def load_data(self):
-        for i in self.tree.get_children(): self.tree.delete(i)
-        
-        query = "SELECT pnr, passenger_name, train_id, from_station, to_station, seat_number, class_type, status, booking_date FROM tickets"
-        filters, params = [], []
-
-        if self.e_train.get().strip():
-            if not is_int(self.e_train.get().strip()):
-                messagebox.showerror("Error", "Train ID must be an integer."); return
-            filters.append("train_id=%s"); params.append(int(self.e_train.get().strip()))
-        if self.cb_status.get():
-            filters.append("status=%s"); params.append(self.cb_status.get())
-        if self.e_from.get().strip():
-            filters.append("booking_date >= %s"); params.append(self.e_from.get().strip())
-        if self.e_to.get().strip():
-            filters.append("booking_date <= %s"); params.append(self.e_to.get().strip())
-
-        if filters:
-            query += " WHERE " + " AND ".join(filters)
-        query += " ORDER BY booking_date DESC"
-        
-        rows = db_execute(query, tuple(params), fetch='all')
-        if rows:
-            for r in rows:
-                values = (
-                    r[0], r[1], get_train_name_by_id(r[2]), get_station_name_by_id(r[3]),
-                    get_station_name_by_id(r[4]), r[5], r[6], r[7], str(r[8])
-                )
-                self.tree.insert("", "end", values=values)
+        filters = self.read_filters()
+        if filters is None: return
+        # Reloading supersedes the page fetch in flight, so rows of the older query are dropped
+        self.filters = filters
+        self.grid_view.reload()
+
+    def fetch_page(self, cursor, direction, limit):
+        with query_metrics.operation("report"):
+            return fetch_ticket_view(cursor=cursor, direction=direction, limit=limit, **self.filters)
+
+    def format_row(self, r):
+        return report_row(r)
 
-    def export_csv(self):
-        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")], initialfile="booking_report.csv")
+    def open_dashboard(self):
+        DashboardWindow(self.e_from.get().strip(), self.e_to.get().strip())
+
+    def export_report(self):
+        path = filedialog.asksaveasfilename(
+            defaultextension=".csv", initialfile="booking_report.csv", parent=self,
+            filetypes=[("CSV files", "*.csv"), ("JSON Lines", "*.jsonl"),
+                       ("Gzipped CSV", "*.csv.gz"), ("Gzipped JSON Lines", "*.jsonl.gz")])
         if not path: return
-        
-        try:
-            with open(path, "w", newline="", encoding="utf-8") as f:
-                writer = csv.writer(f)
-                writer.writerow(self.tree['columns']) # header
-                for iid in self.tree.get_children():
-                    writer.writerow(self.tree.item(iid)['values'])
-            messagebox.showinfo("Export Successful", f"Report saved to {path}")
-        except IOError as e:
-            messagebox.showerror("Export Failed", f"Could not save file: {e}")
+
+        # The export streams the whole filtered report, not just the pages loaded in the grid
+        filters = dict(self.filters)
+        cancel = threading.Event()
+        self.export_cancel = cancel
+        self.export_rows, self.export_total = 0, None
+
+        def write_report():
+            self.export_total = count_ticket_view(**filters)
+            def progress(rows):
+                self.export_rows = rows
+            return export_ticket_view(path, filters, progress, cancel)
+
+        def finish(rows):
+            messagebox.showinfo("Export Successful", f"{rows} rows saved to {path}", parent=self)
+        def failed(e):
+            if isinstance(e, ExportCancelled):
+                messagebox.showinfo("Export Cancelled", str(e), parent=self)
+            else:
+                messagebox.showerror("Export Failed", f"Could not save file: {e}", parent=self)
+        def complete():
+            self.export_cancel = None
+            self.export_button.state(["!disabled"])
+            self.cancel_button.state(["disabled"])
+            self.export_bar.configure(value=0)
+            self.export_label.configure(text="")
+
+        self.export_button.state(["disabled"])
+        self.cancel_button.state(["!disabled"])
+        task_executor.submit(self, write_report, on_success=finish, on_error=failed,
+                             on_complete=complete, key=(id(self), "export"))
+        self.poll_export()
+
+    def poll_export(self):
+        """Mirrors the worker's row counter into the progress bar while an export runs."""
+        if self.export_cancel is None:
+            return
+        total, rows = self.export_total, self.export_rows
+        if total:
+            self.export_bar.configure(maximum=total, value=min(rows, total))
+            self.export_label.configure(text=f"{rows} / {total} rows")
+        else:
+            self.export_label.configure(text=f"{rows} rows")
+        self.after(100, self.poll_export)
+
+    def cancel_export(self):
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            self.cancel_button.state(["disabled"])
+
+    def destroy(self):
+        # Closing the window stops a running export and leaves no partial file
+        if self.export_cancel is not None:
+            self.export_cancel.set()
+            self.export_cancel = None
+        super().destroy()
+
+# ---------------- DIAGNOSTICS ----------------
+class DiagnosticsWindow(BaseWindow):
+    """Admin view of query_metrics: operation latency, busiest query callers and the slow-query log."""
+    REFRESH_MS = 2000
+
+    def __init__(self):
+        super().__init__("Diagnostics", "1200x780")
+        self.refresh_job = None
+        self.create_widgets()
+        self.refresh()
+
+    def create_widgets(self):
+        controls = ttk.LabelFrame(self, text="Settings", padding=15)
+        controls.pack(fill="x", padx=10, pady=10)
+        create_styled_label(controls, "Slow query threshold (ms)").pack(side="left", padx=5)
+        self.sp_slow = ttk.Spinbox(controls, from_=1, to=60000, increment=50, width=8, command=self.set_threshold)
+        self.sp_slow.set(int(query_metrics.slow_ms))
+        self.sp_slow.bind("<Return>", lambda e: self.set_threshold())
+        self.sp_slow.pack(side="left", padx=5)
+        create_styled_button(controls, "Export Metrics...", self.export_metrics).pack(side="right", padx=5)
+        create_styled_button(controls, "Reset", self.reset).pack(side="right", padx=5)
+
+        self.summary_label = create_styled_label(self, "")
+        self.summary_label.pack(fill="x", padx=10)
+        self.ops_tree = self.create_table("Operations", ("Operation", "Count", "Errors", "Mean ms", "p50 ms", "p95 ms",
+                                                        "p99 ms", "Max ms"), len(OPERATIONS) + 1)
+        self.callers_tree = self.create_table("Queries by Caller", ("Caller", "Queries", "Total ms", "Mean ms", "Max ms",
+                                                                    "Rows"), 7)
+        self.slow_tree = self.create_table("Slow Queries", ("Time", "ms", "Acquire ms", "Rows", "Caller", "SQL"), 7)
+        self.callers_tree.column("Caller", width=320)
+        self.slow_tree.column("Caller", width=220)
+        self.slow_tree.column("SQL", width=520)
+
+    def refresh(self):
+        """Redraws from a metrics snapshot (in memory, so it stays on the Tk thread) every REFRESH_MS."""
+        snap = query_metrics.snapshot()
+        q, a = snap["queries"], snap["acquire"]
+        text = (f"Since {datetime.datetime.fromtimestamp(snap['since']):%H:%M:%S}: {q['count']} queries "
+                f"({q['errors']} failed), p50 {q['p50_ms']:.2f} ms, p95 {q['p95_ms']:.2f} ms; "
+                f"connection wait p95 {a['p95_ms']:.2f} ms; {snap['slow_count']} slow")
+        pool = _db_pool
+        if pool is not None:
+            stats = pool.get_stats()
+            text += (f"; pool {stats['open']}/{pool.size} open, {stats['idle']} idle, "
+                     f"{stats['waits']} waits, {stats['exhausted']} exhausted")
+        router = _replica_router
+        if router is not None and router.replicas:
+            stats = router.get_stats()
+            replicas = ", ".join(f"{r['name']} {'up' if r['up'] else 'down'}"
+                                 + (f" {r['lag']:.1f}s behind" if r["lag"] is not None else "") + f" {r['reads']} reads"
+                                 for r in stats["replicas"])
+            text += (f"\nreplicas: {replicas}; {stats['primary']} reads on the primary ("
+                     + ", ".join(f"{reason.replace('_', ' ')} {stats[reason]}" for reason in FALLBACK_REASONS) + ")")
+        self.summary_label.config(text=text)
+
+        self.fill(self.ops_tree, [(name, s["count"], s["errors"], f"{s['mean_ms']:.2f}", f"{s['p50_ms']:.2f}",
+                                   f"{s['p95_ms']:.2f}", f"{s['p99_ms']:.2f}", f"{s['max_ms']:.2f}")
+                                  for name, s in snap["operations"].items()])
+        self.fill(self.callers_tree, [(c["caller"], c["queries"], f"{c['total_ms']:.1f}", f"{c['mean_ms']:.2f}",
+                                       f"{c['max_ms']:.2f}", c["rows"]) for c in snap["callers"]])
+        self.fill(self.slow_tree, [(f"{e['time']:%H:%M:%S}", f"{e['ms']:.1f}", f"{e['acquire_ms']:.1f}", e["rows"],
+                                    e["caller"], e["sql"]) for e in snap["slow_queries"]])
+        self.refresh_job = self.after(self.REFRESH_MS, self.refresh)
+
+    def set_threshold(self):
+        value = self.sp_slow.get().strip()
+        if not is_int(value) or int(value) <= 0:
+            messagebox.showerror("Error", "Threshold must be a positive number of milliseconds.", parent=self); return
+        query_metrics.slow_ms = int(value)
+
+    def reset(self):
+        query_metrics.reset()
+
+    def export_metrics(self):
+        path = filedialog.asksaveasfilename(
+            defaultextension=".prom", initialfile="railway.prom", parent=self,
+            filetypes=[("Prometheus text", "*.prom"), ("Text", "*.txt"), ("All files", "*.*")])
+        if not path:
+            return
+        self.run_task(query_metrics.export_prometheus, path, error_title="Export Failed",
+                      on_success=lambda p: messagebox.showinfo("Metrics Exported", f"Metrics written to {p}", parent=self))
+
+    def destroy(self):
+        if self.refresh_job is not None:
+            self.after_cancel(self.refresh_job)
+            self.refresh_job = None
+        super().destroy()
+
+# ---------------- DASHBOARD ----------------
+class DashboardWindow(BaseWindow):
+    """Management view of the booking rollups: occupancy, revenue by route and day, cancellation rates."""
+
+    def __init__(self, date_from="", date_to=""):
+        super().__init__("Booking Dashboard", "1200x780")
+        self.create_widgets(date_from, date_to)
+        self.load_data()
+
+    def create_widgets(self, date_from, date_to):
+        filter_frame = ttk.LabelFrame(self, text="Booking and Journey Dates", padding=15)
+        filter_frame.pack(fill="x", padx=10, pady=10)
+
+        create_styled_label(filter_frame, "From (YYYY-MM-DD)").grid(row=0, column=0, padx=5, pady=5)
+        self.e_from = create_styled_entry(filter_frame)
+        self.e_from.insert(0, date_from or "")
+        self.e_from.grid(row=0, column=1, padx=5, pady=5)
+
+        create_styled_label(filter_frame, "To (YYYY-MM-DD)").grid(row=0, column=2, padx=5, pady=5)
+        self.e_to = create_styled_entry(filter_frame)
+        self.e_to.insert(0, date_to or "")
+        self.e_to.grid(row=0, column=3, padx=5, pady=5)
+
+        btn_frame = ttk.Frame(filter_frame)
+        btn_frame.grid(row=0, column=4, padx=20)
+        create_styled_button(btn_frame, "Apply Filter", self.load_data).pack(side="left", padx=5)
+        create_styled_button(btn_frame, "Rebuild Rollups", self.rebuild).pack(side="left", padx=5)
+
+        self.summary_label = create_styled_label(self, "")
+        self.summary_label.pack(fill="x", padx=10)
+        self.occupancy_tree = self.create_table("Occupancy by Journey and Class",
+                                                ("Journey Date", "Train ID", "Train", "Class", "Confirmed",
+                                                 "Waitlisted", "Seats", "Occupancy %"), 8)
+        self.routes_tree = self.create_table("Revenue by Route and Day",
+                                             ("Date", "From", "To", "Booked", "Cancelled", "Revenue"), 8)
+        self.cancel_tree = self.create_table("Cancellation Rates by Train",
+                                             ("Train ID", "Train", "Booked", "Cancelled", "Cancellation %",
+                                              "Revenue"), 6)
+        self.occupancy_tree.column("Train", width=260)
+        self.cancel_tree.column("Train", width=260)
+        self.routes_tree.column("From", width=220)
+        self.routes_tree.column("To", width=220)
+
+    def load_data(self):
+        date_from, date_to = self.e_from.get().strip(), self.e_to.get().strip()
+        started = time.perf_counter()
+
+        def show(dashboard):
+            t = dashboard["totals"]
+            self.summary_label.config(text=(
+                f"{t['booked']} booked, {t['cancelled']} cancelled ({t['cancellation_rate']:.1f}%), "
+                f"revenue {t['revenue']:.2f}  -  {(time.perf_counter() - started) * 1000:.0f} ms"))
+            self.fill(self.occupancy_tree, [(o["journey_date"], o["train_id"], o["train_name"], o["class_type"],
+                                             o["confirmed"], o["waitlisted"], o["seats"], f"{o['occupancy']:.1f}")
+                                            for o in dashboard["occupancy"]])
+            self.fill(self.routes_tree, [(r["date"], r["from_station"], r["to_station"], r["booked"], r["cancelled"],
+                                          f"{r['revenue']:.2f}") for r in dashboard["routes"]])
+            self.fill(self.cancel_tree, [(c["train_id"], c["train_name"], c["booked"], c["cancelled"],
+                                          f"{c['cancellation_rate']:.1f}", f"{c['revenue']:.2f}")
+                                         for c in dashboard["cancellations"]])
+
+        self.run_task(booking_dashboard, date_from, date_to, on_success=show, key="dashboard")
+
+    def rebuild(self):
+        if not messagebox.askyesno("Rebuild Rollups", "Recompute the dashboard figures from every ticket?", parent=self):
+            return
+        def done(ok):
+            if ok:
+                self.load_data()
+            else:
+                messagebox.showerror("Error", "Could not rebuild the rollups.", parent=self)
+        self.run_task(rebuild_rollups, on_success=done, key="rebuild")
 
 # ---------------- START APP ----------------
 if __name__ == "__main__":
-    # Check DB connection on startup
-    if get_db_connection():
-        app = RailwayApp()
-    else:
-        print("Application cannot start without a database connection.")
+    # The login window opens at once; the database is checked in the background (see RailwayApp)
+    app = RailwayApp()
+    task_executor.shutdown()
+    get_db_pool().close_all()
+    get_replica_router().close_all()
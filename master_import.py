@@ -0,0 +1,46 @@
+"""
+Command-line bulk import of stations, trains, schedules and fares.
+
+Run from the project root (uses DB_CONFIG from main_app):
+    python master_import.py stations.csv trains.csv schedules.csv fares.csv [--dry-run]
+    python master_import.py timetable.json --chunk-size 5000
+
+Files may be given in any order; sections are always written stations,
+trains, schedules, fares, in one transaction. See main_app's MASTER DATA
+IMPORT section for the accepted columns.
+"""
+import argparse
+import sys
+
+import main_app
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import of railway master data")
+    parser.add_argument("files", nargs="+", help="CSV or JSON files")
+    parser.add_argument("--kind", choices=main_app.IMPORT_KINDS,
+                        help="contents of every CSV file (default: taken from the file name)")
+    parser.add_argument("--dry-run", action="store_true", help="validate only, write nothing")
+    parser.add_argument("--chunk-size", type=int, default=main_app.IMPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    data = {}
+    try:
+        for path in args.files:
+            for section, rows in main_app.read_import_file(path, args.kind).items():
+                data.setdefault(section, []).extend(rows)
+    except (OSError, ValueError) as err:
+        print(f"Cannot read import files: {err}")
+        return 1
+
+    try:
+        report = main_app.import_master_data(data, dry_run=args.dry_run, chunk_size=args.chunk_size)
+    except main_app.DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        return 1
+    finally:
+        main_app.get_db_pool().close_all()
+    print(main_app.format_import_report(report))
+    return 1 if report["error_count"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
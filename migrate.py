@@ -0,0 +1,71 @@
+"""
+Command-line schema migration runner (see main_app's SCHEMA MIGRATIONS).
+
+Run from the project root (uses DB_CONFIG from main_app, or the embedded
+database with RAILWAY_DB_BACKEND=sqlite):
+    python migrate.py              apply every pending migration
+    python migrate.py --to 1       migrate up or down to version 1 (0 = railway_system.sql as shipped)
+    python migrate.py --status     list migrations and when they were applied
+    python migrate.py --check      EXPLAIN the app's hot queries and show the index each one uses
+    python migrate.py --prune [2024-01-31]  drop the seat claims of journeys before that date (default today)
+"""
+import argparse
+import datetime
+import sys
+
+import main_app
+
+def print_status(conn):
+    applied = main_app.applied_migrations(conn)
+    for migration in main_app.SCHEMA_MIGRATIONS:
+        when = applied.get(migration["version"])
+        print(f"  {migration['version']:>3}  {'applied ' + str(when) if when else 'pending':<28} {migration['name']}")
+
+def print_plans():
+    sample = main_app.query_plan_sample()
+    if sample is None:
+        print("Query plans need at least one ticket and one fare in the database.")
+        return False
+    results = main_app.check_query_plans(sample)
+    for r in results:
+        print(f"  {'ok ' if r['ok'] else 'MISS'} {r['name']:<17} expects {r['expected']:<28} "
+              f"uses {', '.join(r['indexes']) or 'no index'}")
+        for line in r["plan"]:
+            print(f"         {line}")
+    return all(r["ok"] for r in results)
+
+def main():
+    parser = argparse.ArgumentParser(description="Railway schema migrations")
+    parser.add_argument("--to", type=int, default=main_app.SCHEMA_VERSION, help="target schema version")
+    parser.add_argument("--status", action="store_true", help="show applied and pending migrations only")
+    parser.add_argument("--check", action="store_true", help="show the query plans of the hot queries only")
+    parser.add_argument("--prune", nargs="?", const=datetime.date.today(), metavar="DATE",
+                        type=datetime.date.fromisoformat, help="drop seat claims of journeys before DATE only")
+    args = parser.parse_args()
+
+    pool = main_app.get_db_pool()
+    try:
+        if args.check:
+            return 0 if print_plans() else 1
+        if args.prune:
+            if not main_app.prune_seat_claims(args.prune):
+                return 1
+            print(f"Seat claims of journeys before {args.prune} removed")
+            return 0
+        with pool.connection() as conn:
+            if not args.status:
+                changed = main_app.migrate_schema(conn, args.to, progress=print)
+                print(f"Schema at version {args.to}" + ("" if changed else " (nothing to do)"))
+            print_status(conn)
+    except main_app.MigrationError as err:
+        print(err)
+        return 1
+    except main_app.DB_ERRORS as err:
+        print(f"Database Error: {err}")
+        return 1
+    finally:
+        pool.close_all()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+"""
+Shared fixtures: every test runs main_app on its own embedded SQLite
+database, copied from one built from railway_system.sql and migrated to
+SCHEMA_VERSION. No MySQL server is needed.
+
+Run from the project root:
+    python -m pytest tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+os.environ["RAILWAY_DB_BACKEND"] = "sqlite"
+os.environ["RAILWAY_SQLITE_PATH"] = os.path.join(tempfile.gettempdir(), "railway_tests_unused.db")
+os.environ.pop("RAILWAY_DB_REPLICAS", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main_app  # noqa: E402
+
+@pytest.fixture(scope="session")
+def migrated_db(tmp_path_factory):
+    """Path of a database at SCHEMA_VERSION, built once per test session."""
+    path = str(tmp_path_factory.mktemp("template") / "railway_system.db")
+    main_app.SQLiteBackend(path, wal=False).close()  # Loads the dump and applies every migration
+    return path
+
+@pytest.fixture
+def db(migrated_db, tmp_path, monkeypatch):
+    """Points main_app's pool, router and caches at a fresh copy of migrated_db."""
+    path = str(tmp_path / "railway_system.db")
+    shutil.copy(migrated_db, path)
+    monkeypatch.setattr(main_app, "DB_BACKEND", "sqlite")
+    monkeypatch.setattr(main_app, "SQLITE_PATH", path)
+    monkeypatch.setattr(main_app, "DB_REPLICAS", [])
+    monkeypatch.setattr(main_app, "_db_backend", None)
+    monkeypatch.setattr(main_app, "_db_pool", None)
+    monkeypatch.setattr(main_app, "_replica_router", None)
+    monkeypatch.setattr(main_app, "seat_inventory", main_app.SeatInventory())
+    main_app.reference_cache.invalidate()
+    main_app.journey_planner.invalidate()
+    yield path
+    if main_app._replica_router is not None:
+        main_app._replica_router.close_all()
+    if main_app._db_pool is not None:
+        main_app._db_pool.close_all()
+    main_app.reference_cache.invalidate()
+    main_app.journey_planner.invalidate()
+
+@pytest.fixture
+def small_train(db):
+    """A train with 2 Sleeper, 1 AC and 1 General seat, and (user_id, from, to) to book it with."""
+    with main_app.db_transaction() as cursor:
+        cursor.execute("INSERT INTO trains (train_name, train_type, total_seats) VALUES (%s, %s, %s)",
+                       ("Test Train", "Test", 4))
+        train_id = cursor.lastrowid
+    main_app.reference_cache.invalidate(stations=False)
+    passenger = main_app.db_execute("SELECT user_id FROM users ORDER BY user_id LIMIT 1", fetch='one')[0]
+    stations = [r[0] for r in main_app.db_execute("SELECT station_id FROM stations ORDER BY station_id LIMIT 2",
+                                                  fetch='all')]
+    return train_id, passenger, stations[0], stations[1]
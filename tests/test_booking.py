@@ -0,0 +1,80 @@
+"""Seat booking across stale seat inventories, and waitlist promotion on cancellation."""
+import datetime
+
+import main_app
+from main_app import SeatInventory, book_group, book_seat, cancel_reservation, db_execute, lookup_ticket
+
+def watch_invalidations(inventory, monkeypatch):
+    """Counts the partition reloads of 'inventory' (one per seat conflict it ran into)."""
+    calls = []
+    invalidate = inventory.invalidate
+    monkeypatch.setattr(inventory, "invalidate", lambda *args: calls.append(args) or invalidate(*args))
+    return calls
+
+def claimed_seats(train_id):
+    rows = db_execute("SELECT seat_number FROM seat_claims WHERE train_id=%s", (train_id,), fetch='all')
+    return sorted(r[0] for r in rows)
+
+def test_conflicting_inventory_resyncs_and_books_another_seat(small_train, monkeypatch):
+    train_id, passenger, from_id, to_id = small_train
+    today = datetime.date.today()
+    first, second = SeatInventory(), SeatInventory()
+    # Two processes load the empty partition before either of them books
+    assert first.available(train_id, today, "Sleeper") == second.available(train_id, today, "Sleeper") == 2
+    conflicts = watch_invalidations(second, monkeypatch)
+
+    one = book_seat(train_id, passenger, from_id, to_id, "Sleeper", "First", 30, "Male", inventory=first)
+    two = book_seat(train_id, passenger, from_id, to_id, "Sleeper", "Second", 31, "Female", inventory=second)
+
+    assert one and two and one[1] != two[1]
+    assert conflicts == [(train_id, today)]
+    assert claimed_seats(train_id) == sorted([one[1], two[1]])
+    assert book_seat(train_id, passenger, from_id, to_id, "Sleeper", "Third", 32, "Male", inventory=first) is None
+
+def test_conflicting_inventory_waitlists_once_the_class_is_full(small_train, monkeypatch):
+    train_id, passenger, from_id, to_id = small_train
+    today = datetime.date.today()
+    first, second = SeatInventory(), SeatInventory()
+    assert second.available(train_id, today, "Sleeper") == 2
+    booked = [book_seat(train_id, passenger, from_id, to_id, "Sleeper", f"First {i}", 30, "Male", inventory=first)
+              for i in range(2)]
+    conflicts = watch_invalidations(second, monkeypatch)
+
+    # 'second' still shows both seats free; the seat claims turn it away to the waitlist
+    late = book_seat(train_id, passenger, from_id, to_id, "Sleeper", "Late", 40, "Other", inventory=second,
+                     waitlist=True)
+
+    assert all(booked) and late and late[1] is None
+    assert conflicts
+    assert claimed_seats(train_id) == sorted(b[1] for b in booked)
+    assert lookup_ticket(late[0])['status'] == 'Waitlisted'
+
+def test_conflicting_group_booking_is_all_or_nothing(small_train):
+    train_id, passenger, from_id, to_id = small_train
+    first, second = SeatInventory(), SeatInventory()
+    assert second.available(train_id, datetime.date.today(), "Sleeper") == 2
+    single = book_seat(train_id, passenger, from_id, to_id, "Sleeper", "Single", 30, "Male", inventory=first)
+
+    group = book_group(train_id, passenger, from_id, to_id, "Sleeper", [("A", 20, "Male"), ("B", 21, "Female")],
+                       inventory=second)
+
+    assert single and group is None
+    assert claimed_seats(train_id) == [single[1]]
+    assert db_execute("SELECT COUNT(*) FROM tickets WHERE train_id=%s", (train_id,), fetch='one')[0] == 1
+
+def test_cancellation_promotes_the_head_of_the_waitlist(small_train):
+    train_id, passenger, from_id, to_id = small_train
+    book = lambda name: book_seat(train_id, passenger, from_id, to_id, "Sleeper", name, 30, "Other", waitlist=True)
+    confirmed = [book(f"Confirmed {i}") for i in range(2)]
+    queued = [book(f"Queued {i}") for i in range(2)]
+    assert all(b[1] for b in confirmed) and all(b[1] is None for b in queued)
+
+    cancelled = cancel_reservation(confirmed[0][0])
+
+    assert cancelled['status'] == 'Cancelled'
+    head, behind = lookup_ticket(queued[0][0]), lookup_ticket(queued[1][0])
+    assert head['status'] == 'Confirmed' and head['seat_number'] == confirmed[0][1]
+    assert head['promoted_at'] is not None
+    assert behind['status'] == 'Waitlisted' and behind['seat_number'] is None
+    assert claimed_seats(train_id) == sorted([confirmed[1][1], head['seat_number']])
+    assert main_app.seat_inventory.available(train_id, datetime.date.today(), "Sleeper") == 0
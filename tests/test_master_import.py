@@ -0,0 +1,71 @@
+"""Master data import: dry runs, committed imports and rejected ones."""
+import pytest
+
+import main_app
+from main_app import db_execute, get_fare, import_master_data
+
+def master_counts():
+    return {table: db_execute(f"SELECT COUNT(*) FROM {table}", fetch='one')[0]
+            for table in ("stations", "trains", "train_schedule", "fare_master", "train_od_index")}
+
+@pytest.fixture
+def data(db):
+    """Two new stations joined by a new train, and a new fare for an existing route and class."""
+    from_id, to_id, class_type, amount = db_execute(
+        "SELECT from_station, to_station, class_type, fare_amount FROM fare_master ORDER BY fare_id LIMIT 1", fetch='one')
+    return {
+        "stations": [
+            {"station_name": "Test Junction", "station_code": "TSTJ", "city": "Testpur", "state": "Test"},
+            {"station_name": "Test Terminus", "station_code": "TSTT", "city": "Testpur", "state": "Test"},
+        ],
+        "trains": [{"train_id": 9001, "train_name": "Test Express", "train_type": "Express", "total_seats": 40}],
+        "schedules": [
+            {"train_id": 9001, "station_code": "TSTJ", "sequence": 1, "arrival_time": None, "departure_time": "06:00"},
+            {"train_id": 9001, "station_code": "TSTT", "sequence": 2, "arrival_time": "09:30", "departure_time": None},
+        ],
+        "fares": [
+            {"from_code": "TSTJ", "to_code": "TSTT", "class_type": "Sleeper", "fare_amount": "215"},
+            {"from_station": from_id, "to_station": to_id, "class_type": class_type, "fare_amount": float(amount) + 10},
+        ],
+    }
+
+def test_dry_run_validates_without_writing(data):
+    before = master_counts()
+
+    report = import_master_data(data, dry_run=True)
+
+    assert report["dry_run"] and report["error_count"] == 0
+    assert report["counts"] == {"stations": 2, "trains": 1, "schedules": 2, "fares": 2}
+    assert report["inserted"] == {"stations": 2, "trains": 1, "schedules": 2, "fares": 1}
+    assert report["updated"] == {"stations": 0, "trains": 0, "schedules": 0, "fares": 1}
+    assert master_counts() == before
+    assert db_execute("SELECT 1 FROM stations WHERE station_code='TSTJ'", fetch='one') is None
+
+def test_commit_writes_every_section(data):
+    before = master_counts()
+    updated = data["fares"][1]
+
+    report = import_master_data(data)
+
+    assert not report["dry_run"] and report["error_count"] == 0
+    after = master_counts()
+    assert after["stations"] == before["stations"] + 2
+    assert after["trains"] == before["trains"] + 1
+    assert after["train_schedule"] == before["train_schedule"] + 2
+    assert after["fare_master"] == before["fare_master"] + 1
+    assert after["train_od_index"] == before["train_od_index"] + 1
+    junction, terminus = (db_execute("SELECT station_id FROM stations WHERE station_code=%s", (code,), fetch='one')[0]
+                          for code in ("TSTJ", "TSTT"))
+    assert get_fare(junction, terminus, "Sleeper") == 215.0
+    assert get_fare(updated["from_station"], updated["to_station"], updated["class_type"]) == updated["fare_amount"]
+    assert [t["train_id"] for t in main_app.find_trains(junction, terminus)["trains"]] == [9001]
+
+def test_invalid_row_rejects_the_whole_import(data):
+    data["schedules"][1]["station_code"] = "NOPE"
+    before = master_counts()
+
+    report = import_master_data(data)
+
+    assert report["error_count"] == 1
+    assert report["errors"] == ["schedules row 2: station code 'NOPE' does not exist"]
+    assert master_counts() == before
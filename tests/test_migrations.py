@@ -0,0 +1,81 @@
+"""Schema migrations, stepped up and down from railway_system.sql as shipped (version 0)."""
+import sqlite3
+
+import pytest
+
+import main_app
+from main_app import SCHEMA_MIGRATIONS, SCHEMA_VERSION, MigrationError, applied_migrations, migrate_schema
+
+@pytest.fixture
+def dump(tmp_path):
+    """A connection to a new database holding railway_system.sql and nothing else."""
+    main_app._register_sqlite_types()
+    raw = sqlite3.connect(str(tmp_path / "dump.db"), isolation_level=None, detect_types=sqlite3.PARSE_DECLTYPES)
+    with open(main_app.SCHEMA_PATH, encoding="utf-8") as f:
+        statements = main_app.mysql_dump_to_sqlite(f.read())
+    for statement in statements:
+        raw.execute(statement)
+    raw.execute("PRAGMA foreign_keys=ON")
+    conn = main_app.SQLiteConnection(raw)
+    yield conn
+    conn.close()
+
+def schema(conn):
+    """{table: (columns, indexes)} of every table but schema_migrations, for comparing versions."""
+    raw = conn._conn
+    tables = [r[0] for r in raw.execute("""SELECT name FROM sqlite_master WHERE type='table'
+                                           AND name NOT LIKE 'sqlite_%' AND name != 'schema_migrations'""")]
+    shape = {}
+    for table in sorted(tables):
+        columns = [tuple(c[1:]) for c in raw.execute(f"PRAGMA table_info({table})")]
+        indexes = sorted((i[1], i[2], tuple(c[2] for c in raw.execute(f"PRAGMA index_info('{i[1]}')")))
+                         for i in raw.execute(f"PRAGMA index_list({table})"))
+        shape[table] = (columns, indexes)
+    return shape
+
+def count(conn, query):
+    return conn._conn.execute(query).fetchone()[0]
+
+def test_every_migration_reverts_to_the_schema_before_it(dump):
+    shapes = {0: schema(dump)}
+    tickets = count(dump, "SELECT COUNT(*) FROM tickets")
+    for migration in SCHEMA_MIGRATIONS:
+        version = migration["version"]
+        assert migrate_schema(dump, version) == [version]
+        shapes[version] = schema(dump)
+        assert shapes[version] != shapes[version - 1], f"migration {version} changed nothing"
+        assert migrate_schema(dump, version - 1) == [version]
+        assert schema(dump) == shapes[version - 1], f"migration {version} did not revert cleanly"
+        assert migrate_schema(dump, version) == [version]
+        assert schema(dump) == shapes[version]
+
+    assert sorted(applied_migrations(dump)) == list(range(1, SCHEMA_VERSION + 1))
+    assert migrate_schema(dump, 0) == list(range(SCHEMA_VERSION, 0, -1))
+    assert schema(dump) == shapes[0] and not applied_migrations(dump)
+    assert migrate_schema(dump) == list(range(1, SCHEMA_VERSION + 1))
+    assert schema(dump) == shapes[SCHEMA_VERSION]
+    assert count(dump, "SELECT COUNT(*) FROM tickets") == tickets
+
+def test_migrations_backfill_the_shipped_bookings(dump):
+    migrate_schema(dump)
+    assert count(dump, "SELECT COUNT(*) FROM seat_claims") == count(
+        dump, "SELECT COUNT(*) FROM tickets WHERE status='Confirmed' AND seat_number IS NOT NULL")
+    assert count(dump, "SELECT COUNT(*) FROM train_od_index") == count(
+        dump, """SELECT COUNT(*) FROM train_schedule a JOIN train_schedule b
+                 ON b.train_id=a.train_id AND b.sequence > a.sequence""")
+    assert count(dump, "SELECT COUNT(*) FROM tickets WHERE passenger_seq <> 1") == 0
+
+def test_revert_refuses_to_merge_group_bookings(dump):
+    migrate_schema(dump)
+    dump._conn.execute("""INSERT INTO tickets (pnr, passenger_seq, train_id, passenger_id, from_station, to_station,
+                              seat_number, class_type, booking_date, journey_date, status, passenger_name)
+                          SELECT pnr, 2, train_id, passenger_id, from_station, to_station, NULL, class_type,
+                                 booking_date, journey_date, 'Waitlisted', 'Second Passenger'
+                          FROM tickets ORDER BY ticket_id LIMIT 1""")
+    migrated = schema(dump)
+
+    with pytest.raises(MigrationError):
+        migrate_schema(dump, SCHEMA_VERSION - 1)
+
+    assert SCHEMA_VERSION in applied_migrations(dump)
+    assert schema(dump) == migrated